@@ -2,14 +2,91 @@
 # @Author  : relakkes@gmail.com
 # @Time    : 2024/4/6 14:21
 # @Desc    : 异步Aiomysql的增删改查封装
-from typing import Any, Dict, List, Union
+import asyncio
+import os
+import tempfile
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
 import aiomysql
+from pymysql.converters import escape_item
+
+# 单条语句允许的最大字节数按 max_allowed_packet 的 90% 计算，给协议包头和语句本身留出余量
+PACKET_SAFETY_RATIO = 0.9
+
+# LOAD DATA 每个临时文件写入的最大行数
+LOAD_DATA_CHUNK_ROWS = 50000
+
+
+def build_insert_sql(table_name: str, fields: Sequence[str]) -> str:
+    """
+    生成单行的参数化 INSERT 语句，executemany 会把它改写成多行 VALUES
+    :param table_name: 表名
+    :param fields: 字段列表
+    :return:
+    """
+    fieldstr = ','.join([f'`{field}`' for field in fields])
+    valstr = ','.join(['%s'] * len(fields))
+    return "INSERT INTO `%s` (%s) VALUES (%s)" % (table_name, fieldstr, valstr)
+
+
+def build_upsert_sql(table_name: str, fields: Sequence[str], update_fields: Sequence[str]) -> str:
+    """
+    生成 INSERT ... ON DUPLICATE KEY UPDATE 语句，依赖表上的唯一索引判断是否冲突
+    :param table_name: 表名
+    :param fields: 写入的字段列表
+    :param update_fields: 冲突时需要更新的字段列表
+    :return:
+    """
+    updatestr = ','.join([f'`{field}`=VALUES(`{field}`)' for field in update_fields])
+    return "%s ON DUPLICATE KEY UPDATE %s" % (build_insert_sql(table_name, fields), updatestr)
+
+
+def items_to_rows(items: List[Dict[str, Any]], fields: Optional[Sequence[str]] = None
+                  ) -> Tuple[List[str], List[Tuple[Any, ...]]]:
+    """
+    把字典列表转换成按字段顺序排列的元组列表，缺失的字段写入 NULL
+    :param items: 记录列表
+    :param fields: 字段列表，默认取第一条记录的 key
+    :return:
+    """
+    fields = list(fields or items[0].keys())
+    return fields, [tuple(item.get(field) for field in fields) for item in items]
+
+
+def chunk_rows(rows: List[Tuple[Any, ...]], max_bytes: int, charset: str = "utf8mb4"
+               ) -> Iterator[List[Tuple[Any, ...]]]:
+    """
+    按转义之后的长度切分数据，保证每批拼出来的多行 VALUES 不超过 max_bytes
+    :param rows: 数据行
+    :param max_bytes: 每批数据允许的最大字节数
+    :param charset: 连接使用的字符集
+    :return:
+    """
+    chunk: List[Tuple[Any, ...]] = []
+    chunk_bytes = 0
+    for row in rows:
+        # "(v1,v2,...)," 的长度
+        row_bytes = sum(len(escape_item(value, charset).encode("utf-8")) + 1 for value in row) + 2
+        if chunk and chunk_bytes + row_bytes > max_bytes:
+            yield chunk
+            chunk, chunk_bytes = [], 0
+        chunk.append(row)
+        chunk_bytes += row_bytes
+    if chunk:
+        yield chunk
+
+
+def _escape_load_data_value(value: Any) -> str:
+    if value is None:
+        return "\\N"
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
 
 
 class AsyncMysqlDB:
     def __init__(self, pool: aiomysql.Pool) -> None:
         self.__pool = pool
+        self.__max_allowed_packet: Optional[int] = None
 
     async def query(self, sql: str, *args: Union[str, int]) -> List[Dict[str, Any]]:
         """
@@ -73,10 +150,11 @@ class AsyncMysqlDB:
             upsets.append(s)
             values.append(v)
         upsets = ','.join(upsets)
-        sql = 'UPDATE %s SET %s WHERE %s="%s"' % (
+        values.append(value_where)
+        sql = 'UPDATE %s SET %s WHERE `%s`=%%s' % (
             table_name,
             upsets,
-            field_where, value_where,
+            field_where,
         )
         async with self.__pool.acquire() as conn:
             async with conn.cursor() as cur:
@@ -94,3 +172,95 @@ class AsyncMysqlDB:
             async with conn.cursor() as cur:
                 rows = await cur.execute(sql, args)
                 return rows
+
+    async def get_max_allowed_packet(self) -> int:
+        """
+        查询服务端的 max_allowed_packet，只查询一次
+        :return:
+        """
+        if self.__max_allowed_packet is None:
+            row = await self.get_first("SELECT @@max_allowed_packet AS max_allowed_packet")
+            self.__max_allowed_packet = int(row["max_allowed_packet"])
+        return self.__max_allowed_packet
+
+    async def _executemany_chunked(self, sql: str, rows: List[Tuple[Any, ...]]) -> int:
+        max_bytes = int(await self.get_max_allowed_packet() * PACKET_SAFETY_RATIO) - len(sql)
+        affected_rows = 0
+        async with self.__pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                # aiomysql 默认按 1MB 切分多行语句，这里放宽到和 max_allowed_packet 一致
+                cur.max_stmt_length = max_bytes
+                for chunk in chunk_rows(rows, max_bytes, conn.charset or "utf8mb4"):
+                    affected_rows += await cur.executemany(sql, chunk) or 0
+                    await conn.commit()
+        return affected_rows
+
+    async def items_to_table(self, table_name: str, items: List[Dict[str, Any]]) -> int:
+        """
+        表中批量插入数据，按 max_allowed_packet 切分成多条多行 INSERT 语句
+        :param table_name: 表名
+        :param items: 记录列表，字段以第一条记录为准
+        :return: 影响的行数
+        """
+        if not items:
+            return 0
+        fields, rows = items_to_rows(items)
+        return await self._executemany_chunked(build_insert_sql(table_name, fields), rows)
+
+    async def upsert_many(self, table_name: str, items: List[Dict[str, Any]],
+                          update_fields: Optional[Sequence[str]] = None) -> int:
+        """
+        批量写入数据，唯一索引冲突时更新已有的记录(INSERT ... ON DUPLICATE KEY UPDATE)
+        :param table_name: 表名
+        :param items: 记录列表，字段以第一条记录为准
+        :param update_fields: 冲突时需要更新的字段，默认为除 add_ts 以外的所有字段
+        :return: 影响的行数(MySQL 中新插入计 1 行，更新计 2 行)
+        """
+        if not items:
+            return 0
+        fields, rows = items_to_rows(items)
+        if update_fields is None:
+            update_fields = [field for field in fields if field != "add_ts"]
+        return await self._executemany_chunked(build_upsert_sql(table_name, fields, update_fields), rows)
+
+    async def load_data_to_table(self, table_name: str, items: List[Dict[str, Any]], replace: bool = False,
+                                 chunk_rows_num: int = LOAD_DATA_CHUNK_ROWS) -> int:
+        """
+        用 LOAD DATA LOCAL INFILE 导入数据，适合历史数据回填这类大批量写入的场景，
+        需要服务端开启 local_infile 并且连接池创建时传入 local_infile=True
+        :param table_name: 表名
+        :param items: 记录列表，字段以第一条记录为准
+        :param replace: 唯一索引冲突时是否覆盖旧记录，默认忽略新记录
+        :param chunk_rows_num: 每个临时文件的最大行数
+        :return: 影响的行数
+        """
+        if not items:
+            return 0
+        fields, rows = items_to_rows(items)
+        fieldstr = ','.join([f'`{field}`' for field in fields])
+        affected_rows = 0
+        loop = asyncio.get_running_loop()
+        async with self.__pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                for start in range(0, len(rows), chunk_rows_num):
+                    file_path = await loop.run_in_executor(
+                        None, self._write_load_data_file, rows[start:start + chunk_rows_num]
+                    )
+                    try:
+                        sql = (
+                            "LOAD DATA LOCAL INFILE %%s %s INTO TABLE `%s` CHARACTER SET utf8mb4 "
+                            "FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' (%s)"
+                        ) % ("REPLACE" if replace else "IGNORE", table_name, fieldstr)
+                        affected_rows += await cur.execute(sql, (file_path,))
+                        await conn.commit()
+                    finally:
+                        os.remove(file_path)
+        return affected_rows
+
+    @staticmethod
+    def _write_load_data_file(rows: List[Tuple[Any, ...]]) -> str:
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", newline="", suffix=".tsv", delete=False) as f:
+            for row in rows:
+                f.write("\t".join(_escape_load_data_value(value) for value in row))
+                f.write("\n")
+        return f.name
@@ -1,7 +1,8 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional
 
-from playwright.async_api import BrowserContext, BrowserType
+if TYPE_CHECKING:
+    from playwright.async_api import BrowserContext, BrowserType
 
 
 class AbstractCrawler(ABC):
@@ -21,11 +22,11 @@ class AbstractCrawler(ABC):
     @abstractmethod
     async def launch_browser(
         self,
-        chromium: BrowserType,
+        chromium: "BrowserType",
         playwright_proxy: Optional[Dict],
         user_agent: Optional[str],
         headless: bool = True,
-    ) -> BrowserContext:
+    ) -> "BrowserContext":
         pass
 
 
@@ -52,6 +53,32 @@ class AbstractStore(ABC):
     async def store_content(self, content_item: Dict):
         pass
 
+    async def store_many(self, content_items: List[Dict]):
+        """
+        store a batch of content items, implementations should override it with a bulk path
+        """
+        for content_item in content_items:
+            await self.store_content(content_item)
+
+    async def close(self):
+        """
+        release the resources held by the store, e.g. opened files
+        """
+        pass
+
+    # TODO support all platform
+    # only douyin is supported, so @abstractmethod is commented
+    # @abstractmethod
+    async def store_comment(self, comment_item: Dict):
+        pass
+
+    async def store_comments(self, comment_items: List[Dict]):
+        """
+        store a page of comments, implementations should override it with a bulk path
+        """
+        for comment_item in comment_items:
+            await self.store_comment(comment_item)
+
     # TODO support all platform
     # only xhs is supported, so @abstractmethod is commented
     # @abstractmethod
@@ -73,7 +100,7 @@ class AbstractApiClient(ABC):
         pass
 
     @abstractmethod
-    async def update_cookies(self, browser_context: BrowserContext):
+    async def update_cookies(self, browser_context: "BrowserContext"):
         pass
 
     @abstractmethod
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+# @Desc    : 性能基准测试脚本，在项目根目录下以 python -m benchmark.xxx 的方式运行
+import os
+
+import django
+
+# 存储层依赖 django ORM 模型，导入爬虫模块之前需要先初始化 django
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "crawler.settings")
+django.setup()
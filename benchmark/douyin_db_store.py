@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# @Desc    : 抖音 DB 存储基准测试：在事件循环里逐条 update_or_create vs 专用线程批量 upsert
+# 会在临时 sqlite 数据库上执行，同时统计写入期间事件循环被阻塞的最长时间
+# 用法: python -m benchmark.douyin_db_store --rows 2000
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+from django.core.management import call_command
+from django.db import connections
+
+import config
+from benchmark.douyin_csv_store import make_item
+from store.douyin.douyin_store_impl import DouyinDbStoreImplement
+from video.models import VideoInfo
+
+
+def make_db_item(i: int) -> Dict:
+    item = make_item(i)
+    item.update({
+        "create_time": 1714000000 + i, "user_id": "1", "sec_uid": "sec", "short_user_id": "1",
+        "user_unique_id": "1", "user_signature": "", "avatar": "", "collected_count": "0",
+        "share_count": "0", "ip_location": "", "last_modify_ts": 1714000000000, "cover": "",
+    })
+    return item
+
+
+async def measure_loop_stall(store_coro) -> Tuple[float, float]:
+    """
+    执行写入的同时每 1ms 唤醒一次，统计事件循环最长被阻塞的时间
+    :return: 写入耗时, 事件循环最长阻塞时间
+    """
+    max_stall = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal max_stall
+        while not done:
+            before = time.perf_counter()
+            await asyncio.sleep(0.001)
+            max_stall = max(max_stall, time.perf_counter() - before - 0.001)
+
+    ticker_task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await store_coro
+    cost = time.perf_counter() - start
+    done = True
+    await ticker_task
+    return cost, max_stall
+
+
+async def store_legacy(items: List[Dict]):
+    """原有实现：直接在协程里逐条调用同步的 update_or_create"""
+    for item in items:
+        VideoInfo.objects.update_or_create(aweme_id=item["aweme_id"], defaults=item)
+
+
+async def store_bulk(items: List[Dict], batch_size: int):
+    store = DouyinDbStoreImplement()
+    for i in range(0, len(items), batch_size):
+        await store.store_many(items[i:i + batch_size])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="douyin db store benchmark")
+    parser.add_argument("--rows", type=int, default=2000, help="写入的行数")
+    parser.add_argument("--batch-size", type=int, default=config.STORE_BATCH_SIZE, help="每批写入的行数")
+    args = parser.parse_args()
+
+    connections["default"].settings_dict["NAME"] = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+    call_command("migrate", verbosity=0)
+    items = [make_db_item(i) for i in range(args.rows)]
+
+    for name, coro in [
+        ("legacy update_or_create on loop", store_legacy(items)),
+        (f"bulk upsert on db thread (batch_size={args.batch_size})", store_bulk(items, args.batch_size)),
+    ]:
+        cost, max_stall = asyncio.run(measure_loop_stall(coro))
+        print(f"{name:50s} {args.rows / cost:10.1f} rows/s, max event loop stall: {max_stall * 1000:8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
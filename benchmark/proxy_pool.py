@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# @Desc    : 代理池基准测试，使用本地模拟的代理提供商和验证接口，不需要网络
+# 用法: python -m benchmark.proxy_pool --proxies 200 --ops 100000
+import argparse
+import asyncio
+import random
+import time
+
+from proxy.providers import FakeProxyProvider, FakeProxyValidator
+from proxy.proxy_ip_pool import ProxyIpPool
+
+
+def create_pool(proxies: int, validate_concurrency: int) -> ProxyIpPool:
+    return ProxyIpPool(
+        proxies, True, FakeProxyProvider(), validator=FakeProxyValidator(), validate_concurrency=validate_concurrency
+    )
+
+
+async def bench_validation(proxies: int, validate_concurrency: int) -> float:
+    pool = create_pool(proxies, validate_concurrency)
+    start = time.perf_counter()
+    await pool.load_proxies()
+    elapsed = time.perf_counter() - start
+    await pool.close()
+    return elapsed
+
+
+async def bench_legacy_selection(proxies: int, ops: int) -> float:
+    """原有实现：random.choice 选出一个 IP 再用 list.remove 移出，用完之后放回列表"""
+    proxy_list = await FakeProxyProvider().get_proxies(proxies)
+    start = time.perf_counter()
+    for _ in range(ops):
+        proxy = random.choice(proxy_list)
+        proxy_list.remove(proxy)
+        proxy_list.append(proxy)
+    return ops / (time.perf_counter() - start)
+
+
+async def bench_heap_selection(proxies: int, ops: int) -> float:
+    pool = create_pool(proxies, validate_concurrency=proxies)
+    pool.validator = FakeProxyValidator(dead_ratio=0, min_latency=0, max_latency=0)
+    await pool.load_proxies()
+    start = time.perf_counter()
+    for i in range(ops):
+        proxy = await pool.acquire()
+        pool.release(proxy, success=True, latency=0.05 + i % 7 / 100)
+    ops_per_second = ops / (time.perf_counter() - start)
+    await pool.close()
+    return ops_per_second
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--proxies", type=int, default=200)
+    parser.add_argument("--ops", type=int, default=100000)
+    parser.add_argument("--validate-concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    sequential = await bench_validation(args.proxies, 1)
+    concurrent = await bench_validation(args.proxies, args.validate_concurrency)
+    print(f"validate {args.proxies} proxies: sequential {sequential:.2f}s, "
+          f"concurrency={args.validate_concurrency} {concurrent:.2f}s ({sequential / concurrent:.1f}x)")
+
+    legacy = await bench_legacy_selection(args.proxies, args.ops)
+    heap = await bench_heap_selection(args.proxies, args.ops)
+    print(f"selection with {args.proxies} proxies: random.choice + list.remove {legacy:.0f} ops/s, "
+          f"health-scored heap {heap:.0f} ops/s (acquire + release with score updates)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,6 +3,9 @@ PLATFORM = "dy"
 KEYWORDS = "python,golang"
 LOGIN_TYPE = "qrcode"  # qrcode or phone or cookie
 COOKIES = ""
+# 已经持有登录 cookies 时直接用 cookies 创建客户端抓取，不启动浏览器；
+# 只有在需要登录、过滑块或者刷新 cookies 的时候才按需启动浏览器
+ENABLE_BROWSERLESS_CRAWL = True
 SORT_TYPE = "popularity_descending"  # 具体值参见media_platform.xxx.field下的枚举值，展示只支持小红书
 CRAWLER_TYPE = (
     "detail"  # 爬取类型，search(关键词搜索) | detail(帖子详情)| creator(创作者主页数据)
@@ -14,17 +17,101 @@ ENABLE_IP_PROXY = False
 # 代理IP池数量
 IP_PROXY_POOL_COUNT = 2
 
-# 代理IP提供商名称
+# 代理IP提供商名称，fake 为本地模拟的提供商，用于离线测试
 IP_PROXY_PROVIDER_NAME = "kuaidaili"
 
+# 代理池：并发验证的 IP 数量
+PROXY_VALIDATE_CONCURRENCY = 10
+
+# 代理池后台补充的检查间隔(秒)，健康 IP 少于 IP_PROXY_POOL_COUNT * PROXY_REFILL_THRESHOLD 时立即补充
+PROXY_REFILL_INTERVAL = 10
+PROXY_REFILL_THRESHOLD = 0.5
+
+# 代理 IP 平均延迟超过 PROXY_MAX_LATENCY 秒或者成功率低于 PROXY_MIN_SUCCESS_RATE 时隔离，
+# 隔离 PROXY_QUARANTINE_SECONDS 秒后重新验证
+PROXY_MAX_LATENCY = 5
+PROXY_MIN_SUCCESS_RATE = 0.5
+PROXY_QUARANTINE_SECONDS = 60
+
+# 代理 IP 剩余有效时长少于 PROXY_EXPIRE_BUFFER_SECONDS 秒时不再分配，避免请求到一半 IP 过期；
+# 会在 PROXY_PREFETCH_SECONDS 秒内下线的 IP 提前合并成一批补充，批大小受代理商单次提取上限限制
+PROXY_EXPIRE_BUFFER_SECONDS = 30
+PROXY_PREFETCH_SECONDS = 60
+
+# 抖音客户端每个请求从代理池租用一个 IP，一个 IP 连续使用 PROXY_STICKY_REQUESTS 个请求后归还(1 表示每个请求都换 IP)，
+# 请求失败或者 IP 被隔离时提前换 IP；浏览器的代理不参与轮换
+PROXY_STICKY_REQUESTS = 1
+
+# 开启代理时抓取并发数随代理池大小增长：max(MAX_CONCURRENCY_NUM, IP_PROXY_POOL_COUNT * PROXY_CONCURRENCY_PER_IP)
+PROXY_CONCURRENCY_PER_IP = 2
+
 # 设置为True不会打开浏览器（无头浏览器），设置False会打开一个浏览器（小红书如果一直扫码登录不通过，打开浏览器手动过一下滑动验证码）
 HEADLESS = True
 
 # 是否保存登录状态
 SAVE_LOGIN_STATE = True
 
-# 数据保存类型选项配置,支持三种类型：csv、db、json
-SAVE_DATA_OPTION = "db"  # csv or db or json
+# 登录会话快照：登录成功后把 cookies + localStorage 保存成一个小文件，之后的爬取任务(包括并行的任务)
+# 直接恢复到新的非持久化上下文，不用再共享同一个浏览器用户目录，开启后 SAVE_LOGIN_STATE 的持久化上下文不再使用
+ENABLE_SESSION_SNAPSHOT = True
+# 快照的有效期(秒)，同时不超过登录 cookie 本身的过期时间
+SESSION_SNAPSHOT_TTL = 7 * 24 * 3600
+
+# 多账号会话池：配置多个登录账号后请求在账号之间轮流发出，并按账号分别限速，单个账号的限流不再是吞吐上限
+# 每个账号: {"name": "账号名称", "cookies": "登录后的 cookies", "user_agent": "可选", "proxy": "可选，固定使用的代理"}
+#   "relogin_type": "可选，登录失效后重新登录的方式 qrcode | phone", "phone": "relogin_type 为 phone 时使用的手机号"
+#   qrcode 需要 HEADLESS = False 并且有人扫码，没有配置 relogin_type 的账号登录失效后直接下线
+# 重新登录之后的 cookies 按账号保存在 data/douyin 下，下次启动优先使用，不再用上面已经失效的 cookies
+DY_ACCOUNTS = []
+# 账号第一次被风控的冷却时间(秒)，之后连续被风控时成倍增加
+DY_SESSION_COOLDOWN_SECONDS = 60
+# 账号冷却时间的上限(秒)
+DY_SESSION_MAX_COOLDOWN_SECONDS = 900
+# 账号连续被风控多少次视为登录失效，配置了 relogin_type 的账号在后台重新登录
+DY_SESSION_MAX_STRIKES = 3
+# 账号连续请求失败多少次冷却一次
+DY_SESSION_MAX_CONSECUTIVE_ERRORS = 5
+
+# 常驻调度器(python manage.py runscheduler)：两次抓取的间隔(秒)
+SCHEDULER_INTERVAL_SECONDS = 60
+# 一次抓取的时间预算(秒)，用完之后不再开始新的视频，没抓完的视频优先放到下一次
+SCHEDULER_TIME_BUDGET_SECONDS = 50
+# 预算用完之后等待正在抓取的视频结束的时间(秒)，超过之后强制取消
+SCHEDULER_GRACE_SECONDS = 30
+# 每个任务保留的运行记录(耗时、吞吐)条数
+SCHEDULER_RUN_HISTORY = 100
+
+# 同步接口(POST /video/sync/)的任务执行方式：local 在 web 进程内的爬虫事件循环里排队执行，celery 投递给 celery worker
+# local 的任务状态只保存在提交它的 web 进程的内存里，多进程部署(比如 gunicorn/uvicorn 开了多个 worker)时，
+# GET /video/jobs/<id>/ 落到其他进程上会返回 404，多进程部署请使用 celery(任务状态保存在 redis 里)
+SYNC_JOB_BROKER = "local"
+# 同步任务状态的保留时间(秒)，过期之后 GET /video/jobs/<id>/ 返回 404
+SYNC_JOB_TTL = 24 * 3600
+# 一次同步任务最多的视频ID数量
+SYNC_JOB_MAX_AWEMES = 1000
+# 任务运行时把抓取进度写回任务状态的间隔(秒)
+SYNC_JOB_PROGRESS_INTERVAL = 1
+
+# 浏览器上下文池：爬取任务结束后浏览器不关闭，下一次任务直接复用预热好的上下文和页面
+# 保存登录状态时使用的是同一个用户目录的持久化上下文，池子大小固定为 1
+BROWSER_POOL_SIZE = 2
+# 一个上下文最多被复用的次数，超过之后关闭重建
+BROWSER_CONTEXT_MAX_USES = 50
+# 复用之前检查页面是否还能正常执行脚本的超时时间(秒)
+BROWSER_HEALTH_CHECK_TIMEOUT = 5
+
+# 数据保存类型选项配置,支持四种类型：csv、db、json、jsonl
+# json 每条数据都要读取并重写整个文件，数据量大时建议使用只追加写入的 jsonl
+SAVE_DATA_OPTION = "db"  # csv or db or json or jsonl
+
+# csv 文件句柄一直保持打开，写入之后最多间隔多少秒刷到磁盘（关闭时也会刷盘）
+CSV_FLUSH_INTERVAL = 1
+
+# jsonl 单个分段文件的最大字节数，超过后滚动到下一个分段文件（每天的数据本身也是单独的文件）
+JSONL_SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+
+# jsonl 是否额外写入 aweme_id -> 文件偏移量的索引文件(*.idx.jsonl)
+JSONL_ENABLE_INDEX = False
 
 # 用户浏览器缓存的浏览器文件配置
 USER_DATA_DIR = "%s_user_data_dir"  # %s will be replaced by platform name
@@ -35,6 +122,83 @@ START_PAGE = 1
 # 并发爬虫数量控制
 MAX_CONCURRENCY_NUM = 4
 
+# 并发存储数量控制，抓取到的数据边抓边存
+MAX_STORE_CONCURRENCY_NUM = 2
+
+# 批量写入配置：数据先缓存在内存中，攒够 STORE_BATCH_SIZE 条或者最早一条等待超过 STORE_FLUSH_INTERVAL 秒时批量落盘
+STORE_BATCH_SIZE = 50
+STORE_FLUSH_INTERVAL = 2
+# 批量落盘失败时数据放回缓存重试的次数，超过之后丢弃这一批，爬虫关闭时抛出异常
+STORE_FLUSH_MAX_RETRIES = 3
+
+# 等待存储的数据队列长度，存储跟不上抓取时抓取会暂停，内存占用不随 ID 列表变长而增长
+STORE_QUEUE_SIZE = 100
+
+# HTTP 连接池配置，每个代理各自一个连接池，请求之间复用长连接
+HTTP_MAX_CONNECTIONS = 100
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 20
+HTTP_KEEPALIVE_EXPIRY = 30  # 空闲长连接保持的秒数
+# 最多同时保留多少个代理的连接池，超出时关闭最久没用的；代理被代理池下线时它的连接池也会关闭
+HTTP_MAX_PROXY_CLIENTS = 50
+
+# 是否开启 HTTP/2，需要额外安装 h2 依赖：pip install httpx[http2]
+ENABLE_HTTP2 = False
+
+# 自适应限速：详情、评论、搜索接口各自一个令牌桶，接口健康时速率缓慢增长，
+# 延迟升高、空响应/被限流/请求失败的比例升高时速率减半(AIMD)
+ENABLE_RATE_CONTROL = True
+RATE_CONTROL_INITIAL_QPS = 2  # 每个接口的初始速率(次/秒)
+RATE_CONTROL_MIN_QPS = 0.2
+RATE_CONTROL_MAX_QPS = 20
+RATE_CONTROL_INCREASE = 0.5  # 接口健康时每秒大约增加的速率
+RATE_CONTROL_DECREASE_FACTOR = 0.5  # 接口异常时速率乘以的系数
+RATE_CONTROL_LATENCY_THRESHOLD = 3  # 平均延迟超过该秒数时降速
+RATE_CONTROL_FAILURE_RATE_THRESHOLD = 0.2  # 失败比例超过该值时降速
+
+# 请求失败(超时、连接错误、返回的不是 JSON、签名失败)时的重试策略，等待时间为带随机抖动的指数退避
+REQUEST_MAX_RETRIES = 3
+REQUEST_RETRY_BASE_DELAY = 0.5
+REQUEST_RETRY_MAX_DELAY = 10
+
+# 每次抓取任务的重试预算：重试次数不超过 REQUEST_RETRY_BUDGET_MIN + REQUEST_RETRY_BUDGET_RATIO * 请求数
+REQUEST_RETRY_BUDGET_RATIO = 0.2
+REQUEST_RETRY_BUDGET_MIN = 10
+
+# 熔断：同一个接口或者同一个代理连续失败 CIRCUIT_BREAKER_FAILURE_THRESHOLD 次后，
+# CIRCUIT_BREAKER_RECOVERY_TIMEOUT 秒内的请求直接失败，之后放一个探测请求过去
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = 5
+CIRCUIT_BREAKER_RECOVERY_TIMEOUT = 30
+
+# 浏览器页面状态(localStorage、cookies)快照的有效期(秒)，过期或页面跳转后才重新从浏览器读取
+DY_PAGE_STATE_TTL = 300
+
+# 抖音 X-Bogus 签名方式：js(常驻进程执行 libs/douyin.js) | native(纯 Python 实现，更快)
+# 使用 native 之前请先运行 test/test_douyin_sign.py 确认与 douyin.js 的签名结果一致
+DY_SIGN_TYPE = "js"
+
+# 是否抓取评论，评论按页边抓边存，不在内存中累积
+ENABLE_GET_COMMENTS = False
+
+# 是否抓取子评论(评论的回复)
+ENABLE_GET_SUB_COMMENTS = False
+
+# 评论增量抓取：记录每个视频已经抓到的最新评论(水位线)，再次抓取时翻到全是旧评论的一页就停止
+ENABLE_COMMENT_WATERMARK = True
+# 内存里最多缓存多少个视频的水位线，超出时淘汰最久没用的，需要时再从文件读取
+COMMENT_WATERMARK_CACHE_SIZE = 10000
+
+# 忽略水位线，重新全量抓取所有评论(抓取完成后水位线照常更新)
+COMMENT_FULL_RESCAN = False
+
+# 评论翻页之间额外等待的秒数，请求节奏已经由下面的自适应限速控制，一般不需要再设置
+COMMENT_CRAWL_INTERVAL = 0
+
+# 单个视频同时抓取子评论的评论数
+MAX_SUB_COMMENT_FANOUT = 4
+
+# 所有视频加起来同时抓取子评论的评论数上限
+MAX_SUB_COMMENT_CONCURRENCY_NUM = 8
+
 # 指定抖音需要爬取的ID列表
 DY_SPECIFIED_ID_LIST = [
     "7363503764520619273",
@@ -0,0 +1,10 @@
+import os
+
+from celery import Celery
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "crawler.settings")
+
+app = Celery("crawler")
+# CELERY_ 开头的 django 配置项都是 celery 的配置
+app.config_from_object("django.conf:settings", namespace="CELERY")
+app.autodiscover_tasks()
@@ -46,9 +46,8 @@ INSTALLED_APPS = [
     "video.apps.VideoConfig",
 ]
 
-CRON_CLASSES = [
-    "video.cron.MyCronJob",
-]
+# 定时抓取由常驻的调度器负责: python manage.py runscheduler
+CRON_CLASSES = []
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
@@ -0,0 +1,41 @@
+// 常驻的抖音签名进程：启动时只加载一次 douyin.js，之后按行读取 JSON 请求并按行返回签名结果
+// 请求：{"query": "aweme_id=xxx&...", "ua": "Mozilla/5.0 ...", "ts": 1700000000}  ts 可选，用于固定签名时间
+// 响应：{"x_bogus": "DFSz..."} 或 {"error": "..."}
+const path = require("path");
+const readline = require("readline");
+
+// 对比测试时需要固定签名用到的时间戳，在加载 douyin.js 之前替换掉全局的 Date
+const RealDate = Date;
+let frozenTs = null;
+
+function SignDate(...args) {
+    if (!new.target) return RealDate();
+    if (args.length) return new RealDate(...args);
+    return new RealDate(frozenTs === null ? RealDate.now() : frozenTs);
+}
+
+SignDate.now = () => (frozenTs === null ? RealDate.now() : frozenTs);
+SignDate.parse = RealDate.parse;
+SignDate.UTC = RealDate.UTC;
+SignDate.prototype = RealDate.prototype;
+globalThis.Date = SignDate;
+
+const douyin = require(path.resolve(process.argv[2] || path.join(__dirname, "douyin.js")));
+
+const rl = readline.createInterface({input: process.stdin, terminal: false});
+
+rl.on("line", (line) => {
+    let res;
+    try {
+        const req = JSON.parse(line);
+        frozenTs = typeof req.ts === "number" ? req.ts * 1000 : null;
+        res = {x_bogus: douyin.sign(req.query, req.ua)};
+    } catch (e) {
+        res = {error: String(e && e.stack || e)};
+    } finally {
+        frozenTs = null;
+    }
+    process.stdout.write(JSON.stringify(res) + "\n");
+});
+
+rl.on("close", () => process.exit(0));
@@ -1,39 +1,44 @@
 import asyncio
+import importlib
 import os
 import sys
 
 from base.base_crawler import AbstractCrawler
-from media_platform.douyin import DouYinCrawler
+from tools.browser_pool import close_browser_pools
 
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "crawler.settings")
 
 
 class CrawlerFactory:
+    # 爬虫类在创建时才导入，只加载选中平台的依赖
     CRAWLERS = {
-        "dy": DouYinCrawler,
+        "dy": "media_platform.douyin.DouYinCrawler",
     }
 
     @staticmethod
     def create_crawler(platform: str) -> AbstractCrawler:
-        crawler_class = CrawlerFactory.CRAWLERS.get(platform)
-        if not crawler_class:
+        crawler_path = CrawlerFactory.CRAWLERS.get(platform)
+        if not crawler_path:
             raise ValueError(
                 "Invalid Media Platform Currently only supported xhs or dy or ks or bili ..."
             )
+        module_name, class_name = crawler_path.rsplit(".", 1)
+        crawler_class = getattr(importlib.import_module(module_name), class_name)
         return crawler_class()
 
 
 async def main():
-    crawler = DouYinCrawler()
+    crawler = CrawlerFactory.create_crawler("dy")
     crawler.init_config(
         platform="dy",
         login_type="qrcode",
         crawler_type="detail",
-        start_page=1,
-        keyword="python,golang",
     )
-    await crawler.start()
+    try:
+        await crawler.start()
+    finally:
+        await close_browser_pools()
 
 
 if __name__ == "__main__":
@@ -1,18 +1,69 @@
 import asyncio
 import copy
+import json
+import time
 import urllib.parse
-from typing import Any, Callable, Dict, List, Optional
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
 
-import execjs
 import httpx
-from playwright.async_api import BrowserContext, Page
 
+import config
 from base.base_crawler import AbstractApiClient
+from proxy.proxy_ip_pool import ProxyIpPool, get_proxy_key
+from proxy.types import IpInfoModel
 from tools import utils
 from var import request_keyword_var
 
 from .exception import *
 from .field import *
+from .page_state import DouYinPageStateCache
+from .proxy_lease import ProxyLease, ProxyLeaseManager, format_httpx_proxy
+from .rate_limiter import (OUTCOME_BLOCKED, OUTCOME_ERROR,
+                           AdaptiveRateController, classify_response,
+                           get_endpoint_name)
+from .retry import CircuitBreakerRegistry, RetryBudget, RetryPolicy, RetryStats
+from .session_pool import DouYinAccountSession, DouYinSessionPool
+from .signer import AbstractDouYinSigner, create_douyin_signer
+from .transport import DouYinTransport
+from .watermark import CommentWatermark
+
+if TYPE_CHECKING:
+    from playwright.async_api import BrowserContext, Page
+
+
+# 超时、连接错误、返回的不是 JSON、签名失败都可以重试
+RETRYABLE_ERRORS = (httpx.TransportError, DataFetchError, SignError)
+
+# 租到的 IP 熔断时最多换几次 IP，超过之后按熔断处理
+MAX_PROXY_SWITCHES = 3
+
+# 账号被风控时最多换几次账号，超过之后按正常响应返回
+MAX_SESSION_SWITCHES = 3
+
+
+class DouYinClientResources:
+    def __init__(
+            self,
+            signer: Optional[AbstractDouYinSigner] = None,
+            transport: Optional[DouYinTransport] = None,
+            rate_controller: Optional[AdaptiveRateController] = None,
+    ):
+        """
+        签名进程池、HTTP 连接池和自适应限速状态，常驻进程里的多次抓取共用一份，不用每次运行都重新拉起签名进程、重新建连、重新探测限速
+        使用这些资源的客户端关闭时不会释放它们，由创建者(比如调度器)在退出时调用 aclose
+        Args:
+            signer: 默认按配置创建
+            transport:
+            rate_controller:
+        """
+        self.signer = signer or create_douyin_signer()
+        self.transport = transport or DouYinTransport()
+        self.rate_controller = rate_controller or AdaptiveRateController()
+
+    async def aclose(self):
+        """release the shared resources, only when no client uses them anymore"""
+        await self.transport.aclose()
+        await self.signer.close()
 
 
 class DOUYINClient(AbstractApiClient):
@@ -22,22 +73,61 @@ class DOUYINClient(AbstractApiClient):
             proxies=None,
             *,
             headers: Dict,
-            playwright_page: Optional[Page],
-            cookie_dict: Dict
+            playwright_page: Optional["Page"],
+            cookie_dict: Dict,
+            signer: Optional[AbstractDouYinSigner] = None,
+            transport: Optional[DouYinTransport] = None,
+            rate_controller: Optional[AdaptiveRateController] = None,
+            retry_policy: Optional[RetryPolicy] = None,
+            retry_budget: Optional[RetryBudget] = None,
+            circuit_breakers: Optional[CircuitBreakerRegistry] = None,
+            proxy_pool: Optional[ProxyIpPool] = None,
+            proxy_sticky_requests: Optional[int] = None,
+            session_refresher: Optional[Callable[[], Awaitable[None]]] = None,
+            session_pool: Optional[DouYinSessionPool] = None,
+            shared_resources: Optional[DouYinClientResources] = None,
     ):
         self.proxies = proxies
         self.timeout = timeout
         self.headers = headers
         self._host = "https://www.douyin.com"
         self.playwright_page = playwright_page
+        self.page_state = DouYinPageStateCache(playwright_page)
         self.cookie_dict = cookie_dict
+        # 共用的资源不归这个客户端所有，aclose 时不关闭
+        self.shared_resources = shared_resources
+        if shared_resources:
+            signer = signer or shared_resources.signer
+            transport = transport or shared_resources.transport
+            rate_controller = rate_controller or shared_resources.rate_controller
+        self.signer = signer or create_douyin_signer()
+        self.transport = transport or DouYinTransport(timeout=timeout)
+        self.rate_controller = rate_controller or AdaptiveRateController()
+        self.retry_policy = retry_policy or RetryPolicy()
+        # 一个客户端对应一次抓取任务，重试预算在整个任务内共享
+        self.retry_budget = retry_budget or RetryBudget()
+        self.circuit_breakers = circuit_breakers or CircuitBreakerRegistry()
+        self.retry_stats = RetryStats()
+        # 传入代理池时每个请求(或者每 N 个请求)从池子里租用一个 IP，不再固定使用 proxies
+        self.proxy_leases = ProxyLeaseManager(
+            proxy_pool, proxy_sticky_requests or config.PROXY_STICKY_REQUESTS
+        ) if proxy_pool else None
+        if self.proxy_leases:
+            self.proxy_leases.pool.add_drop_listener(self._on_proxy_dropped)
+        # 请求被风控时调用，刷新 cookies(比如按需启动浏览器过一下验证)，同一时刻只刷新一次
+        self.session_refresher = session_refresher
+        self._session_lock = asyncio.Lock()
+        self._session_generation = 0
+        # 刷新失败时的会话版本，同一版本上排队等待的请求不再重复刷新
+        self._failed_generation: Optional[int] = None
+        # 传入会话池时每个请求从池子里挑一个账号，使用账号自己的 cookies、User-Agent 和固定代理
+        self.session_pool = session_pool
 
-    async def __process_req_params(self, params: Optional[Dict] = None, headers: Optional[Dict] = None):
+    async def __process_req_params(self, params: Optional[Dict] = None, headers: Optional[Dict] = None,
+                                   session: Optional[DouYinAccountSession] = None):
         if not params:
             return
         headers = headers or self.headers
-        local_storage: Dict = await self.playwright_page.evaluate("() => window.localStorage")  # type: ignore
-        douyin_js_obj = execjs.compile(open('libs/douyin.js').read())
         common_params = {
             "device_platform": "webapp",
             "aid": "6383",
@@ -55,47 +145,258 @@ class DOUYINClient(AbstractApiClient):
             "platform": "PC",
             "screen_width": "1920",
             "screen_height": "1200",
-            # " webid": douyin_js_obj.call("get_web_id"),
-            # "msToken": local_storage.get("xmst"),
-            # "msToken": "abL8SeUTPa9-EToD8qfC7toScSADxpg6yLh2dbNcpWHzE0bT04txM_4UwquIcRvkRb9IU8sifwgM1Kwf1Lsld81o9Irt2_yNyUbbQPSUO8EfVlZJ_78FckDFnwVBVUVK",
         }
         params.update(common_params)
+        params.update(await self._get_page_params(session))
         query = '&'.join([f'{k}={v}' for k, v in params.items()])
-        x_bogus = douyin_js_obj.call('sign', query, headers["User-Agent"])
-        params["X-Bogus"] = x_bogus
-        # print(x_bogus, query)
+        params["X-Bogus"] = await self.signer.sign(query, headers["User-Agent"])
+
+    async def _get_page_params(self, session: Optional[DouYinAccountSession] = None) -> Dict[str, str]:
+        """
+        msToken 和 webid，从页面状态的内存快照里取，不和浏览器通信；
+        会话池的账号只用它自己的 cookies，页面上的是另一个登录态；没有浏览器时取客户端持有的 cookies
+        :param session:
+        :return:
+        """
+        if session is not None:
+            ms_token, web_id = session.cookie_dict.get("msToken", ""), session.cookie_dict.get("webid", "")
+        else:
+            ms_token = await self.page_state.get_ms_token() or self.cookie_dict.get("msToken", "")
+            web_id = await self.page_state.get_web_id() or self.cookie_dict.get("webid", "")
+        page_params = {}
+        if ms_token:
+            page_params["msToken"] = ms_token
+        if web_id:
+            page_params["webid"] = web_id
+        return page_params
 
     async def request(self, method, url, **kwargs):
-        async with httpx.AsyncClient(proxies=self.proxies) as client:
-            response = await client.request(
-                method, url, timeout=self.timeout,
-                **kwargs
-            )
+        proxies = kwargs.pop("proxies", self.proxies)
+        response = await self.transport.request(
+            method, url, proxies=proxies, timeout=self.timeout,
+            **kwargs
+        )
+        try:
+            return response.json()
+        except Exception as e:
+            raise DataFetchError(f"{e}, {response.text}")
+
+    async def aclose(self):
+        """release the resources held by the client"""
+        utils.logger.info(f"[DOUYINClient.aclose] {self.transport.stats}")
+        utils.logger.info(f"[DOUYINClient.aclose] {self.rate_controller}")
+        utils.logger.info(f"[DOUYINClient.aclose] {self.retry_stats}")
+        if self.proxy_leases:
+            self.proxy_leases.pool.remove_drop_listener(self._on_proxy_dropped)
+        if self.shared_resources:
+            return
+        await self.transport.aclose()
+        await self.signer.close()
+
+    def _on_proxy_dropped(self, proxy: IpInfoModel) -> None:
+        """代理池丢弃了一个 IP，关闭这个 IP 的连接池，删掉这个 IP 的限速状态和熔断器"""
+        self.transport.discard(format_httpx_proxy(proxy))
+        proxy_key = get_proxy_key(proxy)
+        for rate_key in list(self.rate_controller.endpoints):
+            # rate_key: {endpoint}@{proxy_key} 或者 {endpoint}@{proxy_key}#{session}
+            if rate_key.split("#")[0].endswith(f"@{proxy_key}"):
+                self.rate_controller.discard(rate_key)
+        self.circuit_breakers.discard(f"proxy:{proxy_key}")
+
+    @property
+    def proxy_key(self) -> str:
+        return json.dumps(self.proxies, sort_keys=True) if self.proxies else "direct"
+
+    def attach_playwright_page(self, playwright_page: "Page") -> None:
+        """没有浏览器启动的客户端，在浏览器按需启动之后接上页面"""
+        self.playwright_page = playwright_page
+        self.page_state = DouYinPageStateCache(playwright_page)
+
+    async def refresh_session(self, seen_generation: int) -> bool:
+        """
+        刷新会话，并发的请求同时被风控时只刷新一次，其他请求等刷新完成后直接重试
+        :param seen_generation: 请求发出时的会话版本
+        :return: 是否可以重试，刷新失败时返回 False，请求按被风控的结果正常失败
+        """
+        if not self.session_refresher:
+            return False
+        async with self._session_lock:
+            if self._failed_generation == seen_generation:
+                return False
+            if self._session_generation == seen_generation:
+                utils.logger.info("[DOUYINClient.refresh_session] request blocked, refresh the session ...")
+                try:
+                    await self.session_refresher()
+                except Exception as e:
+                    # 启动浏览器、滑块、页面超时等失败不能作为原始异常抛出 _send
+                    self._failed_generation = seen_generation
+                    utils.logger.error(f"[DOUYINClient.refresh_session] refresh the session failed: {e!r}")
+                    return False
+                self._session_generation += 1
+        return True
+
+    def release_proxy_lease(self) -> None:
+        """结束当前协程的粘性会话，把 IP 还给代理池，抓取协程退出前调用"""
+        if self.proxy_leases:
+            self.proxy_leases.release()
+
+    def detach_proxy_lease(self) -> None:
+        """客户端自己创建的协程开始时调用，不和父协程共用粘性会话，退出前调用 release_proxy_lease"""
+        if self.proxy_leases:
+            self.proxy_leases.detach()
+
+    def _report_proxy(self, lease: Optional[ProxyLease], success: bool, latency: float) -> None:
+        if lease:
+            self.proxy_leases.report(lease, success, latency)  # type: ignore
+
+    @staticmethod
+    def _get_session_headers(headers: Dict, session: DouYinAccountSession) -> Dict:
+        return {
+            **headers,
+            "Cookie": session.cookie_str,
+            "User-Agent": session.user_agent or headers["User-Agent"],
+        }
+
+    async def _send(self, method: str, uri: str, params: Optional[Dict] = None, data: Optional[Dict] = None,
+                    headers: Optional[Dict] = None):
+        """
+        发送请求：挑选账号 -> 租用代理 -> 熔断检查 -> 限速 -> 签名 -> 请求，可重试的错误按退避策略重试，每次重试都重新签名
+        使用代理池时，限速和代理熔断都按 IP 区分，使用会话池时限速再按账号区分，整体吞吐随 IP 和账号数量增长
+        :param method: GET | POST
+        :param uri: 接口路径
+        :param params: GET 请求参数
+        :param data: POST 请求参数
+        :param headers: 请求头，默认使用客户端的请求头
+        :return:
+        """
+        endpoint = get_endpoint_name(uri)
+        endpoint_breaker = self.circuit_breakers.get(f"endpoint:{endpoint}")
+        headers = headers or self.headers
+        self.retry_stats.requests += 1
+        self.retry_budget.record_request()
+        retry_no = 0
+        proxy_switches = 0
+        session_switches = 0
+        session_refreshed = False
+        while True:
+            session = await self.session_pool.acquire() if self.session_pool else None
+            # 请求结果上报给会话池，没有拿到结果(熔断拒绝、被取消)时为空
+            session_outcome: Optional[str] = None
+            backoff = None
             try:
-                return response.json()
-            except Exception as e:
-                raise DataFetchError(f"{e}, {response.text}")
+                if session and session.proxies:
+                    # 账号固定了代理，不再从代理池租用
+                    lease = None
+                    proxies = session.proxies
+                    proxy_key = json.dumps(session.proxies, sort_keys=True)
+                else:
+                    lease = await self.proxy_leases.lease() if self.proxy_leases else None
+                    proxies = lease.proxies if lease else self.proxies
+                    proxy_key = lease.key if lease else self.proxy_key
+                rate_key = f"{endpoint}@{proxy_key}" if lease else endpoint
+                if session:
+                    rate_key = f"{rate_key}#{session.name}"
+                req_headers = self._get_session_headers(headers, session) if session else headers
+                proxy_breaker = self.circuit_breakers.get(f"proxy:{proxy_key}")
+                breakers = [endpoint_breaker, proxy_breaker]
+                # 先检查 IP 的熔断器：IP 熔断时换 IP 重来，不能先占用接口熔断器的探测名额
+                if not proxy_breaker.allow_request():
+                    self.retry_stats.circuit_rejected += 1
+                    if lease and proxy_switches < MAX_PROXY_SWITCHES:
+                        # 这个 IP 熔断了，换一个 IP 继续，不计入重试次数
+                        proxy_switches += 1
+                        self._report_proxy(lease, False, 0)
+                        continue
+                    raise CircuitOpenError(f"[DOUYINClient._send] circuit {proxy_breaker.name} is open, uri:{uri}")
+                if not endpoint_breaker.allow_request():
+                    self.retry_stats.circuit_rejected += 1
+                    # 请求不会发出去，IP 熔断器的探测名额还回去
+                    proxy_breaker.release_probe()
+                    self.release_proxy_lease()
+                    raise CircuitOpenError(f"[DOUYINClient._send] circuit {endpoint_breaker.name} is open, uri:{uri}")
+                # 签名会往参数里追加公共参数和 X-Bogus，每次都从原始参数重新签名
+                req_params, req_data = copy.copy(params), copy.copy(data)
+                # 先拿令牌再签名，等待令牌的时间不会让签名里的时间戳过期
+                await self.rate_controller.acquire(rate_key)
+                self.retry_stats.attempts += 1
+                session_generation = self._session_generation
+                start = time.monotonic()
+                try:
+                    await self.__process_req_params(req_params if method == "GET" else req_data, req_headers, session)
+                    res = await self.request(
+                        method=method, url=f"{self._host}{uri}", params=req_params, data=req_data, headers=req_headers,
+                        proxies=proxies
+                    )
+                except RETRYABLE_ERRORS as e:
+                    latency = time.monotonic() - start
+                    session_outcome = OUTCOME_ERROR
+                    self.rate_controller.record(rate_key, latency, OUTCOME_ERROR)
+                    self._report_proxy(lease, False, latency)
+                    for breaker in breakers:
+                        if breaker.record_failure():
+                            self.retry_stats.circuit_opened += 1
+                            utils.logger.warning(f"[DOUYINClient._send] circuit {breaker.name} opened, err: {e}")
+                    if retry_no >= self.retry_policy.max_retries:
+                        self.retry_stats.give_ups += 1
+                        raise DataFetchError(f"{uri} failed after {retry_no + 1} attempts, err: {e}") from e
+                    if not self.retry_budget.try_acquire():
+                        self.retry_stats.budget_exhausted += 1
+                        self.retry_stats.give_ups += 1
+                        raise DataFetchError(f"{uri} retry budget exhausted, err: {e}") from e
+                    backoff = self.retry_policy.get_backoff(retry_no)
+                    utils.logger.warning(
+                        f"[DOUYINClient._send] {uri} attempt {retry_no + 1} failed, retry after {backoff:.2f}s, err: {e}"
+                    )
+                    self.retry_stats.retries += 1
+                    retry_no += 1
+                else:
+                    latency = time.monotonic() - start
+                    session_outcome = outcome = classify_response(res)
+                    self.rate_controller.record(rate_key, latency, outcome)
+                    # 被风控的 IP 算作失败，让代理池降低它的分数
+                    self._report_proxy(lease, outcome != OUTCOME_BLOCKED, latency)
+                    for breaker in breakers:
+                        breaker.record_success()
+            finally:
+                # 退避等待之前就把账号还回去，等待期间别的请求可以用它
+                if session:
+                    self.session_pool.report(session, session_outcome)  # type: ignore
+            if backoff is not None:
+                await asyncio.sleep(backoff)
+                continue
+            if outcome == OUTCOME_BLOCKED and session and session_switches < MAX_SESSION_SWITCHES:
+                # 会话池已经让这个账号冷却，换一个账号重试，不计入重试次数
+                session_switches += 1
+                continue
+            if outcome == OUTCOME_BLOCKED and not session and not session_refreshed \
+                    and await self.refresh_session(session_generation):
+                session_refreshed = True
+                continue
+            if retry_no:
+                self.retry_stats.retry_successes += 1
+            return res
 
     async def get(self, uri: str, params: Optional[Dict] = None, headers: Optional[Dict] = None):
-        await self.__process_req_params(params, headers)
-        headers = headers or self.headers
-        return await self.request(method="GET", url=f"{self._host}{uri}", params=params, headers=headers)
+        return await self._send("GET", uri, params=params, headers=headers)
 
     async def post(self, uri: str, data: dict, headers: Optional[Dict] = None):
-        await self.__process_req_params(data, headers)
-        headers = headers or self.headers
-        return await self.request(method="POST", url=f"{self._host}{uri}", data=data, headers=headers)
+        return await self._send("POST", uri, data=data, headers=headers)
 
     @staticmethod
-    async def pong(browser_context: BrowserContext) -> bool:
+    async def pong(browser_context: "BrowserContext") -> bool:
         _, cookie_dict = utils.convert_cookies(await browser_context.cookies())
         # todo send some api to test login status
         return cookie_dict.get("LOGIN_STATUS") == "1"
 
-    async def update_cookies(self, browser_context: BrowserContext):
+    def pong_by_cookies(self) -> bool:
+        """不启动浏览器，只根据客户端持有的 cookies 判断是否是登录状态"""
+        return self.cookie_dict.get("LOGIN_STATUS") == "1" or bool(self.cookie_dict.get("sessionid"))
+
+    async def update_cookies(self, browser_context: "BrowserContext"):
         cookie_str, cookie_dict = utils.convert_cookies(await browser_context.cookies())
         self.headers["Cookie"] = cookie_str
         self.cookie_dict = cookie_dict
+        self.page_state.invalidate()
 
     async def search_info_by_keyword(
             self,
@@ -163,6 +464,180 @@ class DOUYINClient(AbstractApiClient):
         headers["Referer"] = urllib.parse.quote(referer_url, safe=':/')
         return await self.get(uri, params)
 
+    async def get_sub_comments(self, aweme_id: str, comment_id: str, cursor: int = 0):
+        """get sub comments of the comment
+
+        """
+        uri = "/aweme/v1/web/comment/list/reply/"
+        params = {
+            "item_id": aweme_id,
+            "comment_id": comment_id,
+            "cursor": cursor,
+            "count": 20,
+            "item_type": 0
+        }
+        return await self.get(uri, params)
+
+    @staticmethod
+    async def _iter_comment_pages(
+            fetch_page: Callable[[int], Awaitable[Dict]],
+            crawl_interval: float,
+            max_empty_pages: int = 3,
+            watermark: Optional[CommentWatermark] = None,
+    ) -> AsyncIterator[List[Dict]]:
+        """
+        按游标翻页，逐页返回评论，不在内存中累积
+        :param fetch_page: 根据游标获取一页评论的函数
+        :param crawl_interval: 翻页间隔
+        :param max_empty_pages: 连续多少个空页之后停止翻页，防止 has_more 一直为 1 时死循环
+        :param watermark: 评论水位线，翻到一页全部都抓过的评论时停止，调用方保存每一页之后 commit 推进水位线
+        :return:
+        """
+        cursor = watermark.start_cursor if watermark else 0
+        empty_pages = 0
+        if watermark:
+            watermark.completed = False
+        while True:
+            comments_res = await fetch_page(cursor)
+            comments = comments_res.get("comments") or []
+            next_cursor = comments_res.get("cursor", 0)
+            if watermark and comments and watermark.is_page_seen(comments):
+                watermark.completed = True
+                return
+            if watermark:
+                # 调用方保存好这一页之后 commit，水位线才推进
+                watermark.stage(comments, next_cursor)
+            if comments:
+                empty_pages = 0
+                yield comments
+            else:
+                empty_pages += 1
+            if not comments_res.get("has_more", 0):
+                break
+            if next_cursor == cursor or empty_pages >= max_empty_pages:
+                utils.logger.info(
+                    f"[DOUYINClient._iter_comment_pages] stop paging, has_more is set but cursor:{next_cursor} "
+                    f"does not move or got {empty_pages} empty pages"
+                )
+                break
+            cursor = next_cursor
+            await asyncio.sleep(crawl_interval)
+        if watermark:
+            watermark.completed = True
+
+    def iter_aweme_comment_pages(
+            self, aweme_id: str, crawl_interval: float = 1.0, watermark: Optional[CommentWatermark] = None
+    ) -> AsyncIterator[List[Dict]]:
+        """
+        逐页获取视频的一级评论
+        :param aweme_id: 视频ID
+        :param crawl_interval: 翻页间隔
+        :param watermark: 评论水位线，为空时全量抓取
+        :return:
+        """
+        return self._iter_comment_pages(
+            lambda cursor: self.get_aweme_comments(aweme_id, cursor), crawl_interval, watermark=watermark
+        )
+
+    def iter_sub_comment_pages(
+            self, aweme_id: str, comment_id: str, crawl_interval: float = 1.0
+    ) -> AsyncIterator[List[Dict]]:
+        """
+        逐页获取评论下的子评论
+        :param aweme_id: 视频ID
+        :param comment_id: 一级评论ID
+        :param crawl_interval: 翻页间隔
+        :return:
+        """
+        return self._iter_comment_pages(
+            lambda cursor: self.get_sub_comments(aweme_id, comment_id, cursor), crawl_interval
+        )
+
+    async def iter_aweme_all_comments(
+            self,
+            aweme_id: str,
+            crawl_interval: float = 1.0,
+            is_fetch_sub_comments: bool = False,
+            max_sub_comment_fanout: int = 4,
+            sub_comment_semaphore: Optional[asyncio.Semaphore] = None,
+            watermark: Optional[CommentWatermark] = None,
+    ) -> AsyncIterator[List[Dict]]:
+        """
+        流式获取视频的所有评论，一级评论和子评论的每一页抓到之后立即返回，内存占用和评论总数无关
+        :param aweme_id: 视频ID
+        :param crawl_interval: 翻页间隔
+        :param is_fetch_sub_comments: 是否抓取子评论
+        :param max_sub_comment_fanout: 单个视频同时抓取子评论的评论数
+        :param sub_comment_semaphore: 多个视频共享的子评论并发上限，为空时只受 max_sub_comment_fanout 限制
+        :param watermark: 评论水位线，增量抓取时翻到旧评论就停止，旧评论的子评论也不再抓取，
+                          每一页保存之后调用 watermark.commit(comments)
+        :return:
+        """
+        if not is_fetch_sub_comments:
+            async for comments in self.iter_aweme_comment_pages(aweme_id, crawl_interval, watermark):
+                yield comments
+            return
+
+        page_queue: asyncio.Queue = asyncio.Queue(maxsize=max_sub_comment_fanout * 2)
+        fanout_semaphore = asyncio.Semaphore(max_sub_comment_fanout)
+        sub_comment_semaphore = sub_comment_semaphore or asyncio.Semaphore(max_sub_comment_fanout)
+        sub_comment_tasks: Set[asyncio.Task] = set()
+
+        async def fetch_sub_comments(comment_id: str):
+            self.detach_proxy_lease()
+            try:
+                async with sub_comment_semaphore:
+                    async for sub_comments in self.iter_sub_comment_pages(aweme_id, comment_id, crawl_interval):
+                        await page_queue.put(sub_comments)
+            except Exception as e:
+                # 单条评论的子评论抓取失败不影响其他评论
+                utils.logger.error(
+                    f"[DOUYINClient.iter_aweme_all_comments] get sub comments error, comment_id:{comment_id}, err: {e}"
+                )
+            finally:
+                fanout_semaphore.release()
+                self.release_proxy_lease()
+
+        async def fetch_comments():
+            self.detach_proxy_lease()
+            try:
+                async for comments in self.iter_aweme_comment_pages(aweme_id, crawl_interval, watermark):
+                    await page_queue.put(comments)
+                    for comment in comments:
+                        if not int(comment.get("reply_comment_total") or 0):
+                            continue
+                        if watermark and watermark.is_seen(comment):
+                            continue
+                        # 先拿到名额再创建任务，正在抓取的子评论数量不超过 max_sub_comment_fanout
+                        await fanout_semaphore.acquire()
+                        task = asyncio.create_task(fetch_sub_comments(comment.get("cid")))
+                        sub_comment_tasks.add(task)
+                        task.add_done_callback(sub_comment_tasks.discard)
+                await asyncio.gather(*list(sub_comment_tasks))
+            finally:
+                for task in list(sub_comment_tasks):
+                    task.cancel()
+                self.release_proxy_lease()
+
+        producer = asyncio.create_task(fetch_comments())
+        try:
+            while not producer.done() or not page_queue.empty():
+                if not page_queue.empty():
+                    yield page_queue.get_nowait()
+                    continue
+                get_task = asyncio.ensure_future(page_queue.get())
+                await asyncio.wait({get_task, producer}, return_when=asyncio.FIRST_COMPLETED)
+                if not get_task.done():
+                    get_task.cancel()
+                    continue
+                yield get_task.result()
+            # 一级评论抓取失败时把异常抛给调用方
+            producer.result()
+        finally:
+            if not producer.done():
+                producer.cancel()
+                await asyncio.gather(producer, return_exceptions=True)
+
     async def get_aweme_all_comments(
             self,
             aweme_id: str,
@@ -171,7 +646,7 @@ class DOUYINClient(AbstractApiClient):
             callback: Optional[Callable] = None,
     ):
         """
-        获取帖子的所有评论，包括子评论
+        获取帖子的所有评论，包括子评论，所有评论都会保存在内存中，评论量大时请使用 iter_aweme_all_comments
         :param aweme_id: 帖子ID
         :param crawl_interval: 抓取间隔
         :param is_fetch_sub_comments: 是否抓取子评论
@@ -179,21 +654,8 @@ class DOUYINClient(AbstractApiClient):
         :return: 评论列表
         """
         result = []
-        comments_has_more = 1
-        comments_cursor = 0
-        while comments_has_more:
-            comments_res = await self.get_aweme_comments(aweme_id, comments_cursor)
-            comments_has_more = comments_res.get("has_more", 0)
-            comments_cursor = comments_res.get("cursor", 0)
-            comments = comments_res.get("comments", [])
-            if not comments:
-                continue
+        async for comments in self.iter_aweme_all_comments(aweme_id, crawl_interval, is_fetch_sub_comments):
             result.extend(comments)
             if callback:  # 如果有回调函数，就执行回调函数
                 await callback(aweme_id, comments)
-
-            await asyncio.sleep(crawl_interval)
-            if not is_fetch_sub_comments:
-                continue
-            # todo fetch sub comments
         return result
@@ -1,69 +1,197 @@
 import asyncio
+import functools
 import os
 import random
+import re
+import time
 from asyncio import Task
-from typing import Any, Dict, List, Optional, Tuple
-
-from playwright.async_api import BrowserContext, BrowserType, Page, async_playwright
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
 import config
 from base.base_crawler import AbstractCrawler
-from proxy.proxy_ip_pool import IpInfoModel, create_ip_pool
+from proxy.proxy_ip_pool import IpInfoModel, ProxyIpPool, create_ip_pool
 from store import douyin as douyin_store
 from tools import utils
+from tools.browser_pool import BrowserPool, PooledBrowserContext, get_browser_pool, get_playwright
 from var import crawler_type_var
 
-from .client import DOUYINClient
-from .exception import DataFetchError
+from .client import DOUYINClient, DouYinClientResources
+from .exception import DataFetchError, SessionExpiredError
 from .login import DouYinLogin
+from .progress import CrawlProgress
+from .session import SessionSnapshot
+from .session_pool import DouYinAccountSession, DouYinSessionPool, create_session_pool
+from .watermark import CommentWatermark
+
+if TYPE_CHECKING:
+    from playwright.async_api import BrowserContext, BrowserType, Page
+
+DEFAULT_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36"  # fixed
+INDEX_URL = "https://www.douyin.com"
+
+
+def use_persistent_context() -> bool:
+    """Session snapshots replace the persistent user data dir, which can only be opened by one browser at a time"""
+    return config.SAVE_LOGIN_STATE and not config.ENABLE_SESSION_SNAPSHOT
+
+
+async def load_valid_session_snapshot(
+    session_store: douyin_store.DouyinSessionSnapshotStore,
+) -> Optional[SessionSnapshot]:
+    """Load the session snapshot saved by an earlier login, expired or outdated snapshots are removed"""
+    item = await session_store.load()
+    if item is None:
+        return None
+    snapshot = SessionSnapshot.from_dict(item)
+    if not snapshot.is_valid():
+        utils.logger.info("[load_valid_session_snapshot] session snapshot is expired, remove it ...")
+        await session_store.delete()
+        return None
+    return snapshot
+
+
+async def launch_browser_context(
+    chromium: "BrowserType",
+    playwright_proxy: Optional[Dict],
+    user_agent: Optional[str],
+    headless: bool = True,
+    storage_state: Optional[Dict] = None,
+    platform: str = "dy",
+) -> "BrowserContext":
+    """Launch browser and create browser context, storage_state restores a saved session into a fresh context"""
+    if use_persistent_context():
+        user_data_dir = os.path.join(
+            os.getcwd(), "browser_data", config.USER_DATA_DIR % platform
+        )  # type: ignore
+        browser_context = await chromium.launch_persistent_context(
+            user_data_dir=user_data_dir,
+            accept_downloads=True,
+            headless=headless,
+            proxy=playwright_proxy,  # type: ignore
+            viewport={"width": 1920, "height": 1080},
+            user_agent=user_agent,
+        )  # type: ignore
+        return browser_context
+    else:
+        browser = await chromium.launch(headless=headless, proxy=playwright_proxy)  # type: ignore
+        browser_context = await browser.new_context(
+            viewport={"width": 1920, "height": 1080}, user_agent=user_agent, storage_state=storage_state  # type: ignore
+        )
+        return browser_context
+
+
+async def create_browser_context(platform: str) -> Tuple["BrowserContext", "Page"]:
+    """
+    Launch a browser context for the browser pool, with the stealth script injected and the index page opened.
+    The pool is shared by every crawler of the event loop, so the factory reads the latest session snapshot itself
+    instead of going through a crawler: the context starts logged in, with the user agent the snapshot was made with
+    """
+    snapshot = None
+    if config.ENABLE_SESSION_SNAPSHOT:
+        snapshot = await load_valid_session_snapshot(douyin_store.DouyinSessionSnapshotStore())
+    user_agent = snapshot.user_agent if snapshot is not None and snapshot.user_agent else DEFAULT_USER_AGENT
+    playwright = await get_playwright()
+    browser_context = await launch_browser_context(
+        playwright.chromium,
+        None,
+        user_agent,
+        headless=config.HEADLESS,
+        storage_state=snapshot.storage_state if snapshot is not None else None,
+        platform=platform,
+    )
+    # stealth.min.js is a js script to prevent the website from detecting the crawler.
+    await browser_context.add_init_script(path="libs/stealth.min.js")
+    context_page = await browser_context.new_page()
+    await context_page.goto(INDEX_URL)
+    return browser_context, context_page
 
 
 class DouYinCrawler(AbstractCrawler):
     platform: str
     login_type: str
     crawler_type: str
-    context_page: Page
+    context_page: "Page"
     dy_client: DOUYINClient
-    browser_context: BrowserContext
+    browser_context: "BrowserContext"
 
     def __init__(self) -> None:
-        self.user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36"  # fixed
-        self.index_url = "https://www.douyin.com"
+        self.user_agent = DEFAULT_USER_AGENT
+        self.index_url = INDEX_URL
+        self.comment_watermark_store = douyin_store.DouyinCommentWatermarkStore()
+        self.session_store = douyin_store.DouyinSessionSnapshotStore()
+        self.session_snapshot: Optional[SessionSnapshot] = None
+        self.session_pool: Optional[DouYinSessionPool] = None
+        self.ip_proxy_pool: Optional[ProxyIpPool] = None
+        self.browser_entry: Optional[PooledBrowserContext] = None
+        self.aweme_ids: Optional[List[str]] = None
+        self.time_budget: Optional[float] = None
+        self.enable_comments: Optional[bool] = None
+        # set by a long running owner (the scheduler) to reuse the signer, connections and rate state across runs
+        self.client_resources: Optional[DouYinClientResources] = None
+        self.progress = CrawlProgress()
 
     def init_config(
         self,
         platform: str,
         login_type: str,
         crawler_type: str,
+        aweme_ids: Optional[List[str]] = None,
+        time_budget: Optional[float] = None,
+        enable_comments: Optional[bool] = None,
     ) -> None:
+        """
+        aweme_ids overrides config.DY_SPECIFIED_ID_LIST, with a time_budget (seconds) no new aweme is started
+        once the budget is spent, the rest is left in get_unfinished_aweme_ids() for the next run,
+        enable_comments overrides config.ENABLE_GET_COMMENTS
+        """
         self.platform = platform
         self.login_type = login_type
         self.crawler_type = crawler_type
+        self.aweme_ids = aweme_ids
+        self.time_budget = time_budget
+        self.enable_comments = enable_comments
+        self.progress = CrawlProgress(aweme_ids)
 
     async def start(self) -> None:
-        playwright_proxy_format, httpx_proxy_format = None, None
         if config.ENABLE_IP_PROXY:
-            ip_proxy_pool = await create_ip_pool(
+            # the client leases an ip from the pool per request (or per sticky session),
+            # the browser context keeps its own proxy setting and is not rotated
+            self.ip_proxy_pool = await create_ip_pool(
                 config.IP_PROXY_POOL_COUNT, enable_validate_ip=True
             )
-            ip_proxy_info: IpInfoModel = await ip_proxy_pool.get_proxy()
-            playwright_proxy_format, httpx_proxy_format = self.format_proxy_info(
-                ip_proxy_info
-            )
 
-        async with async_playwright() as playwright:
-            # Launch a browser context.
-            chromium = playwright.chromium
-            self.browser_context = await self.launch_browser(
-                chromium, None, self.user_agent, headless=config.HEADLESS
-            )
-            # stealth.min.js is a js script to prevent the website from detecting the crawler.
-            await self.browser_context.add_init_script(path="libs/stealth.min.js")
-            self.context_page = await self.browser_context.new_page()
-            await self.context_page.goto(self.index_url)
+        if config.DY_ACCOUNTS:
+            # multi-account path: every request picks a logged-in account from the session pool,
+            # the browser is only launched to log expired accounts in again
+            accounts = await self.load_account_snapshots(config.DY_ACCOUNTS)
+            self.session_pool = create_session_pool(accounts, relogin=self.relogin_account)
+            self.dy_client = await self.create_douyin_client_from_cookies("")
+            try:
+                await self.crawl()
+            finally:
+                await self.release_browser_context()
+            return
+
+        cookie_str = await self.get_stored_cookie_str()
+        if config.ENABLE_BROWSERLESS_CRAWL and cookie_str:
+            # fast path: all data requests go through httpx, so a logged-in cookie set is all the crawl needs,
+            # the browser is only launched when douyin asks for a cookie refresh
+            self.dy_client = await self.create_douyin_client_from_cookies(cookie_str)
+            if self.dy_client.pong_by_cookies():
+                try:
+                    await self.crawl()
+                finally:
+                    await self.release_browser_context()
+                return
+            utils.logger.info("[DouYinCrawler.start] stored cookies are not logged in, fallback to the browser ...")
+            await self.dy_client.aclose()
+            await self.discard_session_snapshot()
 
-            self.dy_client = await self.create_douyin_client(httpx_proxy_format)
+        await self.ensure_browser_context()
+        try:
+            self.dy_client = await self.create_douyin_client(None)
             if not await self.dy_client.pong(browser_context=self.browser_context):
+                await self.discard_session_snapshot()
                 login_obj = DouYinLogin(
                     login_type=self.login_type,
                     login_phone="",  # you phone number
@@ -75,41 +203,336 @@ class DouYinCrawler(AbstractCrawler):
                 await self.dy_client.update_cookies(
                     browser_context=self.browser_context
                 )
-            crawler_type_var.set(self.crawler_type)
+                await self.save_session_snapshot()
+            await self.crawl()
+        finally:
+            await self.release_browser_context()
+
+    async def crawl(self) -> None:
+        """Run the crawl with the logged-in client, then flush and release everything, also when the run is cancelled"""
+        crawler_type_var.set(self.crawler_type)
+        douyin_store.open_douyin_store()
+        try:
             # Get the information and comments of the specified post
             await self.get_specified_awemes()
+            utils.logger.info(f"[DouYinCrawler.start] Douyin Crawler finished, {self.progress}")
+        finally:
+            self.progress.finish()
+            await self.close()
 
-            utils.logger.info("[DouYinCrawler.start] Douyin Crawler finished ...")
+    def get_unfinished_aweme_ids(self) -> List[str]:
+        """Awemes not crawled in this run, because the time budget ran out or the run was cancelled"""
+        return self.progress.get_unfinished_ids()
 
-    async def get_specified_awemes(self):
-        """Get the information and comments of the specified post"""
-        semaphore = asyncio.Semaphore(config.MAX_CONCURRENCY_NUM)
-        task_list = [
-            self.get_aweme_detail(aweme_id=aweme_id, semaphore=semaphore)
-            for aweme_id in config.DY_SPECIFIED_ID_LIST
-        ]
-        aweme_details = await asyncio.gather(*task_list)
-        for aweme_detail in aweme_details:
-            if aweme_detail is not None:
-                await douyin_store.update_douyin_aweme(aweme_detail)
-
-    async def get_aweme_detail(
-        self, aweme_id: str, semaphore: asyncio.Semaphore
-    ) -> Any:
-        """Get note detail"""
-        async with semaphore:
+    async def get_stored_cookie_str(self) -> str:
+        """Cookies we already hold and can crawl with, without opening a browser: a valid session snapshot first"""
+        snapshot = await self.load_session_snapshot()
+        if snapshot is not None:
+            return snapshot.cookie_str
+        return config.COOKIES
+
+    async def load_session_snapshot(self) -> Optional[SessionSnapshot]:
+        """Load the session snapshot saved by an earlier login, expired or outdated snapshots are removed"""
+        if not config.ENABLE_SESSION_SNAPSHOT:
+            return None
+        snapshot = await load_valid_session_snapshot(self.session_store)
+        self.session_snapshot = snapshot
+        if snapshot is None:
+            return None
+        if snapshot.user_agent:
+            # douyin binds the session to the user agent it was created with
+            self.user_agent = snapshot.user_agent
+        return snapshot
+
+    async def save_session_snapshot(self) -> None:
+        """Save cookies and localStorage of the logged-in browser context, later runs restore them without logging in"""
+        if not config.ENABLE_SESSION_SNAPSHOT:
+            return
+        snapshot = SessionSnapshot.create(
+            await self.browser_context.storage_state(), self.user_agent, config.SESSION_SNAPSHOT_TTL
+        )
+        if not snapshot.is_valid():
+            return
+        await self.session_store.save(snapshot.to_dict())
+        self.session_snapshot = snapshot
+        utils.logger.info("[DouYinCrawler.save_session_snapshot] session snapshot saved ...")
+
+    async def discard_session_snapshot(self) -> None:
+        """The restored session did not pass the login probe, drop it so other runs do not try it again"""
+        if self.session_snapshot is None:
+            return
+        self.session_snapshot = None
+        await self.session_store.delete()
+
+    def get_browser_pool(self) -> BrowserPool:
+        return get_browser_pool(
+            self.platform, functools.partial(create_browser_context, self.platform),
+            size=1 if use_persistent_context() else None,
+        )
+
+    async def ensure_browser_context(self) -> None:
+        """Lease a warm browser context from the process-wide pool, only the first run pays for launching it"""
+        if self.browser_entry is not None:
+            return
+        self.browser_entry = await self.get_browser_pool().acquire()
+        self.browser_context = self.browser_entry.context
+        self.context_page = self.browser_entry.page
+        if not self.context_page.url.startswith(self.index_url):
+            await self.context_page.goto(self.index_url)
+
+    async def release_browser_context(self) -> None:
+        """Give the browser context back to the pool"""
+        if self.browser_entry is None:
+            return
+        entry, self.browser_entry = self.browser_entry, None
+        await self.get_browser_pool().release(entry)
+
+    async def refresh_session(self) -> None:
+        """
+        Called by the client when douyin rejects the stored cookies: launch the browser lazily with the client's cookies,
+        reload the index page (sliding the captcha if one shows up) and take the refreshed cookies back
+        """
+        try:
+            await self._refresh_session()
+        except DataFetchError:
+            raise
+        except (Exception, SystemExit) as e:
+            # DouYinLogin exits when the slider cannot be passed
+            raise DataFetchError(f"[DouYinCrawler.refresh_session] refresh session failed: {e!r}") from e
+
+    async def _refresh_session(self) -> None:
+        launched = self.browser_entry is None
+        await self.ensure_browser_context()
+        if launched:
+            await self.browser_context.add_cookies([
+                {"name": key, "value": value, "domain": ".douyin.com", "path": "/"}
+                for key, value in self.dy_client.cookie_dict.items()
+            ])
+            self.dy_client.attach_playwright_page(self.context_page)
+        await self.context_page.goto(self.index_url)
+        if "验证码中间页" in await self.context_page.title():
+            login_obj = DouYinLogin(
+                login_type=self.login_type,
+                browser_context=self.browser_context,
+                context_page=self.context_page,
+            )
+            await login_obj.check_page_display_slider(move_step=3, slider_level="hard")
+        await self.dy_client.update_cookies(browser_context=self.browser_context)
+        await self.save_session_snapshot()
+
+    @staticmethod
+    def get_account_session_store(name: str) -> douyin_store.DouyinSessionSnapshotStore:
+        """Every account of DY_ACCOUNTS keeps the snapshot of its latest login in its own file"""
+        safe_name = re.sub(r"[^\w-]", "_", name)
+        return douyin_store.DouyinSessionSnapshotStore(file_name=f"account_{safe_name}.json")
+
+    async def load_account_snapshots(self, accounts: List[Dict]) -> List[Dict]:
+        """Accounts logged in again by an earlier run use the saved cookies instead of the stale ones in DY_ACCOUNTS"""
+        loaded = []
+        for index, account in enumerate(accounts):
+            name = account.get("name") or f"account_{index}"
+            item = await self.get_account_session_store(name).load()
+            snapshot = SessionSnapshot.from_dict(item) if item else None
+            if snapshot is not None and snapshot.is_valid():
+                account = {
+                    **account,
+                    "name": name,
+                    "cookies": snapshot.cookie_str,
+                    "user_agent": snapshot.user_agent or account.get("user_agent", ""),
+                }
+            loaded.append(account)
+        return loaded
+
+    async def relogin_account(self, session: DouYinAccountSession) -> Dict[str, str]:
+        """
+        Called by the session pool in the background: log an expired account in again with its own relogin_type
+        in a pooled browser context, save the new cookies of the account for later runs and return them
+        """
+        if not session.can_relogin:
+            raise DataFetchError(f"[DouYinCrawler.relogin_account] account {session.name} can not log in again")
+        async with self.get_browser_pool().lease() as entry:
+            # the pooled context may still hold another account's cookies
+            await entry.context.clear_cookies()
             try:
-                return await self.dy_client.get_video_by_id(aweme_id)
-            except DataFetchError as ex:
-                utils.logger.error(
-                    f"[DouYinCrawler.get_aweme_detail] Get aweme detail error: {ex}"
+                await entry.page.goto(self.index_url)
+                login_obj = DouYinLogin(
+                    login_type=session.relogin_type,
+                    browser_context=entry.context,
+                    context_page=entry.page,
+                    login_phone=session.login_phone,
                 )
-                return None
-            except KeyError as ex:
-                utils.logger.error(
-                    f"[DouYinCrawler.get_aweme_detail] have not fund note detail aweme_id:{aweme_id}, err: {ex}"
+                await login_obj.begin()
+                snapshot = SessionSnapshot.create(
+                    await entry.context.storage_state(), self.user_agent, config.SESSION_SNAPSHOT_TTL
                 )
-                return None
+            except SystemExit:
+                # DouYinLogin exits when the login check fails, which must not take the whole crawl down
+                raise DataFetchError(f"[DouYinCrawler.relogin_account] login account {session.name} failed")
+            finally:
+                await entry.context.clear_cookies()
+        if not snapshot.is_valid():
+            raise DataFetchError(f"[DouYinCrawler.relogin_account] account {session.name} is not logged in")
+        await self.get_account_session_store(session.name).save(snapshot.to_dict())
+        # the new cookies are bound to the user agent of the browser that logged in
+        session.user_agent = snapshot.user_agent
+        return snapshot.cookie_dict
+
+    async def get_specified_awemes(self):
+        """
+        Get the information and comments of the specified post
+        fetchers and store workers are connected by a bounded queue, every detail is stored as soon as it arrives,
+        and fetchers pause when the store falls behind
+        """
+        aweme_ids = self.aweme_ids if self.aweme_ids is not None else config.DY_SPECIFIED_ID_LIST
+        self.progress = CrawlProgress(aweme_ids)
+        aweme_id_iter = iter(aweme_ids)
+        deadline = time.monotonic() + self.time_budget if self.time_budget else None
+        enable_comments = config.ENABLE_GET_COMMENTS if self.enable_comments is None else self.enable_comments
+        aweme_detail_queue: asyncio.Queue = asyncio.Queue(maxsize=config.STORE_QUEUE_SIZE)
+        # sub comment fan-out of all awemes shares one cap
+        sub_comment_semaphore = asyncio.Semaphore(config.MAX_SUB_COMMENT_CONCURRENCY_NUM)
+
+        async def fetch_worker():
+            # all fetch workers share the same id iterator, so memory does not grow with the id list
+            try:
+                for aweme_id in aweme_id_iter:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        # out of time budget, the awemes left are picked up by the next run
+                        break
+                    try:
+                        aweme_detail = await self.get_aweme_detail(aweme_id=aweme_id)
+                        if not aweme_detail:
+                            # the error is logged by get_aweme_detail, the aweme is retried by the next run
+                            self.progress.failed += 1
+                            continue
+                        self.progress.fetched += 1
+                        await aweme_detail_queue.put(aweme_detail)
+                        if enable_comments:
+                            await self.get_aweme_comments(aweme_id, sub_comment_semaphore)
+                    except SessionExpiredError:
+                        # no account left to crawl with, every following aweme would fail the same way
+                        raise
+                    except Exception as ex:
+                        # one bad aweme must not end the run, it stays unfinished and is retried by the next run
+                        self.progress.failed += 1
+                        utils.logger.error(
+                            f"[DouYinCrawler.get_specified_awemes] crawl aweme error, aweme_id:{aweme_id}, err: {ex!r}"
+                        )
+                        continue
+                    self.progress.completed_ids.add(aweme_id)
+            finally:
+                # every worker holds its own sticky proxy lease, give it back to the pool
+                self.dy_client.release_proxy_lease()
+
+        async def store_worker():
+            while True:
+                aweme_detail = await aweme_detail_queue.get()
+                try:
+                    await douyin_store.update_douyin_aweme(aweme_detail)
+                    self.progress.stored += 1
+                except Exception as ex:
+                    utils.logger.error(
+                        f"[DouYinCrawler.get_specified_awemes] store aweme error, aweme_id:{aweme_detail.get('aweme_id')}, err: {ex}"
+                    )
+                finally:
+                    aweme_detail_queue.task_done()
+
+        store_tasks = [asyncio.create_task(store_worker()) for _ in range(config.MAX_STORE_CONCURRENCY_NUM)]
+        fetch_tasks = [asyncio.create_task(fetch_worker()) for _ in range(self.get_fetch_concurrency())]
+        try:
+            # if one fetcher fails its siblings are cancelled and awaited, so none of them is left
+            # blocked on the full queue after the store workers are gone
+            try:
+                await asyncio.wait(fetch_tasks, return_when=asyncio.FIRST_EXCEPTION)
+            finally:
+                for task in fetch_tasks:
+                    task.cancel()
+                results = await asyncio.gather(*fetch_tasks, return_exceptions=True)
+            errors = [
+                result for result in results
+                if isinstance(result, BaseException) and not isinstance(result, asyncio.CancelledError)
+            ]
+            for error in errors[1:]:
+                utils.logger.error(f"[DouYinCrawler.get_specified_awemes] another fetch worker failed, err: {error!r}")
+            if errors:
+                # callers handle the error of the first failed fetcher
+                raise errors[0]
+        finally:
+            # make sure everything already fetched is persisted before leaving
+            await aweme_detail_queue.join()
+            for task in store_tasks:
+                task.cancel()
+            await asyncio.gather(*store_tasks, return_exceptions=True)
+
+    def get_fetch_concurrency(self) -> int:
+        """
+        number of fetch workers, scales with the proxy pool size when requests rotate over the pool
+        """
+        if self.ip_proxy_pool is None:
+            return config.MAX_CONCURRENCY_NUM
+        return max(config.MAX_CONCURRENCY_NUM, config.IP_PROXY_POOL_COUNT * config.PROXY_CONCURRENCY_PER_IP)
+
+    async def get_aweme_comments(self, aweme_id: str, sub_comment_semaphore: Optional[asyncio.Semaphore] = None):
+        """
+        Stream the comments of the aweme, every page goes to the store as soon as it arrives
+        with the watermark enabled, paging stops at the first page whose comments were all crawled before
+        """
+        watermark = await self.get_comment_watermark(aweme_id)
+        utils.logger.info(
+            f"[DouYinCrawler.get_aweme_comments] begin get aweme id:{aweme_id} comments, "
+            f"incremental:{bool(watermark and watermark.is_incremental)} ..."
+        )
+        try:
+            async for comments in self.dy_client.iter_aweme_all_comments(
+                aweme_id,
+                crawl_interval=config.COMMENT_CRAWL_INTERVAL,
+                is_fetch_sub_comments=config.ENABLE_GET_SUB_COMMENTS,
+                max_sub_comment_fanout=config.MAX_SUB_COMMENT_FANOUT,
+                sub_comment_semaphore=sub_comment_semaphore,
+                watermark=watermark,
+            ):
+                await douyin_store.batch_update_dy_aweme_comments(aweme_id, comments)
+                if watermark:
+                    # the watermark only moves past pages that are stored
+                    watermark.commit(comments)
+                self.progress.comments += len(comments)
+        except SessionExpiredError:
+            raise
+        except DataFetchError as ex:
+            utils.logger.error(
+                f"[DouYinCrawler.get_aweme_comments] get aweme id:{aweme_id} comments error: {ex}"
+            )
+        finally:
+            if watermark:
+                # an unfinished crawl keeps completed False, the next run resumes from last_cursor
+                await self.comment_watermark_store.save(watermark.to_dict())
+
+    async def get_comment_watermark(self, aweme_id: str) -> Optional[CommentWatermark]:
+        """Load the comment watermark of the aweme, a full rescan starts from an empty watermark"""
+        if not config.ENABLE_COMMENT_WATERMARK:
+            return None
+        watermark_item = await self.comment_watermark_store.get(aweme_id)
+        if not watermark_item or config.COMMENT_FULL_RESCAN:
+            return CommentWatermark(aweme_id)
+        return CommentWatermark.from_dict(watermark_item)
+
+    async def get_aweme_detail(self, aweme_id: str) -> Any:
+        """Get note detail"""
+        try:
+            return await self.dy_client.get_video_by_id(aweme_id)
+        except SessionExpiredError:
+            # no account left, ends the run instead of failing every aweme
+            raise
+        except DataFetchError as ex:
+            utils.logger.error(
+                f"[DouYinCrawler.get_aweme_detail] Get aweme detail error: {ex}"
+            )
+            return None
+        except KeyError as ex:
+            utils.logger.error(
+                f"[DouYinCrawler.get_aweme_detail] have not fund note detail aweme_id:{aweme_id}, err: {ex}"
+            )
+            return None
 
     @staticmethod
     def format_proxy_info(
@@ -143,38 +566,56 @@ class DouYinCrawler(AbstractCrawler):
             },
             playwright_page=self.context_page,
             cookie_dict=cookie_dict,
+            proxy_pool=self.ip_proxy_pool,
+            session_refresher=self.refresh_session,
+            shared_resources=self.client_resources,
         )
         return douyin_client
 
+    async def create_douyin_client_from_cookies(self, cookie_str: str) -> DOUYINClient:
+        """Create douyin client straight from stored cookies, no browser is launched"""
+        return DOUYINClient(
+            headers={
+                "User-Agent": self.user_agent,
+                "Cookie": cookie_str,
+                "Host": "www.douyin.com",
+                "Origin": "https://www.douyin.com/",
+                "Referer": "https://www.douyin.com/",
+                "Content-Type": "application/json;charset=UTF-8",
+            },
+            playwright_page=None,
+            cookie_dict=utils.convert_str_cookie_to_dict(cookie_str),
+            proxy_pool=self.ip_proxy_pool,
+            session_refresher=self.refresh_session,
+            shared_resources=self.client_resources,
+            session_pool=self.session_pool,
+        )
+
     async def launch_browser(
         self,
-        chromium: BrowserType,
+        chromium: "BrowserType",
         playwright_proxy: Optional[Dict],
         user_agent: Optional[str],
         headless: bool = True,
-    ) -> BrowserContext:
-        """Launch browser and create browser context"""
-        if config.SAVE_LOGIN_STATE:
-            user_data_dir = os.path.join(
-                os.getcwd(), "browser_data", config.USER_DATA_DIR % self.platform
-            )  # type: ignore
-            browser_context = await chromium.launch_persistent_context(
-                user_data_dir=user_data_dir,
-                accept_downloads=True,
-                headless=headless,
-                proxy=playwright_proxy,  # type: ignore
-                viewport={"width": 1920, "height": 1080},
-                user_agent=user_agent,
-            )  # type: ignore
-            return browser_context
-        else:
-            browser = await chromium.launch(headless=headless, proxy=playwright_proxy)  # type: ignore
-            browser_context = await browser.new_context(
-                viewport={"width": 1920, "height": 1080}, user_agent=user_agent
-            )
-            return browser_context
+        storage_state: Optional[Dict] = None,
+    ) -> "BrowserContext":
+        """Launch browser and create browser context, storage_state restores a saved session into a fresh context"""
+        return await launch_browser_context(
+            chromium, playwright_proxy, user_agent, headless=headless, storage_state=storage_state, platform=self.platform
+        )
 
     async def close(self) -> None:
-        """Close browser context"""
-        await self.browser_context.close()
-        utils.logger.info("[DouYinCrawler.close] Browser context closed ...")
+        """
+        Flush the store and release the douyin client, the browser context goes back to the browser pool,
+        the store raises when items were dropped after failed flushes, the rest is released anyway
+        """
+        try:
+            await douyin_store.close_douyin_store()
+        finally:
+            if self.session_pool:
+                await self.session_pool.close()
+            await self.dy_client.aclose()
+            if self.ip_proxy_pool:
+                utils.logger.info(f"[DouYinCrawler.close] {self.ip_proxy_pool.stats}")
+                await self.ip_proxy_pool.close()
+            utils.logger.info("[DouYinCrawler.close] Douyin crawler closed ...")
@@ -7,3 +7,15 @@ class DataFetchError(RequestError):
 
 class IPBlockError(RequestError):
     """fetch so fast that the server block us ip"""
+
+
+class SignError(Exception):
+    """something error when sign the request params"""
+
+
+class CircuitOpenError(DataFetchError):
+    """the target is unhealthy, the request fails fast without being sent"""
+
+
+class SessionExpiredError(DataFetchError):
+    """no logged-in session is left in the session pool"""
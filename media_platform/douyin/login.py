@@ -1,24 +1,24 @@
 import asyncio
 import functools
 import sys
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
-import redis
-from playwright.async_api import BrowserContext, Page
-from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 from tenacity import RetryError, retry, retry_if_result, stop_after_attempt, wait_fixed
 
 import config
 from base.base_crawler import AbstractLogin
 from tools import utils
 
+if TYPE_CHECKING:
+    from playwright.async_api import BrowserContext, Page
+
 
 class DouYinLogin(AbstractLogin):
     def __init__(
         self,
         login_type: str,
-        browser_context: BrowserContext,  # type: ignore
-        context_page: Page,  # type: ignore
+        browser_context: "BrowserContext",  # type: ignore
+        context_page: "Page",  # type: ignore
         login_phone: Optional[str] = "",
         cookie_str: Optional[str] = "",
     ):
@@ -146,6 +146,8 @@ class DouYinLogin(AbstractLogin):
 
         # 检查是否有滑动验证码
         await self.check_page_display_slider(move_step=10, slider_level="easy")
+        import redis
+
         redis_obj = redis.Redis(host=config.REDIS_DB_HOST, password=config.REDIS_DB_PWD)
         max_get_sms_code_time = 60 * 2  # 最长获取验证码的时间为2分钟
         while max_get_sms_code_time > 0:
@@ -178,6 +180,8 @@ class DouYinLogin(AbstractLogin):
         检查页面是否出现滑动验证码
         :return:
         """
+        from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
         # 等待滑动验证码的出现
         back_selector = "#captcha-verify-image"
         try:
@@ -0,0 +1,81 @@
+import asyncio
+import time
+from typing import TYPE_CHECKING, Dict, Optional
+
+import config
+from tools import utils
+
+if TYPE_CHECKING:
+    from playwright.async_api import Frame, Page
+
+
+class DouYinPageStateCache:
+    def __init__(self, page: Optional["Page"], ttl: Optional[float] = None):
+        """
+        页面状态(localStorage、cookies)的内存快照，过期或者页面发生跳转之后才重新从浏览器读取，
+        请求的热路径上不再和浏览器做 IPC 通信
+        Args:
+            page: playwright 页面对象，为空时(没有启动浏览器)快照始终为空
+            ttl: 快照的有效期(秒)，默认取 config.DY_PAGE_STATE_TTL
+        """
+        self.page = page
+        self.ttl = ttl if ttl is not None else config.DY_PAGE_STATE_TTL
+        self._local_storage: Dict[str, str] = {}
+        self._cookie_dict: Dict[str, str] = {}
+        self._refreshed_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        if page is not None:
+            page.on("framenavigated", self._on_frame_navigated)
+
+    def _on_frame_navigated(self, frame: "Frame") -> None:
+        if self.page is not None and frame == self.page.main_frame:
+            self.invalidate()
+
+    def invalidate(self) -> None:
+        """让快照失效，下次读取时重新从浏览器获取"""
+        self._refreshed_at = None
+
+    @property
+    def is_expired(self) -> bool:
+        if self.page is None:
+            return False
+        return self._refreshed_at is None or time.monotonic() - self._refreshed_at > self.ttl
+
+    async def refresh(self) -> None:
+        """
+        从浏览器重新读取 localStorage 和 cookies
+        :return:
+        """
+        if self.page is None:
+            return
+        try:
+            self._local_storage = await self.page.evaluate("() => window.localStorage")
+            _, self._cookie_dict = utils.convert_cookies(await self.page.context.cookies())
+        except Exception as e:
+            # 页面已经关闭或者正在跳转，继续使用旧的快照，等下一个有效期再重试
+            utils.logger.error(f"[DouYinPageStateCache.refresh] refresh page state error: {e}")
+        self._refreshed_at = time.monotonic()
+
+    async def _ensure_fresh(self) -> None:
+        if not self.is_expired:
+            return
+        async with self._lock:
+            if self.is_expired:
+                await self.refresh()
+
+    async def get_local_storage(self) -> Dict[str, str]:
+        await self._ensure_fresh()
+        return self._local_storage
+
+    async def get_cookie_dict(self) -> Dict[str, str]:
+        await self._ensure_fresh()
+        return self._cookie_dict
+
+    async def get_ms_token(self) -> str:
+        """msToken 优先取 localStorage 中的 xmst，没有的话取 cookies 中的 msToken"""
+        ms_token = (await self.get_local_storage()).get("xmst")
+        return ms_token or self._cookie_dict.get("msToken", "")
+
+    async def get_web_id(self) -> str:
+        """webid 取 cookies 中的 webid，页面没有写入时为空"""
+        return (await self.get_cookie_dict()).get("webid", "")
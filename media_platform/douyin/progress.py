@@ -0,0 +1,61 @@
+import time
+from typing import Dict, List, Optional, Set
+
+
+class CrawlProgress:
+    def __init__(self, aweme_ids: Optional[List[str]] = None):
+        """
+        一次抓取任务的进度：每个视频抓完详情和评论后记为完成，没有完成的视频由调度器带到下一次任务
+        Args:
+            aweme_ids: 本次任务要抓取的视频ID列表
+        """
+        self.aweme_ids = aweme_ids or []
+        self.total = len(self.aweme_ids)
+        self.fetched = 0
+        self.failed = 0
+        self.stored = 0
+        self.comments = 0
+        self.completed_ids: Set[str] = set()
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def completed(self) -> int:
+        return len(self.completed_ids)
+
+    @property
+    def duration(self) -> float:
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        """每秒完成的视频数"""
+        return self.completed / self.duration if self.duration > 0 else 0.0
+
+    def get_unfinished_ids(self) -> List[str]:
+        return [aweme_id for aweme_id in self.aweme_ids if aweme_id not in self.completed_ids]
+
+    def finish(self) -> None:
+        if self.finished_at is None:
+            self.finished_at = time.time()
+
+    def to_dict(self) -> Dict:
+        return {
+            "total": self.total,
+            "completed": self.completed,
+            "fetched": self.fetched,
+            "failed": self.failed,
+            "stored": self.stored,
+            "comments": self.comments,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "duration": round(self.duration, 3),
+            "throughput": round(self.throughput, 3),
+        }
+
+    def __repr__(self) -> str:
+        return (
+            f"CrawlProgress(total={self.total}, completed={self.completed}, fetched={self.fetched}, "
+            f"failed={self.failed}, stored={self.stored}, comments={self.comments}, "
+            f"duration={self.duration:.1f}s, throughput={self.throughput:.2f}/s)"
+        )
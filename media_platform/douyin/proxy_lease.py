@@ -0,0 +1,93 @@
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from proxy.proxy_ip_pool import ProxyIpPool, get_proxy_key
+from proxy.types import IpInfoModel
+
+
+def format_httpx_proxy(ip_proxy_info: IpInfoModel) -> Dict[str, str]:
+    return {
+        f"{ip_proxy_info.protocol}": f"http://{ip_proxy_info.user}:{ip_proxy_info.password}@{ip_proxy_info.ip}:{ip_proxy_info.port}"
+    }
+
+
+class ProxyLease:
+    """从代理池租用的一个 IP，粘性会话内的多个请求共用"""
+
+    def __init__(self, manager: "ProxyLeaseManager", proxy: IpInfoModel, remaining: int):
+        self.manager = manager
+        self.proxy = proxy
+        self.key = get_proxy_key(proxy)
+        self.proxies = format_httpx_proxy(proxy)
+        self.remaining = remaining
+        self.released = False
+
+
+# 每个协程(task)各自持有自己的租约，并发的抓取协程不会挤在同一个 IP 上
+_proxy_lease_var: ContextVar[Optional[ProxyLease]] = ContextVar("douyin_proxy_lease", default=None)
+
+
+class ProxyLeaseManager:
+    def __init__(self, pool: ProxyIpPool, sticky_requests: int = 1):
+        """
+        按请求或者按粘性会话从代理池租用 IP，用完之后带着请求结果归还
+        Args:
+            pool: 代理池
+            sticky_requests: 一个 IP 连续使用的请求数，1 表示每个请求都重新租用
+        """
+        self.pool = pool
+        self.sticky_requests = max(sticky_requests, 1)
+
+    async def lease(self) -> ProxyLease:
+        """
+        获取当前协程可用的租约，粘性会话用完、IP 被隔离或者上次请求失败时换一个 IP
+        :return:
+        """
+        lease = _proxy_lease_var.get()
+        if lease is not None and lease.manager is self and not lease.released:
+            if lease.remaining > 0 and self.pool.is_available(lease.proxy):
+                lease.remaining -= 1
+                return lease
+            self.release(lease)
+        lease = ProxyLease(self, await self.pool.acquire(), self.sticky_requests - 1)
+        _proxy_lease_var.set(lease)
+        return lease
+
+    def report(self, lease: ProxyLease, success: bool, latency: Optional[float] = None) -> None:
+        """
+        上报请求结果，会话用完或者请求失败时归还 IP
+        :param lease:
+        :param success: 请求是否成功
+        :param latency: 请求耗时(秒)
+        :return:
+        """
+        if lease.released:
+            self.pool.report(lease.proxy, success, latency)
+            return
+        if lease.remaining > 0 and success:
+            self.pool.report(lease.proxy, success, latency)
+            return
+        lease.released = True
+        self.pool.release(lease.proxy, success, latency)
+
+    def release(self, lease: Optional[ProxyLease] = None) -> None:
+        """
+        提前结束租约，默认结束当前协程的租约
+        :param lease:
+        :return:
+        """
+        lease = lease or _proxy_lease_var.get()
+        if lease is None or lease.manager is not self or lease.released:
+            return
+        lease.released = True
+        self.pool.release(lease.proxy)
+        if _proxy_lease_var.get() is lease:
+            _proxy_lease_var.set(None)
+
+    @staticmethod
+    def detach() -> None:
+        """
+        新建的协程会继承父协程的租约，先断开，让它租用自己的 IP，父协程的租约不受影响
+        :return:
+        """
+        _proxy_lease_var.set(None)
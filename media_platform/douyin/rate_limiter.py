@@ -0,0 +1,196 @@
+import asyncio
+import time
+from typing import Dict, Optional
+
+import config
+
+ENDPOINT_DETAIL = "detail"
+ENDPOINT_COMMENTS = "comments"
+ENDPOINT_SEARCH = "search"
+ENDPOINT_DEFAULT = "default"
+
+ENDPOINT_URIS = {
+    "/aweme/v1/web/aweme/detail/": ENDPOINT_DETAIL,
+    "/aweme/v1/web/comment/list/": ENDPOINT_COMMENTS,
+    "/aweme/v1/web/comment/list/reply/": ENDPOINT_COMMENTS,
+    "/aweme/v1/web/general/search/single/": ENDPOINT_SEARCH,
+}
+
+OUTCOME_OK = "ok"
+OUTCOME_EMPTY = "empty"
+OUTCOME_BLOCKED = "blocked"
+OUTCOME_ERROR = "error"
+
+
+def get_endpoint_name(uri: str) -> str:
+    return ENDPOINT_URIS.get(uri, ENDPOINT_DEFAULT)
+
+
+def classify_response(res: Optional[Dict]) -> str:
+    """
+    根据响应内容判断请求结果，空响应和非 0 的 status_code 都视为被限流的信号
+    :param res:
+    :return:
+    """
+    if not res:
+        return OUTCOME_EMPTY
+    if res.get("status_code") not in (None, 0):
+        return OUTCOME_BLOCKED
+    return OUTCOME_OK
+
+
+class TokenBucket:
+    def __init__(self, rate: float):
+        """
+        令牌桶，桶的容量为 1 秒的令牌数，允许短时间的突发
+        Args:
+            rate: 每秒生成的令牌数
+        """
+        self.rate = rate
+        self._tokens = 1.0
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @property
+    def capacity(self) -> float:
+        return max(self.rate, 1.0)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def set_rate(self, rate: float) -> None:
+        self._refill()
+        self.rate = rate
+        self._tokens = min(self._tokens, self.capacity)
+
+    async def acquire(self) -> None:
+        # 加锁保证先到先得，等待中的请求按顺序拿到令牌
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class EndpointRateState:
+    """单个接口的令牌桶和统计信息"""
+
+    def __init__(self, rate: float):
+        self.bucket = TokenBucket(rate)
+        self.latency_ewma: Optional[float] = None
+        self.failure_ewma = 0.0
+        self.last_decrease_at = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.increases = 0
+        self.decreases = 0
+
+    def __repr__(self) -> str:
+        return (
+            f"EndpointRateState(rate={self.bucket.rate:.2f}/s, requests={self.requests}, failures={self.failures}, "
+            f"increases={self.increases}, decreases={self.decreases}, failure_ewma={self.failure_ewma:.2f}, "
+            f"latency_ewma={(self.latency_ewma or 0) * 1000:.0f}ms)"
+        )
+
+
+class AdaptiveRateController:
+    def __init__(
+            self,
+            enabled: Optional[bool] = None,
+            initial_rate: Optional[float] = None,
+            min_rate: Optional[float] = None,
+            max_rate: Optional[float] = None,
+            additive_increase: Optional[float] = None,
+            decrease_factor: Optional[float] = None,
+            latency_threshold: Optional[float] = None,
+            failure_rate_threshold: Optional[float] = None,
+            decrease_cooldown: float = 1.0,
+            ewma_alpha: float = 0.2,
+    ):
+        """
+        按接口(详情、评论、搜索)分别限速的自适应速率控制器(AIMD)：
+        接口健康时每秒的请求数缓慢线性增长，延迟升高、空响应/被限流/请求失败的比例升高时成倍下降
+        Args:
+            enabled: 是否开启，关闭时 acquire 不做任何等待，默认取 config.ENABLE_RATE_CONTROL
+            initial_rate: 每个接口的初始速率(次/秒)，默认取 config.RATE_CONTROL_INITIAL_QPS
+            min_rate: 速率下限，默认取 config.RATE_CONTROL_MIN_QPS
+            max_rate: 速率上限，默认取 config.RATE_CONTROL_MAX_QPS
+            additive_increase: 接口健康时每秒大约增加的速率，默认取 config.RATE_CONTROL_INCREASE
+            decrease_factor: 接口异常时速率乘以的系数，默认取 config.RATE_CONTROL_DECREASE_FACTOR
+            latency_threshold: 平均延迟超过该秒数时降速，默认取 config.RATE_CONTROL_LATENCY_THRESHOLD
+            failure_rate_threshold: 失败比例(指数加权平均)超过该值时降速，默认取 config.RATE_CONTROL_FAILURE_RATE_THRESHOLD
+            decrease_cooldown: 两次降速之间的最小间隔(秒)，避免一批并发请求同时失败时速率被连续砍到底
+            ewma_alpha: 延迟和失败比例的指数加权平均系数
+        """
+        self.enabled = config.ENABLE_RATE_CONTROL if enabled is None else enabled
+        self.initial_rate = initial_rate or config.RATE_CONTROL_INITIAL_QPS
+        self.min_rate = min_rate or config.RATE_CONTROL_MIN_QPS
+        self.max_rate = max_rate or config.RATE_CONTROL_MAX_QPS
+        self.additive_increase = additive_increase or config.RATE_CONTROL_INCREASE
+        self.decrease_factor = decrease_factor or config.RATE_CONTROL_DECREASE_FACTOR
+        self.latency_threshold = latency_threshold or config.RATE_CONTROL_LATENCY_THRESHOLD
+        self.failure_rate_threshold = failure_rate_threshold or config.RATE_CONTROL_FAILURE_RATE_THRESHOLD
+        self.decrease_cooldown = decrease_cooldown
+        self.ewma_alpha = ewma_alpha
+        self.endpoints: Dict[str, EndpointRateState] = {}
+
+    def get_state(self, endpoint: str) -> EndpointRateState:
+        if endpoint not in self.endpoints:
+            self.endpoints[endpoint] = EndpointRateState(self.initial_rate)
+        return self.endpoints[endpoint]
+
+    def get_rate(self, endpoint: str) -> float:
+        return self.get_state(endpoint).bucket.rate
+
+    def discard(self, endpoint: str) -> None:
+        """不再使用的限速状态(比如已经下线的代理)直接删掉"""
+        self.endpoints.pop(endpoint, None)
+
+    async def acquire(self, endpoint: str) -> None:
+        """
+        请求之前拿一个令牌，速率超出时在这里等待
+        :param endpoint: 接口名称
+        :return:
+        """
+        if not self.enabled:
+            return
+        await self.get_state(endpoint).bucket.acquire()
+
+    def record(self, endpoint: str, latency: float, outcome: str) -> None:
+        """
+        记录一次请求的结果，并调整接口的速率
+        :param endpoint: 接口名称
+        :param latency: 请求耗时(秒)
+        :param outcome: 请求结果 ok | empty | blocked | error
+        :return:
+        """
+        if not self.enabled:
+            return
+        state = self.get_state(endpoint)
+        failed = outcome != OUTCOME_OK
+        state.requests += 1
+        state.failures += int(failed)
+        state.failure_ewma = self.ewma_alpha * failed + (1 - self.ewma_alpha) * state.failure_ewma
+        if state.latency_ewma is None:
+            state.latency_ewma = latency
+        else:
+            state.latency_ewma = self.ewma_alpha * latency + (1 - self.ewma_alpha) * state.latency_ewma
+
+        rate = state.bucket.rate
+        if state.failure_ewma > self.failure_rate_threshold or state.latency_ewma > self.latency_threshold:
+            now = time.monotonic()
+            if now - state.last_decrease_at >= self.decrease_cooldown and rate > self.min_rate:
+                state.bucket.set_rate(max(self.min_rate, rate * self.decrease_factor))
+                state.last_decrease_at = now
+                state.decreases += 1
+        elif not failed and rate < self.max_rate:
+            # 每次成功增加 increase / rate，按当前速率发请求时每秒大约增加 increase
+            state.bucket.set_rate(min(self.max_rate, rate + self.additive_increase / rate))
+            state.increases += 1
+
+    def __repr__(self) -> str:
+        return f"AdaptiveRateController({self.endpoints})"
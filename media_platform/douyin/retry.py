@@ -0,0 +1,153 @@
+import random
+import time
+from typing import Dict, Optional
+
+import config
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class RetryPolicy:
+    def __init__(
+            self,
+            max_retries: Optional[int] = None,
+            base_delay: Optional[float] = None,
+            max_delay: Optional[float] = None,
+    ):
+        """
+        指数退避的重试策略，等待时间使用 full jitter，避免大量请求在同一时刻重试
+        Args:
+            max_retries: 单个请求最多重试的次数，默认取 config.REQUEST_MAX_RETRIES
+            base_delay: 第一次重试等待时间的上限(秒)，默认取 config.REQUEST_RETRY_BASE_DELAY
+            max_delay: 等待时间的上限(秒)，默认取 config.REQUEST_RETRY_MAX_DELAY
+        """
+        self.max_retries = config.REQUEST_MAX_RETRIES if max_retries is None else max_retries
+        self.base_delay = config.REQUEST_RETRY_BASE_DELAY if base_delay is None else base_delay
+        self.max_delay = config.REQUEST_RETRY_MAX_DELAY if max_delay is None else max_delay
+
+    def get_backoff(self, retry_no: int) -> float:
+        """
+        第 retry_no 次重试(从 0 开始)之前需要等待的秒数
+        :param retry_no:
+        :return:
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry_no))
+
+
+class RetryBudget:
+    def __init__(self, ratio: Optional[float] = None, min_retries: Optional[int] = None):
+        """
+        一次抓取任务的重试预算：重试次数不超过 min_retries + ratio * 请求数，
+        上游整体故障时不会因为重试把请求量放大好几倍
+        Args:
+            ratio: 允许重试的请求比例，默认取 config.REQUEST_RETRY_BUDGET_RATIO
+            min_retries: 请求量很少时也允许的重试次数，默认取 config.REQUEST_RETRY_BUDGET_MIN
+        """
+        self.ratio = config.REQUEST_RETRY_BUDGET_RATIO if ratio is None else ratio
+        self.min_retries = config.REQUEST_RETRY_BUDGET_MIN if min_retries is None else min_retries
+        self.requests = 0
+        self.retries = 0
+
+    def record_request(self) -> None:
+        self.requests += 1
+
+    def try_acquire(self) -> bool:
+        if self.retries >= self.min_retries + self.ratio * self.requests:
+            return False
+        self.retries += 1
+        return True
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: Optional[int] = None, recovery_timeout: Optional[float] = None):
+        """
+        熔断器：连续失败达到阈值后熔断，熔断期间的请求直接失败，
+        recovery_timeout 之后放一个探测请求过去，成功则恢复，失败则继续熔断
+        Args:
+            name: 熔断器名称，例如 endpoint:detail、proxy:direct
+            failure_threshold: 连续失败多少次后熔断，默认取 config.CIRCUIT_BREAKER_FAILURE_THRESHOLD
+            recovery_timeout: 熔断持续的秒数，默认取 config.CIRCUIT_BREAKER_RECOVERY_TIMEOUT
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold or config.CIRCUIT_BREAKER_FAILURE_THRESHOLD
+        self.recovery_timeout = config.CIRCUIT_BREAKER_RECOVERY_TIMEOUT if recovery_timeout is None else recovery_timeout
+        self.state = CIRCUIT_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_started_at: Optional[float] = None
+
+    def allow_request(self) -> bool:
+        now = time.monotonic()
+        if self.state == CIRCUIT_OPEN:
+            if now - self.opened_at < self.recovery_timeout:
+                return False
+            self.state = CIRCUIT_HALF_OPEN
+        if self.state == CIRCUIT_HALF_OPEN:
+            # 同一时刻只放一个探测请求，探测请求被取消没有结果时，超时后再放下一个
+            if self.probe_started_at is not None and now - self.probe_started_at < self.recovery_timeout:
+                return False
+            self.probe_started_at = now
+        return True
+
+    def release_probe(self) -> None:
+        """allow_request 放行之后请求没有发出去(比如被另一个熔断器拒绝)，把探测名额还回去，下一个请求可以立即探测"""
+        if self.state == CIRCUIT_HALF_OPEN:
+            self.probe_started_at = None
+
+    def record_success(self) -> None:
+        self.state = CIRCUIT_CLOSED
+        self.consecutive_failures = 0
+        self.probe_started_at = None
+
+    def record_failure(self) -> bool:
+        """
+        记录一次失败
+        :return: 这次失败是否导致熔断
+        """
+        self.consecutive_failures += 1
+        if self.state == CIRCUIT_HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            opened = self.state != CIRCUIT_OPEN
+            self.state = CIRCUIT_OPEN
+            self.opened_at = time.monotonic()
+            self.probe_started_at = None
+            return opened
+        return False
+
+
+class RetryStats:
+    """重试和熔断的计数器"""
+
+    def __init__(self):
+        self.requests = 0
+        self.attempts = 0
+        self.retries = 0
+        self.retry_successes = 0
+        self.give_ups = 0
+        self.budget_exhausted = 0
+        self.circuit_opened = 0
+        self.circuit_rejected = 0
+
+    def __repr__(self) -> str:
+        return (
+            f"RetryStats(requests={self.requests}, attempts={self.attempts}, retries={self.retries}, "
+            f"retry_successes={self.retry_successes}, give_ups={self.give_ups}, "
+            f"budget_exhausted={self.budget_exhausted}, circuit_opened={self.circuit_opened}, "
+            f"circuit_rejected={self.circuit_rejected})"
+        )
+
+
+class CircuitBreakerRegistry:
+    def __init__(self, failure_threshold: Optional[int] = None, recovery_timeout: Optional[float] = None):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, name: str) -> CircuitBreaker:
+        if name not in self.breakers:
+            self.breakers[name] = CircuitBreaker(name, self.failure_threshold, self.recovery_timeout)
+        return self.breakers[name]
+
+    def discard(self, name: str) -> None:
+        self.breakers.pop(name, None)
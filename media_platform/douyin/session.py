@@ -0,0 +1,95 @@
+import time
+from typing import Dict, List, Optional
+
+# 快照格式变化时加一，旧版本的快照直接丢弃
+SESSION_SNAPSHOT_VERSION = 1
+
+# 判断登录状态的 cookie
+LOGIN_COOKIE_NAMES = ("sessionid", "LOGIN_STATUS")
+
+
+class SessionSnapshot:
+    def __init__(
+            self,
+            storage_state: Dict,
+            user_agent: str = "",
+            created_at: Optional[float] = None,
+            expires_at: Optional[float] = None,
+            version: int = SESSION_SNAPSHOT_VERSION,
+    ):
+        """
+        登录之后的会话快照：playwright storage_state(cookies + localStorage)
+        Args:
+            storage_state: BrowserContext.storage_state() 的返回值
+            user_agent: 登录时使用的 User-Agent，恢复时保持一致
+            created_at: 快照创建时间
+            expires_at: 快照过期时间，为空时由 create 按有效期和登录 cookie 的过期时间计算
+            version: 快照格式版本
+        """
+        self.storage_state = storage_state
+        self.user_agent = user_agent
+        self.created_at = created_at or time.time()
+        self.expires_at = expires_at
+        self.version = version
+
+    @classmethod
+    def create(cls, storage_state: Dict, user_agent: str, ttl: float) -> "SessionSnapshot":
+        """
+        创建快照，有效期不超过 ttl，也不超过登录 cookie 本身的过期时间
+        :param storage_state:
+        :param user_agent:
+        :param ttl: 快照有效期(秒)
+        :return:
+        """
+        now = time.time()
+        expires_at = now + ttl
+        for cookie in storage_state.get("cookies", []):
+            # expires 为 -1 表示会话 cookie
+            if cookie.get("name") in LOGIN_COOKIE_NAMES and cookie.get("expires", -1) > 0:
+                expires_at = min(expires_at, cookie["expires"])
+        return cls(storage_state=storage_state, user_agent=user_agent, created_at=now, expires_at=expires_at)
+
+    @classmethod
+    def from_dict(cls, item: Dict) -> "SessionSnapshot":
+        return cls(
+            storage_state=item.get("storage_state", {}),
+            user_agent=item.get("user_agent", ""),
+            created_at=item.get("created_at"),
+            expires_at=item.get("expires_at"),
+            version=item.get("version", 0),
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            "version": self.version,
+            "created_at": self.created_at,
+            "expires_at": self.expires_at,
+            "user_agent": self.user_agent,
+            "storage_state": self.storage_state,
+        }
+
+    @property
+    def cookies(self) -> List[Dict]:
+        return self.storage_state.get("cookies", [])
+
+    @property
+    def cookie_dict(self) -> Dict[str, str]:
+        return {cookie["name"]: cookie["value"] for cookie in self.cookies}
+
+    @property
+    def cookie_str(self) -> str:
+        return ";".join(f"{name}={value}" for name, value in self.cookie_dict.items())
+
+    @property
+    def is_expired(self) -> bool:
+        return self.expires_at is not None and time.time() >= self.expires_at
+
+    def is_valid(self) -> bool:
+        """
+        有效性检查：格式版本一致、没有过期、带着登录 cookie
+        :return:
+        """
+        if self.version != SESSION_SNAPSHOT_VERSION or self.is_expired:
+            return False
+        cookie_dict = self.cookie_dict
+        return cookie_dict.get("LOGIN_STATUS") == "1" or bool(cookie_dict.get("sessionid"))
@@ -0,0 +1,290 @@
+import asyncio
+import itertools
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+
+import config
+from tools import utils
+
+from .exception import SessionExpiredError
+from .rate_limiter import OUTCOME_BLOCKED, OUTCOME_ERROR
+
+
+class DouYinAccountSession:
+    def __init__(
+            self,
+            name: str,
+            cookie_dict: Dict[str, str],
+            user_agent: str = "",
+            proxies: Optional[Union[str, Dict[str, str]]] = None,
+            relogin_type: str = "",
+            login_phone: str = "",
+    ):
+        """
+        会话池里的一个登录账号
+        Args:
+            name: 账号名称，用于日志和按账号限速
+            cookie_dict: 登录后的 cookies
+            user_agent: 账号登录时使用的 User-Agent，为空时使用客户端默认的
+            proxies: 账号固定使用的代理，为空时按客户端的代理设置(代理池或者直连)
+            relogin_type: 登录失效后重新登录的方式 qrcode | phone，为空时失效的账号直接下线
+            login_phone: phone 方式重新登录使用的手机号
+        """
+        self.name = name
+        self.cookie_dict = cookie_dict
+        self.user_agent = user_agent
+        self.proxies = proxies
+        self.relogin_type = relogin_type
+        self.login_phone = login_phone
+        self.in_flight = 0
+        self.last_used = 0
+        self.requests = 0
+        self.errors = 0
+        self.blocked = 0
+        self.consecutive_errors = 0
+        # 连续被风控的次数，决定冷却时间的长短，达到上限后视为登录失效
+        self.strikes = 0
+        self.cooldown_until = 0.0
+        self.expired = False
+        self.relogin_task: Optional[asyncio.Task] = None
+
+    @property
+    def cookie_str(self) -> str:
+        return ";".join(f"{key}={value}" for key, value in self.cookie_dict.items())
+
+    @property
+    def is_logged_in(self) -> bool:
+        return self.cookie_dict.get("LOGIN_STATUS") == "1" or bool(self.cookie_dict.get("sessionid"))
+
+    @property
+    def can_relogin(self) -> bool:
+        """
+        只有真正能完成登录的方式才重新登录：扫码需要有界面的浏览器，手机号登录需要手机号(验证码从 redis 读取)
+        cookie 登录只会把失效的 cookies 原样加回去，不算
+        """
+        if self.relogin_type == "qrcode":
+            return not config.HEADLESS
+        if self.relogin_type == "phone":
+            return bool(self.login_phone)
+        return False
+
+    def is_cooling_down(self, now: Optional[float] = None) -> bool:
+        return (now or time.monotonic()) < self.cooldown_until
+
+    def is_available(self, now: Optional[float] = None) -> bool:
+        return not self.expired and not self.is_cooling_down(now)
+
+    def __repr__(self) -> str:
+        return (
+            f"DouYinAccountSession(name={self.name}, requests={self.requests}, errors={self.errors}, "
+            f"blocked={self.blocked}, expired={self.expired})"
+        )
+
+
+class SessionPoolStats:
+    """会话池的计数器"""
+
+    def __init__(self):
+        self.acquired = 0
+        self.waits = 0
+        self.cooldowns = 0
+        self.expired = 0
+        self.relogins = 0
+        self.relogin_failures = 0
+
+    def __repr__(self) -> str:
+        return (
+            f"SessionPoolStats(acquired={self.acquired}, waits={self.waits}, cooldowns={self.cooldowns}, "
+            f"expired={self.expired}, relogins={self.relogins}, relogin_failures={self.relogin_failures})"
+        )
+
+
+ReloginFunc = Callable[[DouYinAccountSession], Awaitable[Dict[str, str]]]
+
+
+class DouYinSessionPool:
+    def __init__(
+            self,
+            sessions: List[DouYinAccountSession],
+            relogin: Optional[ReloginFunc] = None,
+            cooldown_seconds: Optional[float] = None,
+            max_cooldown_seconds: Optional[float] = None,
+            max_strikes: Optional[int] = None,
+            max_consecutive_errors: Optional[int] = None,
+    ):
+        """
+        多账号会话池：请求按账号轮流发出，单个账号的限流不再是整体吞吐的上限
+        挑选当前在途请求最少、最久没用过的账号；被风控的账号按指数退避冷却，
+        连续被风控达到上限(登录失效)的账号在后台重新登录，登录期间不参与调度
+        Args:
+            sessions: 账号会话列表
+            relogin: 重新登录一个账号并返回新的 cookies，为空时失效的账号直接下线
+            cooldown_seconds: 第一次被风控的冷却时间(秒)，默认取 config.DY_SESSION_COOLDOWN_SECONDS
+            max_cooldown_seconds: 冷却时间上限(秒)，默认取 config.DY_SESSION_MAX_COOLDOWN_SECONDS
+            max_strikes: 连续被风控多少次视为登录失效，默认取 config.DY_SESSION_MAX_STRIKES
+            max_consecutive_errors: 连续请求失败多少次冷却一次，默认取 config.DY_SESSION_MAX_CONSECUTIVE_ERRORS
+        """
+        if not sessions:
+            raise ValueError("[DouYinSessionPool] at least one session is required")
+        self.sessions = sessions
+        self.relogin = relogin
+        self.cooldown_seconds = cooldown_seconds or config.DY_SESSION_COOLDOWN_SECONDS
+        self.max_cooldown_seconds = max_cooldown_seconds or config.DY_SESSION_MAX_COOLDOWN_SECONDS
+        self.max_strikes = max_strikes or config.DY_SESSION_MAX_STRIKES
+        self.max_consecutive_errors = max_consecutive_errors or config.DY_SESSION_MAX_CONSECUTIVE_ERRORS
+        self.stats = SessionPoolStats()
+        self._ticket = itertools.count(1)
+        self._changed = asyncio.Event()
+        # 重新登录要占用浏览器，同一时刻只登录一个账号
+        self._relogin_lock = asyncio.Lock()
+        self._closed = False
+        for session in sessions:
+            if not session.is_logged_in:
+                self._expire(session)
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def _pick(self, now: float) -> Optional[DouYinAccountSession]:
+        candidates = [session for session in self.sessions if session.is_available(now)]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda session: (session.in_flight, session.last_used))
+
+    def _next_wakeup(self, now: float) -> Optional[float]:
+        cooldowns = [
+            session.cooldown_until - now for session in self.sessions
+            if not session.expired and session.is_cooling_down(now)
+        ]
+        return min(cooldowns) if cooldowns else None
+
+    async def acquire(self) -> DouYinAccountSession:
+        """
+        取出一个可用的账号，所有账号都在冷却或者重新登录时等待，全部失效并且无法重新登录时抛出异常
+        :return:
+        """
+        while True:
+            if self._closed:
+                raise SessionExpiredError("[DouYinSessionPool.acquire] session pool is closed")
+            now = time.monotonic()
+            session = self._pick(now)
+            if session is not None:
+                session.in_flight += 1
+                session.last_used = next(self._ticket)
+                self.stats.acquired += 1
+                return session
+            relogin_pending = any(
+                session.relogin_task is not None and not session.relogin_task.done() for session in self.sessions
+            )
+            timeout = self._next_wakeup(now)
+            if timeout is None and not relogin_pending:
+                raise SessionExpiredError("[DouYinSessionPool.acquire] all sessions are expired")
+            self.stats.waits += 1
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def report(self, session: DouYinAccountSession, outcome: Optional[str]) -> None:
+        """
+        归还账号并上报请求结果，被风控时冷却，连续被风控达到上限时重新登录
+        :param session:
+        :param outcome: 请求结果 ok | empty | blocked | error，为空表示请求没有完成(比如被取消)
+        :return:
+        """
+        session.in_flight -= 1
+        if outcome is not None:
+            session.requests += 1
+        now = time.monotonic()
+        if outcome == OUTCOME_BLOCKED:
+            session.blocked += 1
+            # 冷却之前就发出去的并发请求陆续返回，不再重复计数
+            if not session.expired and not session.is_cooling_down(now):
+                session.strikes += 1
+                if session.strikes >= self.max_strikes:
+                    self._expire(session)
+                else:
+                    self._cool_down(session, self.cooldown_seconds * 2 ** (session.strikes - 1), now)
+        elif outcome == OUTCOME_ERROR:
+            session.errors += 1
+            session.consecutive_errors += 1
+            if session.consecutive_errors >= self.max_consecutive_errors:
+                session.consecutive_errors = 0
+                self._cool_down(session, self.cooldown_seconds, now)
+        elif outcome is not None:
+            session.consecutive_errors = 0
+            if not session.is_cooling_down(now):
+                session.strikes = 0
+        self._changed.set()
+
+    def _cool_down(self, session: DouYinAccountSession, seconds: float, now: float) -> None:
+        seconds = min(seconds, self.max_cooldown_seconds)
+        session.cooldown_until = max(session.cooldown_until, now + seconds)
+        self.stats.cooldowns += 1
+        utils.logger.info(f"[DouYinSessionPool._cool_down] session {session.name} cools down for {seconds:.0f}s")
+
+    def _expire(self, session: DouYinAccountSession) -> None:
+        session.expired = True
+        self.stats.expired += 1
+        utils.logger.warning(f"[DouYinSessionPool._expire] session {session.name} is expired")
+        if self.relogin is not None and not self._closed and session.can_relogin:
+            session.relogin_task = asyncio.create_task(self._relogin(session))
+        else:
+            utils.logger.warning(f"[DouYinSessionPool._expire] session {session.name} can not log in again, offline")
+
+    async def _relogin(self, session: DouYinAccountSession) -> None:
+        async with self._relogin_lock:
+            if self._closed:
+                return
+            try:
+                cookie_dict = await self.relogin(session)  # type: ignore
+            except Exception as e:
+                self.stats.relogin_failures += 1
+                utils.logger.error(
+                    f"[DouYinSessionPool._relogin] relogin session {session.name} failed, offline: {e}"
+                )
+                return
+            finally:
+                self._changed.set()
+            session.cookie_dict = cookie_dict
+            session.expired = False
+            session.strikes = 0
+            session.consecutive_errors = 0
+            session.cooldown_until = 0.0
+            self.stats.relogins += 1
+            utils.logger.info(f"[DouYinSessionPool._relogin] session {session.name} logged in again")
+
+    async def close(self) -> None:
+        """
+        取消还在进行的重新登录
+        :return:
+        """
+        self._closed = True
+        self._changed.set()
+        tasks = [session.relogin_task for session in self.sessions if session.relogin_task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        utils.logger.info(f"[DouYinSessionPool.close] {self.stats} {self.sessions}")
+
+
+def create_session_pool(accounts: List[Dict], relogin: Optional[ReloginFunc] = None) -> DouYinSessionPool:
+    """
+    根据配置创建会话池
+    :param accounts: config.DY_ACCOUNTS 格式的账号列表
+    :param relogin:
+    :return:
+    """
+    sessions = [
+        DouYinAccountSession(
+            name=account.get("name") or f"account_{index}",
+            cookie_dict=utils.convert_str_cookie_to_dict(account.get("cookies", "")),
+            user_agent=account.get("user_agent", ""),
+            proxies=account.get("proxy") or None,
+            relogin_type=account.get("relogin_type", ""),
+            login_phone=account.get("phone", ""),
+        )
+        for index, account in enumerate(accounts)
+    ]
+    return DouYinSessionPool(sessions, relogin=relogin)
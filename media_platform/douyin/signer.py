@@ -0,0 +1,204 @@
+import asyncio
+import json
+import shutil
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import config
+from tools import utils
+
+from . import xbogus
+from .exception import SignError
+
+DOUYIN_JS_PATH = "libs/douyin.js"
+SIGN_WORKER_JS_PATH = "libs/douyin_sign_worker.js"
+
+
+class AbstractDouYinSigner(ABC):
+    @abstractmethod
+    async def sign(self, query: str, user_agent: str, timestamp: Optional[int] = None) -> str:
+        """
+        计算请求参数的 X-Bogus 签名
+        :param query: 拼接好的请求参数 k1=v1&k2=v2
+        :param user_agent: 请求头中的 User-Agent
+        :param timestamp: 固定签名时间戳(秒)，默认为当前时间，主要用于不同实现之间的对比测试
+        :return:
+        """
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class DouYinJsSignWorker:
+    def __init__(self, js_path: str):
+        """
+        一个常驻的 node 签名进程，douyin.js 只在进程启动时加载一次
+        Args:
+            js_path: 签名脚本路径
+        """
+        self.js_path = js_path
+        self._process: Optional[asyncio.subprocess.Process] = None
+
+    @property
+    def is_alive(self) -> bool:
+        return self._process is not None and self._process.returncode is None
+
+    async def start(self) -> None:
+        self._process = await asyncio.create_subprocess_exec(
+            "node", SIGN_WORKER_JS_PATH, self.js_path,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            limit=1024 * 1024,
+        )
+
+    async def sign(self, query: str, user_agent: str, timestamp: Optional[int] = None) -> str:
+        if not self.is_alive:
+            await self.start()
+        req = {"query": query, "ua": user_agent}
+        if timestamp is not None:
+            req["ts"] = timestamp
+        payload = json.dumps(req, ensure_ascii=False) + "\n"
+        self._process.stdin.write(payload.encode("utf-8"))  # type: ignore
+        await self._process.stdin.drain()  # type: ignore
+        line = await self._process.stdout.readline()  # type: ignore
+        if not line:
+            await self._process.wait()  # type: ignore
+            raise SignError("[DouYinJsSignWorker.sign] sign worker exited unexpectedly")
+        res = json.loads(line)
+        if res.get("error"):
+            raise SignError(f"[DouYinJsSignWorker.sign] sign error: {res.get('error')}")
+        return res.get("x_bogus")
+
+    async def kill(self, timeout: float = 3) -> None:
+        """
+        立即杀掉进程，进程里可能还有没读取的响应时使用，下一次签名时重新拉起
+        等待进程退出并回收，避免僵尸进程越积越多
+        :param timeout: 等待进程退出的时间(秒)
+        :return:
+        """
+        process, self._process = self._process, None
+        if process is None or process.returncode is not None:
+            return
+        process.kill()
+        try:
+            await asyncio.wait_for(process.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            utils.logger.error(f"[DouYinJsSignWorker.kill] sign worker {process.pid} did not exit in {timeout}s")
+
+    async def close(self) -> None:
+        if not self.is_alive:
+            return
+        self._process.stdin.close()  # type: ignore
+        try:
+            await asyncio.wait_for(self._process.wait(), timeout=3)  # type: ignore
+        except asyncio.TimeoutError:
+            self._process.kill()  # type: ignore
+            await self._process.wait()  # type: ignore
+
+
+class DouYinJsSigner(AbstractDouYinSigner):
+    def __init__(self, pool_size: int, js_path: str = DOUYIN_JS_PATH, sign_timeout: float = 10):
+        """
+        node 签名进程池，每个进程同一时刻只处理一个签名请求，不阻塞事件循环
+        Args:
+            pool_size: 签名进程数量
+            js_path: 签名脚本路径
+            sign_timeout: 单次签名超时时间(秒)，超时的进程会被重启
+        """
+        self.sign_timeout = sign_timeout
+        self._workers: List[DouYinJsSignWorker] = [DouYinJsSignWorker(js_path) for _ in range(max(pool_size, 1))]
+        self._idle_workers: Optional[asyncio.Queue] = None
+
+    def _get_idle_workers(self) -> asyncio.Queue:
+        if self._idle_workers is None:
+            self._idle_workers = asyncio.Queue()
+            for worker in self._workers:
+                self._idle_workers.put_nowait(worker)
+        return self._idle_workers
+
+    async def start(self) -> None:
+        """
+        预先拉起所有签名进程，避免第一批请求承担进程启动的耗时
+        :return:
+        """
+        await asyncio.gather(*[worker.start() for worker in self._workers if not worker.is_alive])
+
+    async def sign(self, query: str, user_agent: str, timestamp: Optional[int] = None) -> str:
+        idle_workers = self._get_idle_workers()
+        worker: DouYinJsSignWorker = await idle_workers.get()
+        try:
+            return await asyncio.wait_for(worker.sign(query, user_agent, timestamp), timeout=self.sign_timeout)
+        except asyncio.TimeoutError:
+            # 进程里可能还残留着未读取的响应，直接重启掉
+            utils.logger.error("[DouYinJsSigner.sign] sign timeout, restart the sign worker ...")
+            await worker.kill()
+            raise SignError("[DouYinJsSigner.sign] sign timeout")
+        except (ConnectionError, OSError) as e:
+            await worker.kill()
+            raise SignError(f"[DouYinJsSigner.sign] sign worker broken, err: {e}")
+        except SignError:
+            # 响应已经完整读取，进程可以继续使用
+            raise
+        except BaseException:
+            # 被取消(或者响应解析失败)时响应可能还没读取，不杀掉的话下一个请求会读到这次的签名
+            await worker.kill()
+            raise
+        finally:
+            # 出错的进程已经被杀掉，放回去之后下一次签名重新拉起
+            idle_workers.put_nowait(worker)
+
+    async def close(self) -> None:
+        await asyncio.gather(*[worker.close() for worker in self._workers])
+
+
+class DouYinExecJsSigner(AbstractDouYinSigner):
+    def __init__(self, pool_size: int, js_path: str = DOUYIN_JS_PATH):
+        """
+        没有 node 环境时的兜底实现：脚本只编译一次，在线程池中调用 execjs 避免阻塞事件循环
+        Args:
+            pool_size: 线程数量
+            js_path: 签名脚本路径
+        """
+        import execjs
+
+        with open(js_path, encoding="utf-8") as f:
+            self._js_ctx = execjs.compile(f.read())
+        self._executor = ThreadPoolExecutor(max_workers=max(pool_size, 1), thread_name_prefix="douyin_sign")
+
+    async def sign(self, query: str, user_agent: str, timestamp: Optional[int] = None) -> str:
+        if timestamp is not None:
+            raise SignError("[DouYinExecJsSigner.sign] execjs signer not support fixed timestamp")
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._js_ctx.call, "sign", query, user_agent
+        )
+
+    async def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+class DouYinNativeSigner(AbstractDouYinSigner):
+    """纯 Python 实现的签名，不依赖 JS 运行时，也没有进程间通信的开销"""
+
+    async def sign(self, query: str, user_agent: str, timestamp: Optional[int] = None) -> str:
+        return xbogus.sign(query, user_agent, timestamp)
+
+
+def create_douyin_signer(sign_type: Optional[str] = None, pool_size: Optional[int] = None) -> AbstractDouYinSigner:
+    """
+    创建抖音签名服务
+    :param sign_type: js(douyin.js 常驻进程池) | native(纯 Python 实现)，默认取 config.DY_SIGN_TYPE
+    :param pool_size: 签名进程(线程)数量，默认取 config.MAX_CONCURRENCY_NUM
+    :return:
+    """
+    sign_type = sign_type or config.DY_SIGN_TYPE
+    pool_size = pool_size or config.MAX_CONCURRENCY_NUM
+    if sign_type == "native":
+        return DouYinNativeSigner()
+    if sign_type != "js":
+        raise ValueError("[create_douyin_signer] Invalid sign type only supported js or native ...")
+    if shutil.which("node"):
+        return DouYinJsSigner(pool_size=pool_size)
+    utils.logger.info("[create_douyin_signer] node not found, fallback to execjs signer ...")
+    return DouYinExecJsSigner(pool_size=pool_size)
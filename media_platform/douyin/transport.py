@@ -0,0 +1,156 @@
+import asyncio
+import importlib.util
+import json
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Union
+
+import httpx
+
+import config
+from tools import utils
+
+ProxiesType = Optional[Union[str, Dict[str, str]]]
+
+
+class TransportStats:
+    """连接复用情况的计数器"""
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        # 因为超出数量或者代理下线而关闭的连接池
+        self.evicted_clients = 0
+
+    @property
+    def reused_connections(self) -> int:
+        return self.requests - self.new_connections
+
+    @property
+    def reuse_rate(self) -> float:
+        return self.reused_connections / self.requests if self.requests else 0.0
+
+    def __repr__(self) -> str:
+        return (
+            f"TransportStats(requests={self.requests}, new_connections={self.new_connections}, "
+            f"reused_connections={self.reused_connections}, reuse_rate={self.reuse_rate:.2%}, "
+            f"evicted_clients={self.evicted_clients})"
+        )
+
+
+class DouYinTransport:
+    def __init__(
+            self,
+            timeout: float = 30,
+            max_connections: Optional[int] = None,
+            max_keepalive_connections: Optional[int] = None,
+            keepalive_expiry: Optional[float] = None,
+            http2: Optional[bool] = None,
+            max_clients: Optional[int] = None,
+    ):
+        """
+        长期持有的 HTTP 连接池，每个代理各自维护一个连接池，连接在请求之间复用
+        Args:
+            timeout: 请求超时时间(秒)
+            max_connections: 单个连接池的最大连接数，默认取 config.HTTP_MAX_CONNECTIONS
+            max_keepalive_connections: 单个连接池保持长连接的数量，默认取 config.HTTP_MAX_KEEPALIVE_CONNECTIONS
+            keepalive_expiry: 空闲长连接的保持时间(秒)，默认取 config.HTTP_KEEPALIVE_EXPIRY
+            http2: 是否开启 HTTP/2，默认取 config.ENABLE_HTTP2，需要安装 h2 依赖
+            max_clients: 最多保留多少个代理的连接池，超出时关闭最久没用的，默认取 config.HTTP_MAX_PROXY_CLIENTS
+        """
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections or config.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=max_keepalive_connections or config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=keepalive_expiry or config.HTTP_KEEPALIVE_EXPIRY,
+        )
+        self.http2 = config.ENABLE_HTTP2 if http2 is None else http2
+        if self.http2 and importlib.util.find_spec("h2") is None:
+            utils.logger.warning("[DouYinTransport] h2 is not installed, fallback to HTTP/1.1 ...")
+            self.http2 = False
+        self.max_clients = max_clients or config.HTTP_MAX_PROXY_CLIENTS
+        self.stats = TransportStats()
+        # 按最近使用的顺序排列，最久没用的在最前面
+        self._clients: "OrderedDict[str, httpx.AsyncClient]" = OrderedDict()
+        self._in_flight: Dict[httpx.AsyncClient, int] = {}
+        # 已经移出 _clients、等正在进行的请求结束之后再关闭的连接池
+        self._evicted: Set[httpx.AsyncClient] = set()
+        self._close_tasks: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def _get_pool_key(proxies: ProxiesType) -> str:
+        return json.dumps(proxies, sort_keys=True) if proxies else ""
+
+    def _get_client(self, proxies: ProxiesType) -> httpx.AsyncClient:
+        pool_key = self._get_pool_key(proxies)
+        client = self._clients.get(pool_key)
+        if client is not None:
+            self._clients.move_to_end(pool_key)
+            return client
+        while len(self._clients) >= self.max_clients:
+            _, lru_client = self._clients.popitem(last=False)
+            self._evict(lru_client)
+        client = httpx.AsyncClient(
+            proxies=proxies, limits=self.limits, http2=self.http2, timeout=self.timeout  # type: ignore
+        )
+        self._clients[pool_key] = client
+        return client
+
+    def _evict(self, client: httpx.AsyncClient) -> None:
+        self.stats.evicted_clients += 1
+        if self._in_flight.get(client):
+            self._evicted.add(client)
+        else:
+            self._schedule_close(client)
+
+    def _schedule_close(self, client: httpx.AsyncClient) -> None:
+        task = asyncio.create_task(client.aclose())
+        self._close_tasks.add(task)
+        task.add_done_callback(self._close_tasks.discard)
+
+    def discard(self, proxies: ProxiesType) -> None:
+        """
+        代理下线之后关闭它的连接池，正在进行的请求结束之后才真正关闭
+        :param proxies:
+        :return:
+        """
+        client = self._clients.pop(self._get_pool_key(proxies), None)
+        if client is not None:
+            self._evict(client)
+
+    async def request(self, method: str, url: str, proxies: ProxiesType = None, **kwargs) -> httpx.Response:
+        """
+        发送请求，通过 httpcore 的 trace 事件判断本次请求是否新建了连接
+        :param method:
+        :param url:
+        :param proxies: 走哪个代理的连接池，为空表示直连
+        :param kwargs: 透传给 httpx.AsyncClient.request 的参数
+        :return:
+        """
+        new_connection = False
+
+        async def trace(event_name: str, _info: Dict):
+            nonlocal new_connection
+            if event_name == "connection.connect_tcp.complete":
+                new_connection = True
+
+        extensions = kwargs.pop("extensions", None) or {}
+        extensions["trace"] = trace
+        client = self._get_client(proxies)
+        self._in_flight[client] = self._in_flight.get(client, 0) + 1
+        try:
+            return await client.request(method, url, extensions=extensions, **kwargs)
+        finally:
+            self.stats.requests += 1
+            self.stats.new_connections += int(new_connection)
+            self._in_flight[client] -= 1
+            if not self._in_flight[client]:
+                del self._in_flight[client]
+                if client in self._evicted:
+                    self._evicted.discard(client)
+                    self._schedule_close(client)
+
+    async def aclose(self) -> None:
+        clients = list(self._clients.values()) + list(self._evicted)
+        self._clients.clear()
+        self._evicted.clear()
+        await asyncio.gather(*[client.aclose() for client in clients], *self._close_tasks)
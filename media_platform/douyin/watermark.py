@@ -0,0 +1,107 @@
+from typing import Dict, List, Optional, Tuple
+
+
+class CommentWatermark:
+    def __init__(
+            self,
+            aweme_id: str,
+            max_create_time: int = 0,
+            max_comment_id: str = "",
+            last_cursor: int = 0,
+            completed: bool = True,
+    ):
+        """
+        单个视频的评论抓取水位线
+        Args:
+            aweme_id: 视频ID
+            max_create_time: 已经抓取到的最新评论的发布时间
+            max_comment_id: 已经抓取到的最新评论的ID
+            last_cursor: 上一次抓取停下来时的翻页游标
+            completed: 上一次抓取是否正常结束，没有结束时下一次从 last_cursor 继续往后抓
+        """
+        self.aweme_id = aweme_id
+        self.max_create_time = max_create_time
+        self.max_comment_id = max_comment_id
+        self.last_cursor = last_cursor
+        self.completed = completed
+        # 抓取开始时的水位线快照，抓取过程中 max_create_time 会不断更新，判断是否抓过要以快照为准
+        self._seen: Optional[Tuple[int, str]] = (max_create_time, max_comment_id) if completed and max_create_time else None
+        # 已经翻过、还没有被调用方确认保存的页: (评论, 下一页的游标)
+        self._pending: List[Tuple[List[Dict], int]] = []
+
+    @classmethod
+    def from_dict(cls, item: Dict) -> "CommentWatermark":
+        return cls(
+            aweme_id=item["aweme_id"],
+            max_create_time=item.get("max_create_time", 0),
+            max_comment_id=item.get("max_comment_id", ""),
+            last_cursor=item.get("last_cursor", 0),
+            completed=item.get("completed", True),
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            "aweme_id": self.aweme_id,
+            "max_create_time": self.max_create_time,
+            "max_comment_id": self.max_comment_id,
+            "last_cursor": self.last_cursor,
+            # 还有翻过但没有保存的页时不算抓完，下一次从已保存的游标继续
+            "completed": self.completed and not self._pending,
+        }
+
+    @property
+    def is_incremental(self) -> bool:
+        """上一次抓取正常结束，这一次只需要抓新增的评论"""
+        return self._seen is not None
+
+    @property
+    def start_cursor(self) -> int:
+        """增量抓取从第一页开始，上一次没有抓完时从停下来的位置继续"""
+        return 0 if self.completed else self.last_cursor
+
+    def is_seen(self, comment: Dict) -> bool:
+        if self._seen is None:
+            return False
+        seen_create_time, seen_comment_id = self._seen
+        create_time = int(comment.get("create_time") or 0)
+        return create_time < seen_create_time or comment.get("cid") == seen_comment_id
+
+    def is_page_seen(self, comments: List[Dict]) -> bool:
+        """一页评论全部都抓过，再往后翻都是旧评论"""
+        return self.is_incremental and all(self.is_seen(comment) for comment in comments)
+
+    def update(self, comments: List[Dict], cursor: int) -> None:
+        """
+        抓到一页一级评论之后推进水位线
+        :param comments: 这一页的评论
+        :param cursor: 下一页的游标
+        :return:
+        """
+        for comment in comments:
+            create_time = int(comment.get("create_time") or 0)
+            if create_time > self.max_create_time:
+                self.max_create_time = create_time
+                self.max_comment_id = comment.get("cid", "")
+        self.last_cursor = cursor
+
+    def stage(self, comments: List[Dict], cursor: int) -> None:
+        """
+        翻到一页一级评论，等调用方保存之后再 commit，保存失败时水位线不会越过这一页
+        :param comments: 这一页的评论
+        :param cursor: 下一页的游标
+        :return:
+        """
+        self._pending.append((comments, cursor))
+
+    def commit(self, comments: List[Dict]) -> None:
+        """
+        调用方保存好一页评论之后确认，水位线推进到这一页为止(包括它前面的空页)，子评论的页不在其中，直接忽略
+        :param comments: iter_aweme_all_comments 返回的那一页
+        :return:
+        """
+        for index, (page, _) in enumerate(self._pending):
+            if page is comments:
+                for staged_comments, cursor in self._pending[:index + 1]:
+                    self.update(staged_comments, cursor)
+                del self._pending[:index + 1]
+                return
@@ -0,0 +1,101 @@
+"""
+X-Bogus 签名的纯 Python 实现，和 libs/douyin.js 中的 sign(e, b) 逐字节一致。
+
+签名由 19 个字节组成：
+    [64, 0, ua_key[1], ua_key[2], query[14:16], body[14:16], ua[14:16], timestamp(4), canvas(4), xor]
+其中 query/body/ua 为各自二次 md5 之后的摘要，随后整体用 rc4(key=0xff) 加密，
+前面拼上 [2, 255] 两个字节，再用自定义字母表做类 base64 编码。
+
+douyin.js 更新之后需要运行 test/test_douyin_sign.py 的对比测试，确认这里的实现没有偏离。
+"""
+import base64
+import functools
+import hashlib
+import time
+from typing import List, Optional
+
+_ALPHABET = "Dkdpgh4ZKsQB80/Mfvw36XI1R25-WUAlEi7NLboqYTOPuzmFjJnryx9HVGcaStCe="
+
+# douyin.js 中加密 UA 所用的 rc4 key，由两个为 0 的配置项拼成 [e / 256, e % 256, b % 256]
+_UA_KEY_ARGS = (0, 0)
+_UA_KEY = bytes([_UA_KEY_ARGS[0] // 256, _UA_KEY_ARGS[0] % 256, _UA_KEY_ARGS[1] % 256])
+
+# 在非浏览器环境下 canvas 指纹为 0
+_CANVAS_FINGERPRINT = 0
+
+
+def _md5(data: bytes) -> bytes:
+    return hashlib.md5(data).digest()
+
+
+def _rc4_init(key: bytes) -> List[int]:
+    state = list(range(256))
+    j = 0
+    for i in range(256):
+        j = (j + state[i] + key[i % len(key)]) & 255
+        state[i], state[j] = state[j], state[i]
+    return state
+
+
+def _rc4_crypt(state: List[int], data: bytes) -> bytes:
+    i = j = 0
+    out = bytearray(len(data))
+    for k, byte in enumerate(data):
+        i = (i + 1) & 255
+        j = (j + state[i]) & 255
+        state[i], state[j] = state[j], state[i]
+        out[k] = byte ^ state[(state[i] + state[j]) & 255]
+    return bytes(out)
+
+
+# 最后一步加密的 key 是固定的 0xff，密钥调度只需要做一次
+_FINAL_RC4_STATE = _rc4_init(b"\xff")
+
+# GET 请求的 body 为空，摘要是常量
+_BODY_DIGEST = _md5(_md5(b""))
+
+
+@functools.lru_cache(maxsize=64)
+def _ua_digest(user_agent: str) -> bytes:
+    encrypted_ua = _rc4_crypt(_rc4_init(_UA_KEY), user_agent.encode("latin-1"))
+    return _md5(base64.b64encode(encrypted_ua))
+
+
+def _encode(data: bytes) -> str:
+    result = []
+    for i in range(0, len(data), 3):
+        n = data[i] << 16 | data[i + 1] << 8 | data[i + 2]
+        result.append(_ALPHABET[n >> 18 & 63])
+        result.append(_ALPHABET[n >> 12 & 63])
+        result.append(_ALPHABET[n >> 6 & 63])
+        result.append(_ALPHABET[n & 63])
+    return "".join(result)
+
+
+def sign(query: str, user_agent: str, timestamp: Optional[int] = None) -> str:
+    """
+    计算 X-Bogus 签名
+    :param query: 拼接好的请求参数 k1=v1&k2=v2
+    :param user_agent: 请求头中的 User-Agent
+    :param timestamp: 签名时间戳(秒)，默认为当前时间
+    :return:
+    """
+    if timestamp is None:
+        timestamp = int(time.time())
+    query_digest = _md5(_md5(query.encode("utf-8")))
+    ua_digest = _ua_digest(user_agent)
+    payload = [
+        64, 0, _UA_KEY_ARGS[0], _UA_KEY_ARGS[1],
+        query_digest[14], query_digest[15],
+        _BODY_DIGEST[14], _BODY_DIGEST[15],
+        ua_digest[14], ua_digest[15],
+        timestamp >> 24 & 255, timestamp >> 16 & 255, timestamp >> 8 & 255, timestamp & 255,
+        _CANVAS_FINGERPRINT >> 24 & 255, _CANVAS_FINGERPRINT >> 16 & 255,
+        _CANVAS_FINGERPRINT >> 8 & 255, _CANVAS_FINGERPRINT & 255,
+    ]
+    checksum = 0
+    for byte in payload:
+        checksum ^= byte
+    payload.append(checksum)
+    encrypted = _rc4_crypt(list(_FINAL_RC4_STATE), bytes(payload))
+    return _encode(b"\x02\xff" + encrypted)
@@ -5,9 +5,9 @@
 # @Url     : 现在实现了极速HTTP的接口，官网地址：https://www.jisuhttp.com/?pl=mAKphQ&plan=ZY&kd=Yang
 import json
 from abc import ABC, abstractmethod
-from typing import Dict, List
+from typing import Dict, List, Optional, Set, Tuple
 
-import redis
+from redis.asyncio import Redis
 
 import config
 from tools import utils
@@ -20,44 +20,89 @@ class IpGetError(Exception):
 
 
 class ProxyProvider(ABC):
+    # 单次调用接口最多提取的 IP 数量，代理池按这个大小合并补充请求
+    max_ips_per_call: int = 100
+
     @abstractmethod
-    async def get_proxies(self, num: int) -> List[IpInfoModel]:
+    async def get_proxies(self, num: int, exclude_keys: Optional[Set[str]] = None) -> List[IpInfoModel]:
         """
         获取 IP 的抽象方法，不同的 HTTP 代理商需要实现该方法
-        :param num: 提取的 IP 数量
-        :return:
+        提供商是进程内共享的单例，不保存调用方的状态，哪些 IP 已经拿过由调用方(代理池)通过 exclude_keys 传入
+        :param num: 提取的 IP 数量，不超过 max_ips_per_call
+        :param exclude_keys: 调用方已经拿到过的 IP(ip:port)，缓存里的这些 IP 不再重复返回
+        :return: IP 列表，expired_time_ts 为过期的 unix 时间戳(秒)
+        """
+        pass
+
+
+class ProxyValidator(ABC):
+    @abstractmethod
+    async def validate(self, proxy: IpInfoModel) -> Optional[float]:
+        """
+        验证代理 IP 是否可用
+        :param proxy:
+        :return: 可用时返回请求耗时(秒)，不可用时返回 None
         """
         pass
 
 
 class RedisDbIpCache:
-    def __init__(self):
-        self.redis_client = redis.Redis(host=config.REDIS_DB_HOST, password=config.REDIS_DB_PWD)
+    def __init__(self, redis_client: Optional[Redis] = None):
+        """
+        每个代理商的 IP 存在一个有序集合里，成员是 IP 信息，分数是过期的时间戳，
+        加载时一次 pipeline 往返：先在 redis 端按分数删除过期的 IP，再取出剩下的 IP
+        Args:
+            redis_client: 异步 redis 客户端，默认按 config 中的地址创建
+        """
+        self.redis_client = redis_client or Redis(host=config.REDIS_DB_HOST, password=config.REDIS_DB_PWD)
+
+    @staticmethod
+    def get_cache_key(proxy_brand_name: str) -> str:
+        return f"{proxy_brand_name}:proxy_ips"
+
+    async def set_ip(self, proxy_brand_name: str, ip_info: IpInfoModel, ex: int):
+        """
+        缓存一个 IP
+        :param proxy_brand_name: 代理商名称
+        :param ip_info:
+        :param ex: 剩余有效时长(秒)
+        :return:
+        """
+        await self.set_ips(proxy_brand_name, [(ip_info, ex)])
 
-    def set_ip(self, ip_key: str, ip_value_info: str, ex: int):
+    async def set_ips(self, proxy_brand_name: str, ip_infos: List[Tuple[IpInfoModel, int]]):
         """
-        设置IP并带有过期时间，到期之后由 redis 负责删除
-        :param ip_key:
-        :param ip_value_info:
-        :param ex:
+        批量缓存 IP，到期之后在加载时由 redis 按分数删除
+        :param proxy_brand_name: 代理商名称
+        :param ip_infos: (IP 信息, 剩余有效时长(秒)) 列表
         :return:
         """
-        self.redis_client.set(name=ip_key, value=ip_value_info, ex=ex)
+        if not ip_infos:
+            return
+        current_ts = utils.get_unix_timestamp()
+        await self.redis_client.zadd(
+            self.get_cache_key(proxy_brand_name),
+            {ip_info.model_dump_json(): current_ts + ex for ip_info, ex in ip_infos},
+        )
 
-    def load_all_ip(self, proxy_brand_name: str) -> List[IpInfoModel]:
+    async def load_all_ip(self, proxy_brand_name: str) -> List[IpInfoModel]:
         """
-        从 redis 中加载所有还未过期的 IP 信息
+        从 redis 中加载所有还未过期的 IP 信息，耗时和这个代理商缓存的 IP 数量成正比，和整个 keyspace 无关
         :param proxy_brand_name: 代理商名称
         :return:
         """
-        all_ip_list: List[IpInfoModel] = []
-        all_ip_keys: List[bytes] = self.redis_client.keys(pattern=f"{proxy_brand_name}_*")
+        cache_key = self.get_cache_key(proxy_brand_name)
+        current_ts = utils.get_unix_timestamp()
+        all_ip_dict: Dict[str, IpInfoModel] = {}
         try:
-            for ip_key in all_ip_keys:
-                ip_value = self.redis_client.get(ip_key)
-                if not ip_value:
-                    continue
-                all_ip_list.append(IpInfoModel(**json.loads(ip_value)))
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                pipe.zremrangebyscore(cache_key, "-inf", current_ts)
+                pipe.zrangebyscore(cache_key, f"({current_ts}", "+inf")
+                _, ip_values = await pipe.execute()
+            # 同一个 IP 重复缓存时按过期时间升序返回，保留最后一个
+            for ip_value in ip_values:
+                ip_info = IpInfoModel(**json.loads(ip_value))
+                all_ip_dict[f"{ip_info.ip}:{ip_info.port}:{ip_info.user}"] = ip_info
         except Exception as e:
-            utils.logger.error("[RedisDbIpCache.load_all_ip] get ip err from redis db", e)
-        return all_ip_list
+            utils.logger.error(f"[RedisDbIpCache.load_all_ip] get ip err from redis db: {e}")
+        return list(all_ip_dict.values())
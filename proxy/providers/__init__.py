@@ -2,5 +2,6 @@
 # @Author  : relakkes@gmail.com
 # @Time    : 2024/4/5 10:13
 # @Desc    :
+from .fake_proxy import FakeProxyProvider, FakeProxyValidator
 from .jishu_http_proxy import new_jisu_http_proxy
-from .kuaidl_proxy import new_kuai_daili_proxy
\ No newline at end of file
+from .kuaidl_proxy import new_kuai_daili_proxy
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# @Desc    : 本地模拟的代理提供商和验证接口，不需要网络和代理账号，用于离线测试和压测代理池
+import asyncio
+import hashlib
+from typing import List, Optional, Set
+
+from proxy import IpInfoModel, ProxyProvider, ProxyValidator
+from proxy.types import ProviderNameEnum
+from tools import utils
+
+
+def _ip_hash(proxy: IpInfoModel) -> int:
+    return int(hashlib.md5(f"{proxy.ip}:{proxy.port}".encode()).hexdigest()[:8], 16)
+
+
+class FakeProxyProvider(ProxyProvider):
+    def __init__(self, expire_seconds: int = 30 * 60, max_ips_per_call: int = 100):
+        """
+        每次调用都返回一批新的模拟 IP
+        :param expire_seconds: IP 的有效时长
+        :param max_ips_per_call: 单次调用最多返回的 IP 数量
+        """
+        self.proxy_brand_name = ProviderNameEnum.FAKE_PROVIDER.value
+        self.expire_seconds = expire_seconds
+        self.max_ips_per_call = max_ips_per_call
+        self.api_calls = 0
+        self._next_no = 0
+
+    async def get_proxies(self, num: int, exclude_keys: Optional[Set[str]] = None) -> List[IpInfoModel]:
+        self.api_calls += 1
+        ip_infos = []
+        current_ts = utils.get_unix_timestamp()
+        for _ in range(min(num, self.max_ips_per_call)):
+            self._next_no += 1
+            ip_infos.append(IpInfoModel(
+                ip=f"10.{self._next_no >> 16 & 255}.{self._next_no >> 8 & 255}.{self._next_no & 255}",
+                port=8000 + self._next_no % 1000,
+                user="fake",
+                password="fake",
+                expired_time_ts=current_ts + self.expire_seconds,
+            ))
+        return ip_infos
+
+
+class FakeProxyValidator(ProxyValidator):
+    def __init__(self, dead_ratio: float = 0.2, min_latency: float = 0.01, max_latency: float = 0.1):
+        """
+        按 IP 的哈希值模拟验证结果：一部分 IP 不可用，可用的 IP 延迟在 [min_latency, max_latency] 之间
+        :param dead_ratio: 不可用 IP 的比例
+        :param min_latency: 最小延迟(秒)
+        :param max_latency: 最大延迟(秒)
+        """
+        self.dead_ratio = dead_ratio
+        self.min_latency = min_latency
+        self.max_latency = max_latency
+        self.dead_keys = set()
+
+    def get_latency(self, proxy: IpInfoModel) -> Optional[float]:
+        ip_hash = _ip_hash(proxy)
+        if f"{proxy.ip}:{proxy.port}" in self.dead_keys or ip_hash % 1000 < self.dead_ratio * 1000:
+            return None
+        return self.min_latency + (ip_hash >> 10) % 1000 / 1000 * (self.max_latency - self.min_latency)
+
+    async def validate(self, proxy: IpInfoModel) -> Optional[float]:
+        latency = self.get_latency(proxy)
+        await asyncio.sleep(latency if latency is not None else self.max_latency)
+        return latency
@@ -3,7 +3,7 @@
 # @Time    : 2024/4/5 09:32
 # @Desc    : 极速HTTP代理提供类实现,官网地址：https://www.jisuhttp.com?pl=zG3Jna
 import os
-from typing import Dict, List
+from typing import Dict, List, Optional, Set
 from urllib.parse import urlencode
 
 import httpx
@@ -14,6 +14,9 @@ from tools import utils
 
 
 class JiSuHttpProxy(ProxyProvider):
+    # 单次提取数量上限，以极速HTTP后台的套餐配置为准
+    max_ips_per_call = 100
+
     def __init__(self, key: str, crypto: str, time_validity_period: int):
         """
         极速HTTP 代理IP实现
@@ -33,14 +36,18 @@ class JiSuHttpProxy(ProxyProvider):
         }
         self.ip_cache = RedisDbIpCache()
 
-    async def get_proxies(self, num: int) -> List[IpInfoModel]:
+    async def get_proxies(self, num: int, exclude_keys: Optional[Set[str]] = None) -> List[IpInfoModel]:
         """
         :param num:
+        :param exclude_keys: 调用方已经拿到过的 IP(ip:port)，缓存里的这些 IP 不再重复返回
         :return:
         """
 
         # 优先从缓存中拿 IP
-        ip_cache_list = self.ip_cache.load_all_ip(proxy_brand_name=self.proxy_brand_name)
+        ip_cache_list = [
+            ip_info for ip_info in await self.ip_cache.load_all_ip(proxy_brand_name=self.proxy_brand_name)
+            if f"{ip_info.ip}:{ip_info.port}" not in (exclude_keys or ())
+        ]
         if len(ip_cache_list) >= num:
             return ip_cache_list[:num]
 
@@ -63,12 +70,14 @@ class JiSuHttpProxy(ProxyProvider):
                         port=ip_item.get("port"),
                         user=ip_item.get("user"),
                         password=ip_item.get("pass"),
+                        # 极速HTTP返回的是过期时间字符串，换算成过期时间戳
                         expired_time_ts=utils.get_unix_time_from_time_str(ip_item.get("expire"))
                     )
-                    ip_key = f"JISUHTTP_{ip_info_model.ip}_{ip_info_model.port}_{ip_info_model.user}_{ip_info_model.password}"
-                    ip_value = ip_info_model.json()
                     ip_infos.append(ip_info_model)
-                    self.ip_cache.set_ip(ip_key, ip_value, ex=ip_info_model.expired_time_ts - current_ts)
+                await self.ip_cache.set_ips(
+                    self.proxy_brand_name,
+                    [(ip_info, ip_info.expired_time_ts - current_ts) for ip_info in ip_infos]
+                )
             else:
                 raise IpGetError(res_dict.get("msg", "unkown err"))
         return ip_cache_list + ip_infos
@@ -4,7 +4,7 @@
 # @Desc    : 快代理HTTP实现，官方文档：https://www.kuaidaili.com/?ref=ldwkjqipvz6c
 import os
 import re
-from typing import Dict, List
+from typing import Dict, List, Optional, Set
 
 import httpx
 from pydantic import BaseModel, Field
@@ -46,6 +46,9 @@ def parse_kuaidaili_proxy(proxy_info: str) -> KuaidailiProxyModel:
 
 
 class KuaiDaiLiProxy(ProxyProvider):
+    # 单次提取数量上限，以快代理后台的套餐配置为准
+    max_ips_per_call = 100
+
     def __init__(self, kdl_user_name: str, kdl_user_pwd: str, kdl_secret_id: str, kdl_signature: str):
         """
 
@@ -69,11 +72,12 @@ class KuaiDaiLiProxy(ProxyProvider):
             "f_et": 1,
         }
 
-    async def get_proxies(self, num: int) -> List[IpInfoModel]:
+    async def get_proxies(self, num: int, exclude_keys: Optional[Set[str]] = None) -> List[IpInfoModel]:
         """
         快代理实现
         Args:
             num:
+            exclude_keys: 调用方已经拿到过的 IP(ip:port)，缓存里的这些 IP 不再重复返回
 
         Returns:
 
@@ -81,7 +85,10 @@ class KuaiDaiLiProxy(ProxyProvider):
         uri = "/api/getdps/"
 
         # 优先从缓存中拿 IP
-        ip_cache_list = self.ip_cache.load_all_ip(proxy_brand_name=self.proxy_brand_name)
+        ip_cache_list = [
+            ip_info for ip_info in await self.ip_cache.load_all_ip(proxy_brand_name=self.proxy_brand_name)
+            if f"{ip_info.ip}:{ip_info.port}" not in (exclude_keys or ())
+        ]
         if len(ip_cache_list) >= num:
             return ip_cache_list[:num]
 
@@ -103,6 +110,7 @@ class KuaiDaiLiProxy(ProxyProvider):
                 raise Exception("get ip error from proxy provider and  code not 0 ...")
 
             proxy_list: List[str] = ip_response.get("data", {}).get("proxy_list")
+            current_ts = utils.get_unix_timestamp()
             for proxy in proxy_list:
                 proxy_model = parse_kuaidaili_proxy(proxy)
                 ip_info_model = IpInfoModel(
@@ -110,12 +118,13 @@ class KuaiDaiLiProxy(ProxyProvider):
                     port=proxy_model.port,
                     user=self.kdl_user_name,
                     password=self.kdl_user_pwd,
-                    expired_time_ts=proxy_model.expire_ts,
-
+                    # f_et=1 时快代理返回的是剩余有效时长(秒)，换算成过期时间戳
+                    expired_time_ts=current_ts + proxy_model.expire_ts,
                 )
-                ip_key = f"{self.proxy_brand_name}_{ip_info_model.ip}_{ip_info_model.port}"
-                self.ip_cache.set_ip(ip_key, ip_info_model.model_dump_json(), ex=ip_info_model.expired_time_ts)
                 ip_infos.append(ip_info_model)
+            await self.ip_cache.set_ips(
+                self.proxy_brand_name, [(ip_info, ip_info.expired_time_ts - current_ts) for ip_info in ip_infos]
+            )
 
         return ip_cache_list + ip_infos
 
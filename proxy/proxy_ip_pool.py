@@ -2,34 +2,329 @@
 # @Author  : relakkes@gmail.com
 # @Time    : 2023/12/2 13:45
 # @Desc    : ip代理池实现
-import random
-from typing import Dict, List
+import asyncio
+import heapq
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
 import httpx
 from tenacity import retry, stop_after_attempt, wait_fixed
 
 import config
-from proxy.providers import new_jisu_http_proxy, new_kuai_daili_proxy
+from proxy.providers import FakeProxyProvider, new_jisu_http_proxy, new_kuai_daili_proxy
 from tools import utils
 
-from .base_proxy import ProxyProvider
+from .base_proxy import IpGetError, ProxyProvider, ProxyValidator
 from .types import IpInfoModel, ProviderNameEnum
 
 
-class ProxyIpPool:
-    def __init__(self, ip_pool_count: int, enable_validate_ip: bool, ip_provider: ProxyProvider) -> None:
+def get_proxy_key(proxy: IpInfoModel) -> str:
+    return f"{proxy.ip}:{proxy.port}"
+
+
+def get_remaining_ttl(proxy: IpInfoModel, now: Optional[float] = None) -> float:
+    if proxy.expired_time_ts is None:
+        return float("inf")
+    return proxy.expired_time_ts - (now or time.time())
+
+
+class HttpProxyValidator(ProxyValidator):
+    def __init__(self, valid_ip_url: str = "https://httpbin.org/ip", timeout: float = 10):
+        """
+        通过代理访问验证地址，能正常返回即为可用
+        Args:
+            valid_ip_url: 验证 IP 是否有效的地址
+            timeout: 验证超时时间(秒)
         """
+        self.valid_ip_url = valid_ip_url
+        self.timeout = timeout
+
+    async def validate(self, proxy: IpInfoModel) -> Optional[float]:
+        utils.logger.info(f"[HttpProxyValidator.validate] testing {proxy.ip} is it valid ")
+        httpx_proxy = {
+            f"{proxy.protocol}": f"http://{proxy.user}:{proxy.password}@{proxy.ip}:{proxy.port}"
+        }
+        start = time.monotonic()
+        try:
+            async with httpx.AsyncClient(proxies=httpx_proxy, timeout=self.timeout) as client:  # type: ignore
+                response = await client.get(self.valid_ip_url)
+        except Exception as e:
+            utils.logger.info(f"[HttpProxyValidator.validate] testing {proxy.ip} err: {e}")
+            return None
+        if response.status_code != 200:
+            return None
+        return time.monotonic() - start
+
+
+class ProxyState:
+    """代理 IP 的健康状态：延迟和成功率的指数加权平均，以及正在使用的请求数"""
+
+    def __init__(self, proxy: IpInfoModel, latency: float):
+        self.proxy = proxy
+        self.key = get_proxy_key(proxy)
+        self.latency_ewma = latency
+        self.success_ewma = 1.0
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.quarantined_until = 0.0
+        # 堆里只有版本号和这里一致的那一条记录是有效的
+        self.version = 0
+
+    @property
+    def score(self) -> float:
+        """成功率越高、延迟越低分数越高"""
+        return self.success_ewma / (self.latency_ewma + 0.1)
+
+    def get_remaining_ttl(self, now: Optional[float] = None) -> float:
+        """IP 剩余的有效时长(秒)，代理商没有返回过期时间时视为不会过期"""
+        return get_remaining_ttl(self.proxy, now)
 
+    def __repr__(self) -> str:
+        return (
+            f"ProxyState({self.key}, score={self.score:.2f}, success_ewma={self.success_ewma:.2f}, "
+            f"latency_ewma={self.latency_ewma * 1000:.0f}ms, in_flight={self.in_flight})"
+        )
+
+
+class ProxyPoolStats:
+    """代理池的计数器"""
+
+    def __init__(self):
+        self.acquired = 0
+        self.validated = 0
+        self.invalid = 0
+        self.quarantined = 0
+        self.reinstated = 0
+        self.refills = 0
+        self.provider_calls = 0
+        self.fetched = 0
+        self.retired = 0
+        # 买到了但是没用满就丢掉的 IP 时长：验证不通过、隔离后被丢弃、临近过期提前下线
+        self.wasted_ip_seconds = 0.0
+
+    @property
+    def wasted_ip_minutes(self) -> float:
+        return self.wasted_ip_seconds / 60
+
+    def __repr__(self) -> str:
+        return (
+            f"ProxyPoolStats(acquired={self.acquired}, validated={self.validated}, invalid={self.invalid}, "
+            f"quarantined={self.quarantined}, reinstated={self.reinstated}, refills={self.refills}, "
+            f"provider_calls={self.provider_calls}, fetched={self.fetched}, retired={self.retired}, "
+            f"wasted_ip_minutes={self.wasted_ip_minutes:.1f})"
+        )
+
+
+class ProxyIpPool:
+    def __init__(
+            self,
+            ip_pool_count: int,
+            enable_validate_ip: bool,
+            ip_provider: ProxyProvider,
+            validator: Optional[ProxyValidator] = None,
+            validate_concurrency: Optional[int] = None,
+            refill_interval: Optional[float] = None,
+            refill_threshold: Optional[float] = None,
+            quarantine_seconds: Optional[float] = None,
+            max_latency: Optional[float] = None,
+            min_success_rate: Optional[float] = None,
+            ewma_alpha: float = 0.3,
+            expire_buffer: Optional[float] = None,
+            prefetch_seconds: Optional[float] = None,
+    ) -> None:
+        """
+        按健康度调度的代理池：每次取负载最低、分数最高的 IP(堆，O(log n))，IP 用完之后归还并上报结果，
+        慢的或者失败率高的 IP 会被隔离，后台任务在池子见底之前补充新的 IP；
+        剩余有效时长不足 expire_buffer 的 IP 不再分配，prefetch_seconds 内将要过期的 IP 提前合并成一批补充
         Args:
-            ip_pool_count:
-            enable_validate_ip:
-            ip_provider:
+            ip_pool_count: 池子里健康 IP 的目标数量
+            enable_validate_ip: 加入池子之前是否验证 IP
+            ip_provider: 代理 IP 提供商
+            validator: IP 验证器，默认通过 httpbin 验证
+            validate_concurrency: 同时验证的 IP 数量，默认取 config.PROXY_VALIDATE_CONCURRENCY
+            refill_interval: 后台补充的检查间隔(秒)，默认取 config.PROXY_REFILL_INTERVAL
+            refill_threshold: 健康 IP 少于 ip_pool_count * refill_threshold 时立即补充，默认取 config.PROXY_REFILL_THRESHOLD
+            quarantine_seconds: IP 被隔离的秒数，到期后重新验证，默认取 config.PROXY_QUARANTINE_SECONDS
+            max_latency: 平均延迟超过该秒数时隔离，默认取 config.PROXY_MAX_LATENCY
+            min_success_rate: 成功率低于该值时隔离，默认取 config.PROXY_MIN_SUCCESS_RATE
+            ewma_alpha: 延迟和成功率的指数加权平均系数
+            expire_buffer: 剩余有效时长少于该秒数的 IP 不再分配，默认取 config.PROXY_EXPIRE_BUFFER_SECONDS
+            prefetch_seconds: 提前多少秒为将要下线的 IP 补充替换，默认取 config.PROXY_PREFETCH_SECONDS
         """
-        self.valid_ip_url = "https://httpbin.org/ip"  # 验证 IP 是否有效的地址
         self.ip_pool_count = ip_pool_count
         self.enable_validate_ip = enable_validate_ip
-        self.proxy_list: List[IpInfoModel] = []
         self.ip_provider: ProxyProvider = ip_provider
+        self.validator: ProxyValidator = validator or HttpProxyValidator()
+        self.validate_concurrency = validate_concurrency or config.PROXY_VALIDATE_CONCURRENCY
+        self.refill_interval = refill_interval or config.PROXY_REFILL_INTERVAL
+        self.refill_threshold = config.PROXY_REFILL_THRESHOLD if refill_threshold is None else refill_threshold
+        self.quarantine_seconds = config.PROXY_QUARANTINE_SECONDS if quarantine_seconds is None else quarantine_seconds
+        self.max_latency = max_latency or config.PROXY_MAX_LATENCY
+        self.min_success_rate = config.PROXY_MIN_SUCCESS_RATE if min_success_rate is None else min_success_rate
+        self.ewma_alpha = ewma_alpha
+        self.expire_buffer = config.PROXY_EXPIRE_BUFFER_SECONDS if expire_buffer is None else expire_buffer
+        self.prefetch_seconds = config.PROXY_PREFETCH_SECONDS if prefetch_seconds is None else prefetch_seconds
+        self.stats = ProxyPoolStats()
+        self.proxies: Dict[str, ProxyState] = {}
+        self.quarantine: Dict[str, ProxyState] = {}
+        self._heap: List[Tuple[int, float, int, str]] = []
+        self._refill_lock = asyncio.Lock()
+        self._refill_event = asyncio.Event()
+        self._refill_task: Optional[asyncio.Task] = None
+        self._closed = False
+        # 最近一批新提取的 IP 的有效时长
+        self._fresh_ttl = float("inf")
+        # 这个池子已经从提供商拿到过的 IP，补充时不再从缓存里重复拿(验证不通过、被丢弃的 IP)，
+        # 每个池子各自记录，新建的池子可以继续使用缓存里还没过期的 IP
+        self._fetched_keys: Set[str] = set()
+        # IP 被池子丢弃(过期下线、隔离后验证不通过)时的回调，使用方借此释放和这个 IP 绑定的资源
+        self._drop_listeners: List[Callable[[IpInfoModel], None]] = []
+
+    def add_drop_listener(self, listener: Callable[[IpInfoModel], None]) -> None:
+        self._drop_listeners.append(listener)
+
+    def remove_drop_listener(self, listener: Callable[[IpInfoModel], None]) -> None:
+        if listener in self._drop_listeners:
+            self._drop_listeners.remove(listener)
+
+    @property
+    def healthy_count(self) -> int:
+        return len(self.proxies)
+
+    def _push(self, state: ProxyState) -> None:
+        state.version += 1
+        heapq.heappush(self._heap, (state.in_flight, -state.score, state.version, state.key))
+        # 状态每变化一次就多一条过期记录，过期记录太多时重建堆
+        if len(self._heap) > 2 * len(self.proxies) + 16:
+            self._heap = [
+                (item.in_flight, -item.score, item.version, item.key) for item in self.proxies.values()
+            ]
+            heapq.heapify(self._heap)
+
+    def _pop_best(self) -> Optional[ProxyState]:
+        while self._heap:
+            _, _, version, key = heapq.heappop(self._heap)
+            state = self.proxies.get(key)
+            if state is not None and state.version == version:
+                return state
+        return None
+
+    async def _validate(self, proxy: IpInfoModel, semaphore: asyncio.Semaphore) -> Optional[float]:
+        if not self.enable_validate_ip:
+            return 0.0
+        async with semaphore:
+            latency = await self.validator.validate(proxy)
+        self.stats.validated += 1
+        if latency is None:
+            self.stats.invalid += 1
+        return latency
+
+    def _waste(self, proxy: IpInfoModel) -> None:
+        remaining_ttl = get_remaining_ttl(proxy)
+        if remaining_ttl != float("inf"):
+            self.stats.wasted_ip_seconds += max(remaining_ttl, 0)
+
+    def _drop(self, proxy: IpInfoModel) -> None:
+        """分配过的 IP 不再使用，通知使用方"""
+        self._waste(proxy)
+        for listener in list(self._drop_listeners):
+            try:
+                listener(proxy)
+            except Exception as e:
+                utils.logger.error(f"[ProxyIpPool._drop] drop listener failed: {e!r}")
+
+    async def _add_proxies(self, proxies: List[IpInfoModel]) -> None:
+        new_proxies = []
+        for proxy in proxies:
+            if get_proxy_key(proxy) in self.proxies or get_proxy_key(proxy) in self.quarantine:
+                continue
+            if get_remaining_ttl(proxy) < self.expire_buffer:
+                # 缓存里拿到的快要过期的 IP，验证完也用不了多久
+                self._waste(proxy)
+                continue
+            new_proxies.append(proxy)
+        semaphore = asyncio.Semaphore(self.validate_concurrency)
+        latencies = await asyncio.gather(*[self._validate(proxy, semaphore) for proxy in new_proxies])
+        for proxy, latency in zip(new_proxies, latencies):
+            if latency is None:
+                self._waste(proxy)
+                continue
+            state = ProxyState(proxy, latency)
+            self.proxies[state.key] = state
+            self._push(state)
+
+    async def _recheck_quarantine(self) -> None:
+        """隔离到期的 IP 重新验证，可用的放回池子，不可用的直接丢弃"""
+        now = time.monotonic()
+        expired_states = []
+        for state in list(self.quarantine.values()):
+            if state.get_remaining_ttl() < self.expire_buffer:
+                del self.quarantine[state.key]
+                self._drop(state.proxy)
+            elif state.quarantined_until <= now:
+                expired_states.append(state)
+        if not expired_states:
+            return
+        semaphore = asyncio.Semaphore(self.validate_concurrency)
+        latencies = await asyncio.gather(*[self._validate(state.proxy, semaphore) for state in expired_states])
+        for state, latency in zip(expired_states, latencies):
+            del self.quarantine[state.key]
+            if latency is None:
+                self._drop(state.proxy)
+                continue
+            state.latency_ewma = latency
+            state.success_ewma = 1.0
+            self.proxies[state.key] = state
+            self._push(state)
+            self.stats.reinstated += 1
+
+    def get_need_count(self) -> int:
+        """
+        需要补充的 IP 数量：prefetch_seconds 之后仍然可以分配的 IP 才算数，
+        即将下线的 IP 在这一次补充里一起换掉，而不是等它们各自过期之后再一个一个补
+        :return:
+        """
+        now = time.time()
+        # IP 本身的有效期比提前量还短时，提前量按有效期的一半算，否则每次都会把整个池子当成即将下线
+        horizon = min(self.expire_buffer + self.prefetch_seconds, self._fresh_ttl / 2)
+        lasting_count = sum(1 for state in self.proxies.values() if state.get_remaining_ttl(now) >= horizon)
+        return self.ip_pool_count - lasting_count
+
+    async def _fetch_proxies(self, need_count: int) -> List[IpInfoModel]:
+        """按代理商单次提取的上限分批获取"""
+        max_ips_per_call = max(self.ip_provider.max_ips_per_call, 1)
+        proxies: List[IpInfoModel] = []
+        while need_count > 0:
+            batch = await self.ip_provider.get_proxies(min(need_count, max_ips_per_call), exclude_keys=self._fetched_keys)
+            self._fetched_keys.update(get_proxy_key(proxy) for proxy in batch)
+            self.stats.provider_calls += 1
+            self.stats.fetched += len(batch)
+            if not batch:
+                break
+            proxies.extend(batch)
+            need_count -= len(batch)
+            self._fresh_ttl = max(get_remaining_ttl(proxy) for proxy in batch)
+        return proxies
+
+    async def refill(self) -> None:
+        """
+        重新验证隔离到期的 IP，再从代理商补充到 ip_pool_count 个健康 IP
+        :return:
+        """
+        async with self._refill_lock:
+            await self._recheck_quarantine()
+            # 验证不通过的 IP 会被丢掉，最多补充 3 轮，剩下的交给后台任务
+            for round_no in range(3):
+                # 提前替换只在第一轮做，后面几轮只补验证不通过的缺口
+                need_count = self.get_need_count() if round_no == 0 else self.ip_pool_count - len(self.proxies)
+                if need_count <= 0:
+                    break
+                self.stats.refills += 1
+                await self._add_proxies(await self._fetch_proxies(need_count))
+            utils.logger.info(
+                f"[ProxyIpPool.refill] healthy proxies:{len(self.proxies)}, quarantined:{len(self.quarantine)}"
+            )
 
     async def load_proxies(self) -> None:
         """
@@ -37,57 +332,143 @@ class ProxyIpPool:
         Returns:
 
         """
-        self.proxy_list = await self.ip_provider.get_proxies(self.ip_pool_count)
+        await self.refill()
+
+    async def _refill_loop(self) -> None:
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._refill_event.wait(), timeout=self.refill_interval)
+            except asyncio.TimeoutError:
+                pass
+            # 事件和取消同时到达时 wait_for 会吞掉取消，这里再检查一次
+            if self._closed:
+                break
+            self._refill_event.clear()
+            try:
+                await self.refill()
+            except Exception as e:
+                utils.logger.error(f"[ProxyIpPool._refill_loop] refill proxies error: {e}")
 
-    async def _is_valid_proxy(self, proxy: IpInfoModel) -> bool:
+    def _ensure_refill_task(self) -> None:
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.create_task(self._refill_loop())
+
+    async def acquire(self) -> IpInfoModel:
         """
-        验证代理IP是否有效
+        取出负载最低、分数最高的 IP，用完之后需要调用 release 归还
+        :return:
+        """
+        self._ensure_refill_task()
+        if not self.proxies:
+            await self.refill()
+        while True:
+            state = self._pop_best()
+            if state is None:
+                raise IpGetError("[ProxyIpPool.acquire] no available proxy in the pool")
+            if state.get_remaining_ttl() >= self.expire_buffer:
+                break
+            self._retire(state)
+        state.in_flight += 1
+        self._push(state)
+        self.stats.acquired += 1
+        if len(self.proxies) < self.ip_pool_count * self.refill_threshold:
+            self._refill_event.set()
+        return state.proxy
+
+    def is_available(self, proxy: IpInfoModel) -> bool:
+        """IP 还在池子里(没有被隔离或丢弃)"""
+        return get_proxy_key(proxy) in self.proxies
+
+    def report(self, proxy: IpInfoModel, success: bool, latency: Optional[float] = None) -> None:
+        """
+        上报一次使用的结果，更新 IP 的健康度，不归还 IP
         :param proxy:
+        :param success: 请求是否成功
+        :param latency: 请求耗时(秒)
         :return:
         """
-        utils.logger.info(f"[ProxyIpPool._is_valid_proxy] testing {proxy.ip} is it valid ")
-        try:
-            httpx_proxy = {
-                f"{proxy.protocol}": f"http://{proxy.user}:{proxy.password}@{proxy.ip}:{proxy.port}"
-            }
-            async with httpx.AsyncClient(proxies=httpx_proxy) as client:
-                response = await client.get(self.valid_ip_url)
-            if response.status_code == 200:
-                return True
-            else:
-                return False
-        except Exception as e:
-            utils.logger.info(f"[ProxyIpPool._is_valid_proxy] testing {proxy.ip} err: {e}")
-            raise e
+        key = get_proxy_key(proxy)
+        state = self.proxies.get(key) or self.quarantine.get(key)
+        if state is None:
+            return
+        state.requests += 1
+        state.failures += int(not success)
+        state.success_ewma = self.ewma_alpha * success + (1 - self.ewma_alpha) * state.success_ewma
+        if success and latency is not None:
+            state.latency_ewma = self.ewma_alpha * latency + (1 - self.ewma_alpha) * state.latency_ewma
+        if key not in self.proxies:
+            return
+        if state.success_ewma < self.min_success_rate or state.latency_ewma > self.max_latency:
+            self._quarantine(state)
+        else:
+            self._push(state)
+
+    def release(self, proxy: IpInfoModel, success: Optional[bool] = None, latency: Optional[float] = None) -> None:
+        """
+        归还 IP，success 不为空时同时上报这次使用的结果
+        :param proxy:
+        :param success: 请求是否成功
+        :param latency: 请求耗时(秒)
+        :return:
+        """
+        key = get_proxy_key(proxy)
+        state = self.proxies.get(key) or self.quarantine.get(key)
+        if state is None:
+            return
+        state.in_flight = max(0, state.in_flight - 1)
+        if success is not None:
+            self.report(proxy, success, latency)
+        elif key in self.proxies:
+            self._push(state)
+
+    def _retire(self, state: ProxyState) -> None:
+        """临近过期的 IP 不再分配，正在使用它的请求归还时直接忽略"""
+        utils.logger.info(f"[ProxyIpPool._retire] retire {state}, remaining ttl:{state.get_remaining_ttl():.0f}s")
+        del self.proxies[state.key]
+        self._drop(state.proxy)
+        self.stats.retired += 1
+        self._refill_event.set()
+
+    def _quarantine(self, state: ProxyState) -> None:
+        utils.logger.info(f"[ProxyIpPool._quarantine] quarantine {state}")
+        del self.proxies[state.key]
+        state.quarantined_until = time.monotonic() + self.quarantine_seconds
+        self.quarantine[state.key] = state
+        self.stats.quarantined += 1
+        if len(self.proxies) < self.ip_pool_count * self.refill_threshold:
+            self._refill_event.set()
 
     @retry(stop=stop_after_attempt(3), wait=wait_fixed(1))
     async def get_proxy(self) -> IpInfoModel:
         """
-        从代理池中随机提取一个代理IP
+        从代理池中提取一个健康度最好的代理IP，IP 仍然留在池子里，可以被其他请求同时使用
         :return:
         """
-        if len(self.proxy_list) == 0:
-            await self._reload_proxies()
-
-        proxy = random.choice(self.proxy_list)
-        self.proxy_list.remove(proxy) # 取出来一个IP就应该移出掉
-        if self.enable_validate_ip:
-            if not await self._is_valid_proxy(proxy):
-                raise Exception("[ProxyIpPool.get_proxy] current ip invalid and again get it")
-        return proxy
+        return await self.acquire()
 
-    async def _reload_proxies(self):
+    async def close(self) -> None:
         """
-        # 重新加载代理池
+        停止后台补充任务，输出本次运行的提取次数和浪费的 IP 时长
         :return:
         """
-        self.proxy_list = []
-        await self.load_proxies()
+        self._closed = True
+        self._refill_event.set()
+        if self._refill_task is not None and not self._refill_task.done():
+            self._refill_task.cancel()
+            await asyncio.gather(self._refill_task, return_exceptions=True)
+        left_ip_seconds = sum(
+            max(state.get_remaining_ttl(), 0) for state in self.proxies.values()
+            if state.get_remaining_ttl() != float("inf")
+        )
+        utils.logger.info(
+            f"[ProxyIpPool.close] {self.stats}, left in pool:{len(self.proxies)} ips / {left_ip_seconds / 60:.1f} ip-minutes"
+        )
 
 
 IpProxyProvider: Dict[str, ProxyProvider] = {
     ProviderNameEnum.JISHU_HTTP_PROVIDER.value: new_jisu_http_proxy(),
-    ProviderNameEnum.KUAI_DAILI_PROVIDER.value: new_kuai_daili_proxy()
+    ProviderNameEnum.KUAI_DAILI_PROVIDER.value: new_kuai_daili_proxy(),
+    ProviderNameEnum.FAKE_PROVIDER.value: FakeProxyProvider(),
 }
 
 
@@ -11,6 +11,7 @@ from pydantic import BaseModel, Field
 class ProviderNameEnum(Enum):
     JISHU_HTTP_PROVIDER: str = "jishuhttp"
     KUAI_DAILI_PROVIDER: str = "kuaidaili"
+    FAKE_PROVIDER: str = "fake"
 
 
 class IpInfoModel(BaseModel):
@@ -20,4 +21,4 @@ class IpInfoModel(BaseModel):
     user: str = Field(title="IP代理认证的用户名")
     protocol: str = Field(default="https://", title="代理IP的协议")
     password: str = Field(title="IP代理认证用户的密码")
-    expired_time_ts: Optional[int] = Field(title="IP 过期时间")
+    expired_time_ts: Optional[int] = Field(title="IP 过期时间(unix 时间戳，秒)，各代理商在实现里统一换算成这个格式")
@@ -73,7 +73,7 @@ CREATE TABLE `douyin_aweme` (
   `collected_count` varchar(16) DEFAULT NULL COMMENT '视频收藏数',
   `aweme_url` varchar(255) DEFAULT NULL COMMENT '视频详情页URL',
   PRIMARY KEY (`id`),
-  KEY `idx_douyin_awem_aweme_i_6f7bc6` (`aweme_id`),
+  UNIQUE KEY `idx_douyin_awem_aweme_i_6f7bc6` (`aweme_id`),
   KEY `idx_douyin_awem_create__299dfe` (`create_time`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci COMMENT='抖音视频';
 
@@ -95,11 +95,12 @@ CREATE TABLE `douyin_aweme_comment` (
   `last_modify_ts` bigint NOT NULL COMMENT '记录最后修改时间戳',
   `comment_id` varchar(64) NOT NULL COMMENT '评论ID',
   `aweme_id` varchar(64) NOT NULL COMMENT '视频ID',
+  `parent_comment_id` varchar(64) DEFAULT NULL COMMENT '父评论ID',
   `content` longtext COMMENT '评论内容',
   `create_time` bigint NOT NULL COMMENT '评论时间戳',
   `sub_comment_count` varchar(16) NOT NULL COMMENT '评论回复数',
   PRIMARY KEY (`id`),
-  KEY `idx_douyin_awem_comment_fcd7e4` (`comment_id`),
+  UNIQUE KEY `idx_douyin_awem_comment_fcd7e4` (`comment_id`),
   KEY `idx_douyin_awem_aweme_i_c50049` (`aweme_id`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci COMMENT='抖音视频评论';
 
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+# @Desc    : 批量写入(write-behind)的存储包装类，数据先缓存在内存中，按数量、时间或关闭时批量落盘
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+from base.base_crawler import AbstractStore
+from tools import utils
+
+
+class StoreMetrics:
+    """批量写入的统计指标"""
+
+    def __init__(self):
+        self.flush_count = 0
+        self.item_count = 0
+        self.max_batch_size = 0
+        self.total_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.failed_flush_count = 0
+        self.dropped_count = 0
+
+    def record(self, batch_size: int, flush_latency: float):
+        self.flush_count += 1
+        self.item_count += batch_size
+        self.max_batch_size = max(self.max_batch_size, batch_size)
+        self.total_flush_latency += flush_latency
+        self.max_flush_latency = max(self.max_flush_latency, flush_latency)
+
+    @property
+    def avg_batch_size(self) -> float:
+        return self.item_count / self.flush_count if self.flush_count else 0.0
+
+    @property
+    def avg_flush_latency(self) -> float:
+        return self.total_flush_latency / self.flush_count if self.flush_count else 0.0
+
+    def __repr__(self) -> str:
+        return (
+            f"StoreMetrics(flush_count={self.flush_count}, item_count={self.item_count}, "
+            f"avg_batch_size={self.avg_batch_size:.1f}, max_batch_size={self.max_batch_size}, "
+            f"avg_flush_latency={self.avg_flush_latency * 1000:.2f}ms, max_flush_latency={self.max_flush_latency * 1000:.2f}ms, "
+            f"failed_flush_count={self.failed_flush_count}, dropped_count={self.dropped_count})"
+        )
+
+
+class BatchStore(AbstractStore):
+    def __init__(self, store: AbstractStore, batch_size: int, flush_interval: float, max_flush_retries: int = 3):
+        """
+        批量写入的存储包装类
+        Args:
+            store: 被包装的存储实现，需要实现 store_many 批量写入
+            batch_size: 缓存的数据达到该数量时立即落盘
+            flush_interval: 缓存中最早的一条数据最多等待的秒数
+            max_flush_retries: 落盘失败时数据放回缓存重试的次数，超过之后丢弃这一批并在 close 时抛出异常
+        """
+        self.store = store
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self.max_flush_retries = max_flush_retries
+        self.metrics = StoreMetrics()
+        self._buffer: List[Dict] = []
+        self._flush_failures = 0
+        # 最近一次丢弃数据的异常，close 时抛出
+        self._error: Optional[Exception] = None
+        self._flush_lock = asyncio.Lock()
+        self._flush_timer: Optional[asyncio.Task] = None
+
+    async def store_content(self, content_item: Dict):
+        await self.store_many([content_item])
+
+    async def store_many(self, content_items: List[Dict]):
+        self._buffer.extend(content_items)
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+        elif self._buffer and (self._flush_timer is None or self._flush_timer.done()):
+            self._flush_timer = asyncio.create_task(self._flush_later())
+
+    async def store_comment(self, comment_item: Dict):
+        await self.store_comments([comment_item])
+
+    async def store_comments(self, comment_items: List[Dict]):
+        """
+        评论按页抓取，一页本身就是一批，直接写入被包装的存储
+        :param comment_items:
+        :return:
+        """
+        if comment_items:
+            await self.store.store_comments(comment_items)
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        try:
+            # close() 会取消定时任务，已经开始的落盘不能被打断
+            await asyncio.shield(self.flush())
+        except Exception as e:
+            utils.logger.error(f"[BatchStore._flush_later] flush store error: {e}")
+        if self._buffer:
+            # 落盘失败放回缓存的数据，没有新数据进来时也要按时重试
+            self._flush_timer = asyncio.create_task(self._flush_later())
+
+    async def flush(self):
+        """
+        把缓存中的数据批量落盘，失败时这一批放回缓存最前面等下一次重试，
+        连续失败超过 max_flush_retries 次时丢弃这一批并抛出异常
+        :return:
+        """
+        async with self._flush_lock:
+            if not self._buffer:
+                return
+            batch, self._buffer = self._buffer, []
+            start = time.perf_counter()
+            try:
+                await self.store.store_many(batch)
+            except Exception as e:
+                self.metrics.failed_flush_count += 1
+                self._flush_failures += 1
+                if self._flush_failures > self.max_flush_retries:
+                    self._flush_failures = 0
+                    self.metrics.dropped_count += len(batch)
+                    self._error = e
+                    utils.logger.error(f"[BatchStore.flush] drop {len(batch)} items after {self.max_flush_retries} retries: {e}")
+                    raise
+                self._buffer[:0] = batch
+                utils.logger.warning(
+                    f"[BatchStore.flush] flush {len(batch)} items error, retry {self._flush_failures}/{self.max_flush_retries}: {e}"
+                )
+                return
+            self._flush_failures = 0
+            self.metrics.record(len(batch), time.perf_counter() - start)
+
+    async def close(self):
+        """
+        停止定时落盘，写入剩余的数据并关闭被包装的存储，有数据因为落盘失败被丢弃时抛出异常
+        :return:
+        """
+        if self._flush_timer is not None and not self._flush_timer.done():
+            self._flush_timer.cancel()
+        try:
+            # 失败的数据会放回缓存，直到写入成功或者重试次数用完被丢弃
+            while self._buffer:
+                await self.flush()
+        finally:
+            await self.store.close()
+            utils.logger.info(f"[BatchStore.close] {type(self.store).__name__} {self.metrics}")
+        if self._error is not None:
+            raise self._error
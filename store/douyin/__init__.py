@@ -2,11 +2,14 @@
 # @Author  : relakkes@gmail.com
 # @Time    : 2024/1/14 18:46
 # @Desc    :
-from typing import List
+from typing import List, Optional
 
 import config
+from store.batch_store import BatchStore
 
 from .douyin_store_impl import *
+from .douyin_session_store import DouyinSessionSnapshotStore
+from .douyin_watermark_store import DouyinCommentWatermarkStore
 
 
 class DouyinStoreFactory:
@@ -14,17 +17,58 @@ class DouyinStoreFactory:
         "csv": DouyinCsvStoreImplement,
         "db": DouyinDbStoreImplement,
         "json": DouyinJsonStoreImplement,
+        "jsonl": DouyinJsonlStoreImplement,
     }
+    shared_store: Optional[BatchStore] = None
+    # crawlers of the process (scheduled runs, sync jobs) share one store, the last one to finish closes it
+    shared_store_users: int = 0
 
     @staticmethod
     def create_store() -> AbstractStore:
         store_class = DouyinStoreFactory.STORES.get(config.SAVE_DATA_OPTION)
         if not store_class:
             raise ValueError(
-                "[DouyinStoreFactory.create_store] Invalid save option only supported csv or db or json ..."
+                "[DouyinStoreFactory.create_store] Invalid save option only supported csv or db or json or jsonl ..."
             )
         return store_class()
 
+    @staticmethod
+    def get_shared_store() -> BatchStore:
+        """
+        write-behind store shared by the whole crawl, items are buffered and written in batches
+        """
+        if DouyinStoreFactory.shared_store is None:
+            DouyinStoreFactory.shared_store = BatchStore(
+                DouyinStoreFactory.create_store(),
+                batch_size=config.STORE_BATCH_SIZE,
+                flush_interval=config.STORE_FLUSH_INTERVAL,
+                max_flush_retries=config.STORE_FLUSH_MAX_RETRIES,
+            )
+        return DouyinStoreFactory.shared_store
+
+
+def open_douyin_store():
+    """
+    called by a crawler before it starts storing, paired with close_douyin_store
+    """
+    DouyinStoreFactory.shared_store_users += 1
+
+
+async def close_douyin_store():
+    """
+    flush the buffered items, must be called before the crawler exits,
+    the store is only closed when no other crawler of the process still has it open
+    """
+    DouyinStoreFactory.shared_store_users = max(DouyinStoreFactory.shared_store_users - 1, 0)
+    if DouyinStoreFactory.shared_store_users:
+        if DouyinStoreFactory.shared_store is not None:
+            # other crawlers keep writing, only make sure the items of this crawler are persisted
+            await DouyinStoreFactory.shared_store.flush()
+        return
+    shared_store, DouyinStoreFactory.shared_store = DouyinStoreFactory.shared_store, None
+    if shared_store is not None:
+        await shared_store.close()
+
 
 async def update_douyin_aweme(aweme_item: Dict):
     aweme_id = aweme_item.get("aweme_id")
@@ -55,6 +99,43 @@ async def update_douyin_aweme(aweme_item: Dict):
     utils.logger.info(
         f"[store.douyin.update_douyin_aweme] douyin aweme id:{aweme_id}, title:{save_content_item.get('title')}"
     )
-    await DouyinStoreFactory.create_store().store_content(
+    await DouyinStoreFactory.get_shared_store().store_content(
         content_item=save_content_item
     )
+
+
+def make_douyin_comment_item(aweme_id: str, comment_item: Dict) -> Dict:
+    # 注销用户、被屏蔽的评论等情况下接口会返回 null，字段在表里都是 NOT NULL，这里统一转成空值
+    user_info = comment_item.get("user") or {}
+    avatar_info = user_info.get("avatar_thumb") or {}
+    return {
+        "comment_id": comment_item.get("cid"),
+        "aweme_id": aweme_id,
+        # 一级评论的 reply_id 为 "0"，子评论为所属一级评论的ID
+        "parent_comment_id": comment_item.get("reply_id") or "0",
+        "content": comment_item.get("text") or "",
+        "create_time": comment_item.get("create_time") or 0,
+        "sub_comment_count": str(comment_item.get("reply_comment_total") or 0),
+        "user_id": user_info.get("uid") or "",
+        "sec_uid": user_info.get("sec_uid") or "",
+        "short_user_id": user_info.get("short_id") or "",
+        "user_unique_id": user_info.get("unique_id") or "",
+        "user_signature": user_info.get("signature") or "",
+        "nickname": user_info.get("nickname") or "",
+        "avatar": (avatar_info.get("url_list") or [""])[0],
+        "ip_location": comment_item.get("ip_label") or "",
+        "last_modify_ts": utils.get_current_timestamp(),
+    }
+
+
+async def batch_update_dy_aweme_comments(aweme_id: str, comments: List[Dict]):
+    """
+    store a page of comments as soon as it is fetched
+    """
+    if not comments:
+        return
+    save_comment_items = [make_douyin_comment_item(aweme_id, comment_item) for comment_item in comments]
+    utils.logger.info(
+        f"[store.douyin.batch_update_dy_aweme_comments] douyin aweme id:{aweme_id}, comments count:{len(save_comment_items)}"
+    )
+    await DouyinStoreFactory.get_shared_store().store_comments(save_comment_items)
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# @Desc    : 登录会话快照的存储，一个平台一个小文件，写入时先写临时文件再替换，多个进程可以同时读取
+import asyncio
+import json
+import os
+import pathlib
+import uuid
+from typing import Dict, Optional
+
+import aiofiles
+
+from tools import utils
+
+
+class DouyinSessionSnapshotStore:
+    session_store_path: str = "data/douyin"
+
+    def __init__(self, file_name: str = "session_snapshot.json"):
+        self.file_path = f"{self.session_store_path}/{file_name}"
+        self.lock = asyncio.Lock()
+
+    async def load(self) -> Optional[Dict]:
+        """
+        加载会话快照，文件损坏时删除
+        :return:
+        """
+        async with self.lock:
+            if not os.path.exists(self.file_path):
+                return None
+            try:
+                async with aiofiles.open(self.file_path, "r", encoding="utf-8") as file:
+                    return json.loads(await file.read())
+            except (OSError, json.JSONDecodeError) as e:
+                utils.logger.warning(f"[DouyinSessionSnapshotStore.load] broken session snapshot: {e}")
+                self._remove()
+                return None
+
+    async def save(self, snapshot: Dict):
+        """
+        保存会话快照
+        :param snapshot:
+        :return:
+        """
+        async with self.lock:
+            pathlib.Path(self.session_store_path).mkdir(parents=True, exist_ok=True)
+            # 每次写入用不同的临时文件，同一进程里多个爬虫同时保存时不会写到同一个文件
+            tmp_file_path = f"{self.file_path}.{uuid.uuid4().hex}.tmp"
+            async with aiofiles.open(tmp_file_path, "w", encoding="utf-8") as file:
+                await file.write(json.dumps(snapshot, ensure_ascii=False))
+            os.replace(tmp_file_path, self.file_path)
+
+    async def delete(self):
+        """快照过期或者登录状态失效时删除"""
+        async with self.lock:
+            self._remove()
+
+    def _remove(self):
+        try:
+            os.remove(self.file_path)
+        except FileNotFoundError:
+            pass
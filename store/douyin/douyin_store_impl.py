@@ -4,22 +4,39 @@
 # @Desc    : 抖音存储实现类
 import asyncio
 import csv
+import io
 import json
 import os
 import pathlib
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 
 import aiofiles
+from django.db import connection
 
+import config
 from base.base_crawler import AbstractStore
 from tools import utils
 from var import crawler_type_var
-from video.models import VideoInfo
+from video.models import VideoComment, VideoInfo
 
 
 class DouyinCsvStoreImplement(AbstractStore):
     csv_store_path: str = "data/douyin"
 
+    def __init__(self, flush_interval: Optional[float] = None):
+        """
+        CSV 存储实现，每个 (crawler_type, store_type, date) 文件只打开一次并一直持有文件句柄，
+        数据按批编码写入，定时或者关闭时再刷到磁盘
+        Args:
+            flush_interval: 写入之后最多间隔多少秒刷盘，默认取 config.CSV_FLUSH_INTERVAL
+        """
+        self.flush_interval = flush_interval if flush_interval is not None else config.CSV_FLUSH_INTERVAL
+        self.lock = asyncio.Lock()
+        self._files: Dict[str, Any] = {}
+        self._files_date: str = ""
+        self._flush_timer: Optional[asyncio.Task] = None
+
     def make_save_file_name(self, store_type: str) -> str:
         """
         make save file name by store type
@@ -31,6 +48,22 @@ class DouyinCsvStoreImplement(AbstractStore):
         """
         return f"{self.csv_store_path}/{crawler_type_var.get()}_{store_type}_{utils.get_current_date()}.csv"
 
+    async def _get_file(self, save_file_name: str) -> Tuple[Any, bool]:
+        """
+        get the opened file handle, the second value is whether the file is empty and needs a header
+        """
+        current_date = utils.get_current_date()
+        if current_date != self._files_date:
+            # 过了零点，前一天的文件不会再写入，直接关闭
+            await self._close_files()
+            self._files_date = current_date
+        if save_file_name not in self._files:
+            pathlib.Path(self.csv_store_path).mkdir(parents=True, exist_ok=True)
+            f = await aiofiles.open(save_file_name, mode="a+", encoding="utf-8-sig", newline="")
+            self._files[save_file_name] = f
+            return f, await f.tell() == 0
+        return self._files[save_file_name], False
+
     async def save_data_to_csv(self, save_item: Dict, store_type: str):
         """
         Below is a simple way to save it in CSV format.
@@ -41,15 +74,61 @@ class DouyinCsvStoreImplement(AbstractStore):
         Returns: no returns
 
         """
-        pathlib.Path(self.csv_store_path).mkdir(parents=True, exist_ok=True)
-        save_file_name = self.make_save_file_name(store_type=store_type)
-        async with aiofiles.open(
-            save_file_name, mode="a+", encoding="utf-8-sig", newline=""
-        ) as f:
-            writer = csv.writer(f)
-            if await f.tell() == 0:
-                await writer.writerow(save_item.keys())
-            await writer.writerow(save_item.values())
+        await self.save_data_list_to_csv(save_items=[save_item], store_type=store_type)
+
+    async def save_data_list_to_csv(self, save_items: List[Dict], store_type: str):
+        """
+        Encode a batch of items with writerows and write them to the opened file at once
+        Args:
+            save_items: save content dict info list
+            store_type: Save type contains content and comments（contents | comments）
+
+        Returns: no returns
+
+        """
+        if not save_items:
+            return
+        rows_buffer = io.StringIO()
+        writer = csv.writer(rows_buffer)
+        writer.writerows([save_item.values() for save_item in save_items])
+        async with self.lock:
+            f, need_header = await self._get_file(self.make_save_file_name(store_type=store_type))
+            if need_header:
+                header_buffer = io.StringIO()
+                csv.writer(header_buffer).writerow(save_items[0].keys())
+                await f.write(header_buffer.getvalue())
+            await f.write(rows_buffer.getvalue())
+        if self._flush_timer is None or self._flush_timer.done():
+            self._flush_timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        try:
+            await asyncio.shield(self.flush())
+        except Exception as e:
+            utils.logger.error(f"[DouyinCsvStoreImplement._flush_later] flush csv file error: {e}")
+
+    async def flush(self):
+        """
+        flush all opened files to disk
+        """
+        async with self.lock:
+            for f in self._files.values():
+                await f.flush()
+
+    async def _close_files(self):
+        files, self._files = self._files, {}
+        for f in files.values():
+            await f.close()
+
+    async def close(self):
+        """
+        flush and close all opened files
+        """
+        if self._flush_timer is not None and not self._flush_timer.done():
+            self._flush_timer.cancel()
+        async with self.lock:
+            await self._close_files()
 
     async def store_content(self, content_item: Dict):
         """
@@ -62,8 +141,112 @@ class DouyinCsvStoreImplement(AbstractStore):
         """
         await self.save_data_to_csv(save_item=content_item, store_type="contents")
 
+    async def store_many(self, content_items: List[Dict]):
+        """
+        Douyin content CSV bulk storage implementation
+        Args:
+            content_items: content item dict list
+
+        Returns:
+
+        """
+        await self.save_data_list_to_csv(save_items=content_items, store_type="contents")
+
+    async def store_comment(self, comment_item: Dict):
+        """
+        Douyin comment CSV storage implementation
+        Args:
+            comment_item: comment item dict
+
+        Returns:
+
+        """
+        await self.save_data_to_csv(save_item=comment_item, store_type="comments")
+
+    async def store_comments(self, comment_items: List[Dict]):
+        """
+        Douyin comment CSV bulk storage implementation
+        Args:
+            comment_items: comment item dict list
+
+        Returns:
+
+        """
+        await self.save_data_list_to_csv(save_items=comment_items, store_type="comments")
+
 
 class DouyinDbStoreImplement(AbstractStore):
+    # django 的数据库连接和线程绑定，所有写入都放到同一个专用线程里执行，不阻塞事件循环
+    db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="douyin_db_store")
+    video_update_fields: List[str] = [
+        field.name for field in VideoInfo._meta.concrete_fields if not field.primary_key
+    ]
+
+    comment_update_fields: List[str] = [
+        field.name for field in VideoComment._meta.concrete_fields if not field.primary_key
+    ]
+
+    @staticmethod
+    def bulk_upsert(model, key_field: str, update_fields: List[str], items: List[Dict]) -> int:
+        """
+        新建或更新一批记录，整批数据只执行一条 INSERT ... ON CONFLICT / ON DUPLICATE KEY UPDATE
+        Args:
+            model: django model
+            key_field: 主键字段
+            update_fields: 冲突时需要更新的字段
+            items: item dict list
+
+        Returns: upsert rows count
+
+        """
+        # 同一批数据里重复的主键只保留最后一条，否则部分数据库会报错
+        objs = {
+            item.get(key_field): model(
+                **{key_field: item.get(key_field)},
+                **{field: item.get(field) for field in update_fields},
+            )
+            for item in items
+        }
+        kwargs = {}
+        if connection.features.supports_update_conflicts_with_target:
+            # mysql 不支持指定冲突字段，按主键/唯一索引冲突
+            kwargs["unique_fields"] = [key_field]
+        model.objects.bulk_create(
+            list(objs.values()),
+            update_conflicts=True,
+            update_fields=update_fields,
+            **kwargs,
+        )
+        return len(objs)
+
+    @staticmethod
+    def bulk_upsert_videos(content_items: List[Dict]) -> int:
+        """
+        新建或更新一批 VideoInfo
+        Args:
+            content_items: content item dict list
+
+        Returns: upsert rows count
+
+        """
+        return DouyinDbStoreImplement.bulk_upsert(
+            VideoInfo, "aweme_id", DouyinDbStoreImplement.video_update_fields, content_items
+        )
+
+    @staticmethod
+    def bulk_upsert_comments(comment_items: List[Dict]) -> int:
+        """
+        新建或更新一批 VideoComment
+        Args:
+            comment_items: comment item dict list
+
+        Returns: upsert rows count
+
+        """
+        return DouyinDbStoreImplement.bulk_upsert(
+            VideoComment, "comment_id", DouyinDbStoreImplement.comment_update_fields, comment_items
+        )
+
     async def store_content(self, content_item: Dict):
         """
         Douyin content DB storage implementation
@@ -73,52 +256,48 @@ class DouyinDbStoreImplement(AbstractStore):
         Returns:
 
         """
+        await self.store_many([content_item])
 
-        # print(VideoInfo.objects.get(pk=content_item.get("aweme_id")))
-
-        # 更新或新建 VideoInfo
-        newVideo = VideoInfo.objects.update_or_create(
-            aweme_id=content_item.get("aweme_id"),
-            defaults={
-                "aweme_id": content_item.get("aweme_id"),
-                "aweme_type": content_item.get("aweme_type"),
-                "title": content_item.get("title"),
-                "desc": content_item.get("desc"),
-                "create_time": content_item.get("create_time"),
-                "user_id": content_item.get("user_id"),
-                "sec_uid": content_item.get("sec_uid"),
-                "short_user_id": content_item.get("short_user_id"),
-                "user_unique_id": content_item.get("user_unique_id"),
-                "user_signature": content_item.get("user_signature"),
-                "nickname": content_item.get("nickname"),
-                "avatar": content_item.get("avatar"),
-                "liked_count": content_item.get("liked_count"),
-                "collected_count": content_item.get("collected_count"),
-                "comment_count": content_item.get("comment_count"),
-                "share_count": content_item.get("share_count"),
-                "ip_location": content_item.get("ip_location"),
-                "last_modify_ts": content_item.get("last_modify_ts"),
-                "cover": content_item.get("cover"),
-                "aweme_url": content_item.get("aweme_url"),
-            },
+    async def store_many(self, content_items: List[Dict]):
+        """
+        Douyin content DB bulk storage implementation, runs on the dedicated db thread
+        Args:
+            content_items: content item dict list
+
+        Returns:
+
+        """
+        if not content_items:
+            return
+        await asyncio.get_running_loop().run_in_executor(
+            self.db_executor, self.bulk_upsert_videos, content_items
         )
 
-        print("newVideo", newVideo)
+    async def store_comment(self, comment_item: Dict):
+        """
+        Douyin comment DB storage implementation
+        Args:
+            comment_item: comment item dict
+
+        Returns:
+
+        """
+        await self.store_comments([comment_item])
+
+    async def store_comments(self, comment_items: List[Dict]):
+        """
+        Douyin comment DB bulk storage implementation, runs on the dedicated db thread
+        Args:
+            comment_items: comment item dict list
 
-        # from .douyin_store_sql import (
-        #     add_new_content,
-        #     query_content_by_content_id,
-        #     update_content_by_content_id,
-        # )
+        Returns:
 
-        # aweme_id = content_item.get("aweme_id")
-        # aweme_detail: Dict = await query_content_by_content_id(content_id=aweme_id)
-        # if not aweme_detail:
-        #     content_item["add_ts"] = utils.get_current_timestamp()
-        #     if content_item.get("title"):
-        #         await add_new_content(content_item)
-        # else:
-        #     await update_content_by_content_id(aweme_id, content_item=content_item)
+        """
+        if not comment_items:
+            return
+        await asyncio.get_running_loop().run_in_executor(
+            self.db_executor, self.bulk_upsert_comments, comment_items
+        )
 
 
 class DouyinJsonStoreImplement(AbstractStore):
@@ -146,6 +325,20 @@ class DouyinJsonStoreImplement(AbstractStore):
         Returns:
 
         """
+        await self.save_data_list_to_json(save_items=[save_item], store_type=store_type)
+
+    async def save_data_list_to_json(self, save_items: List[Dict], store_type: str):
+        """
+        Save a batch of items with a single read-modify-write of the file
+        Args:
+            save_items: save content dict info list
+            store_type: Save type contains content and comments（contents | comments）
+
+        Returns:
+
+        """
+        if not save_items:
+            return
         pathlib.Path(self.json_store_path).mkdir(parents=True, exist_ok=True)
         save_file_name = self.make_save_file_name(store_type=store_type)
         save_data = []
@@ -155,7 +348,7 @@ class DouyinJsonStoreImplement(AbstractStore):
                 async with aiofiles.open(save_file_name, "r", encoding="utf-8") as file:
                     save_data = json.loads(await file.read())
 
-            save_data.append(save_item)
+            save_data.extend(save_items)
             async with aiofiles.open(save_file_name, "w", encoding="utf-8") as file:
                 await file.write(json.dumps(save_data, ensure_ascii=False))
 
@@ -169,3 +362,224 @@ class DouyinJsonStoreImplement(AbstractStore):
 
         """
         await self.save_data_to_json(content_item, "contents")
+
+    async def store_many(self, content_items: List[Dict]):
+        """
+        content JSON bulk storage implementation
+        Args:
+            content_items:
+
+        Returns:
+
+        """
+        await self.save_data_list_to_json(content_items, "contents")
+
+    async def store_comment(self, comment_item: Dict):
+        """
+        comment JSON storage implementation
+        Args:
+            comment_item:
+
+        Returns:
+
+        """
+        await self.save_data_to_json(comment_item, "comments")
+
+    async def store_comments(self, comment_items: List[Dict]):
+        """
+        comment JSON bulk storage implementation
+        Args:
+            comment_items:
+
+        Returns:
+
+        """
+        await self.save_data_list_to_json(comment_items, "comments")
+
+
+class DouyinJsonlStoreImplement(AbstractStore):
+    jsonl_store_path: str = "data/douyin"
+    # 偏移量索引的 key 字段
+    index_keys: Dict[str, str] = {"contents": "aweme_id", "comments": "comment_id"}
+
+    def __init__(self, segment_max_bytes: Optional[int] = None, enable_index: Optional[bool] = None):
+        """
+        JSON Lines 存储实现，每条数据只追加一行，不再读取和重写整个文件
+        Args:
+            segment_max_bytes: 单个分段文件的最大字节数，超过后滚动到下一个分段，默认取 config.JSONL_SEGMENT_MAX_BYTES
+            enable_index: 是否写入 aweme_id -> 文件偏移量的索引文件，默认取 config.JSONL_ENABLE_INDEX
+        """
+        self.segment_max_bytes = segment_max_bytes or config.JSONL_SEGMENT_MAX_BYTES
+        self.enable_index = config.JSONL_ENABLE_INDEX if enable_index is None else enable_index
+        self.lock = asyncio.Lock()
+        # 文件前缀 -> (当前分段序号, 当前分段大小)，每天的文件前缀不同，天然按时间滚动
+        self._segments: Dict[str, Tuple[int, int]] = {}
+
+    def make_save_file_prefix(self, store_type: str, date: Optional[str] = None) -> str:
+        """
+        make save file prefix by store type
+        Args:
+            store_type: Save type contains content and comments（contents | comments）
+            date: eg: 2024-01-14, default is today
+
+        Returns: eg: data/douyin/detail_contents_2024-01-14
+
+        """
+        return f"{self.jsonl_store_path}/{crawler_type_var.get()}_{store_type}_{date or utils.get_current_date()}"
+
+    @staticmethod
+    def make_segment_file_name(file_prefix: str, segment_no: int) -> str:
+        return f"{file_prefix}.{segment_no:04d}.jsonl"
+
+    @staticmethod
+    def make_index_file_name(file_prefix: str) -> str:
+        return f"{file_prefix}.idx.jsonl"
+
+    def _get_current_segment(self, file_prefix: str) -> Tuple[int, int]:
+        if file_prefix not in self._segments:
+            # 进程重启后接着磁盘上最后一个分段继续写，每个文件前缀只需要检查一次
+            pathlib.Path(self.jsonl_store_path).mkdir(parents=True, exist_ok=True)
+            segment_no = 0
+            while os.path.exists(self.make_segment_file_name(file_prefix, segment_no + 1)):
+                segment_no += 1
+            segment_file_name = self.make_segment_file_name(file_prefix, segment_no)
+            segment_size = os.path.getsize(segment_file_name) if os.path.exists(segment_file_name) else 0
+            self._segments[file_prefix] = (segment_no, segment_size)
+        return self._segments[file_prefix]
+
+    async def save_data_list_to_jsonl(self, save_items: List[Dict], store_type: str):
+        """
+        Append a batch of items to the current segment, one json per line
+        Args:
+            save_items: save content dict info list
+            store_type: Save type contains content and comments（contents | comments）
+
+        Returns:
+
+        """
+        if not save_items:
+            return
+        lines = [(json.dumps(save_item, ensure_ascii=False) + "\n").encode("utf-8") for save_item in save_items]
+        data = b"".join(lines)
+        file_prefix = self.make_save_file_prefix(store_type)
+
+        async with self.lock:
+            segment_no, segment_size = self._get_current_segment(file_prefix)
+            if segment_size and segment_size + len(data) > self.segment_max_bytes:
+                segment_no, segment_size = segment_no + 1, 0
+
+            async with aiofiles.open(self.make_segment_file_name(file_prefix, segment_no), "ab") as file:
+                await file.write(data)
+
+            index_key = self.index_keys.get(store_type)
+            if self.enable_index and index_key:
+                index_lines = []
+                offset = segment_size
+                for save_item, line in zip(save_items, lines):
+                    index_lines.append(json.dumps({
+                        "key": save_item.get(index_key), "segment": segment_no, "offset": offset, "length": len(line)
+                    }) + "\n")
+                    offset += len(line)
+                async with aiofiles.open(self.make_index_file_name(file_prefix), "a", encoding="utf-8") as file:
+                    await file.write("".join(index_lines))
+
+            self._segments[file_prefix] = (segment_no, segment_size + len(data))
+
+    async def load_item(self, store_type: str, key: str, date: Optional[str] = None) -> Optional[Dict]:
+        """
+        Load the latest saved item of the key through the offset index
+        Args:
+            store_type: Save type contains content and comments（contents | comments）
+            key: aweme_id or comment_id
+            date: eg: 2024-01-14, default is today
+
+        Returns:
+
+        """
+        file_prefix = self.make_save_file_prefix(store_type, date)
+        index_file_name = self.make_index_file_name(file_prefix)
+        if not os.path.exists(index_file_name):
+            return None
+        position = None
+        async with aiofiles.open(index_file_name, "r", encoding="utf-8") as file:
+            async for line in file:
+                index_item = json.loads(line)
+                if index_item.get("key") == key:
+                    position = index_item
+        if not position:
+            return None
+        async with aiofiles.open(self.make_segment_file_name(file_prefix, position["segment"]), "rb") as file:
+            await file.seek(position["offset"])
+            return json.loads(await file.read(position["length"]))
+
+    async def export_to_json(self, store_type: str, date: Optional[str] = None) -> str:
+        """
+        Convert all segments of the day to the legacy single-array json file (same as DouyinJsonStoreImplement)
+        Args:
+            store_type: Save type contains content and comments（contents | comments）
+            date: eg: 2024-01-14, default is today
+
+        Returns: the legacy json file name
+
+        """
+        file_prefix = self.make_save_file_prefix(store_type, date)
+        json_file_name = f"{file_prefix}.json"
+        segment_no = 0
+        is_first_item = True
+        async with aiofiles.open(json_file_name, "w", encoding="utf-8") as json_file:
+            await json_file.write("[")
+            while os.path.exists(self.make_segment_file_name(file_prefix, segment_no)):
+                async with aiofiles.open(self.make_segment_file_name(file_prefix, segment_no), "r", encoding="utf-8") as segment_file:
+                    async for line in segment_file:
+                        line = line.rstrip("\n")
+                        if not line:
+                            continue
+                        await json_file.write(line if is_first_item else ", " + line)
+                        is_first_item = False
+                segment_no += 1
+            await json_file.write("]")
+        return json_file_name
+
+    async def store_content(self, content_item: Dict):
+        """
+        content JSON Lines storage implementation
+        Args:
+            content_item:
+
+        Returns:
+
+        """
+        await self.save_data_list_to_jsonl([content_item], "contents")
+
+    async def store_many(self, content_items: List[Dict]):
+        """
+        content JSON Lines bulk storage implementation
+        Args:
+            content_items:
+
+        Returns:
+
+        """
+        await self.save_data_list_to_jsonl(content_items, "contents")
+
+    async def store_comment(self, comment_item: Dict):
+        """
+        comment JSON Lines storage implementation
+        Args:
+            comment_item:
+
+        Returns:
+
+        """
+        await self.save_data_list_to_jsonl([comment_item], "comments")
+
+    async def store_comments(self, comment_items: List[Dict]):
+        """
+        comment JSON Lines bulk storage implementation
+        Args:
+            comment_items:
+
+        Returns:
+
+        """
+        await self.save_data_list_to_jsonl(comment_items, "comments")
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+# @Desc    : 评论增量抓取的水位线存储，只追加写入，加载时按 aweme_id 取最后一条
+#            同一个文件可能被多个进程(定时任务、同步接口、celery worker)同时写入，追加和压缩都在文件锁里进行
+import asyncio
+import json
+import os
+import pathlib
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import aiofiles
+
+import config
+from tools import utils
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+
+
+class DouyinCommentWatermarkStore:
+    watermark_store_path: str = "data/douyin"
+
+    def __init__(self, file_name: str = "comment_watermarks.jsonl", cache_size: Optional[int] = None):
+        """
+        Args:
+            file_name: 水位线文件名
+            cache_size: 内存里最多缓存多少个视频的水位线，默认取 config.COMMENT_WATERMARK_CACHE_SIZE
+        """
+        self.file_path = f"{self.watermark_store_path}/{file_name}"
+        self.lock_file_path = f"{self.file_path}.lock"
+        self.cache_size = cache_size or config.COMMENT_WATERMARK_CACHE_SIZE
+        self.lock = asyncio.Lock()
+        self._cache: "OrderedDict[str, Dict]" = OrderedDict()
+        # 上一次完整读取文件时文件的 (大小, 修改时间)，文件没有变化并且所有记录都在缓存里时，缓存没有的视频不用再读文件
+        self._cached_file_stat: Optional[Tuple[int, int]] = None
+
+    def _get_file_stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.file_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _remember(self, watermark: Dict) -> None:
+        self._cache[watermark["aweme_id"]] = watermark
+        self._cache.move_to_end(watermark["aweme_id"])
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+            # 有记录被挤出了缓存，缓存不再是完整的
+            self._cached_file_stat = None
+
+    @asynccontextmanager
+    async def _file_lock(self) -> AsyncIterator[bool]:
+        """
+        跨进程的文件锁，不支持 fcntl 的平台上不加锁
+        :return: 是否拿到了锁
+        """
+        if fcntl is None:
+            yield False
+            return
+        pathlib.Path(self.watermark_store_path).mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.lock_file_path, os.O_CREAT | os.O_RDWR)
+        try:
+            await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+            yield True
+        finally:
+            # 关闭文件时锁自动释放
+            os.close(fd)
+
+    async def _read_all(self) -> Tuple[Dict[str, Dict], int]:
+        """
+        读取整个文件，每个视频只保留最后一条，只在读取期间占用内存
+        :return: (水位线, 行数)
+        """
+        watermarks: Dict[str, Dict] = {}
+        line_count = 0
+        if not os.path.exists(self.file_path):
+            return watermarks, line_count
+        async with aiofiles.open(self.file_path, "r", encoding="utf-8") as file:
+            async for line in file:
+                line = line.strip()
+                if not line:
+                    continue
+                line_count += 1
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError:
+                    # 进程被杀掉时最后一行可能没有写完整
+                    utils.logger.warning(f"[DouyinCommentWatermarkStore._read_all] skip broken line: {line[:100]}")
+                    continue
+                watermarks[item["aweme_id"]] = item
+        return watermarks, line_count
+
+    async def _compact(self) -> None:
+        """重写文件，每个 aweme_id 只保留最新的一条，在文件锁里重新读取，不会丢掉其他进程刚追加的记录"""
+        async with self._file_lock() as locked:
+            if not locked:
+                # 没有文件锁时不能确定只有自己在写，不压缩，只追加的文件仍然是正确的
+                return
+            watermarks, line_count = await self._read_all()
+            if line_count <= 2 * len(watermarks):
+                # 其他进程已经压缩过了
+                return
+            tmp_file_path = f"{self.file_path}.{uuid.uuid4().hex}.tmp"
+            async with aiofiles.open(tmp_file_path, "w", encoding="utf-8") as file:
+                await file.write("".join(json.dumps(item, ensure_ascii=False) + "\n" for item in watermarks.values()))
+            os.replace(tmp_file_path, self.file_path)
+            utils.logger.info(
+                f"[DouyinCommentWatermarkStore._compact] compact {line_count} lines into {len(watermarks)} watermarks"
+            )
+
+    async def get(self, aweme_id: str) -> Optional[Dict]:
+        """
+        获取视频的水位线
+        :param aweme_id:
+        :return:
+        """
+        async with self.lock:
+            watermark = self._cache.get(aweme_id)
+            if watermark is not None:
+                self._cache.move_to_end(aweme_id)
+                return watermark
+            if self._cached_file_stat is not None and self._cached_file_stat == self._get_file_stat():
+                return None
+            file_stat = self._get_file_stat()
+            watermarks, line_count = await self._read_all()
+            if line_count > 2 * len(watermarks):
+                await self._compact()
+                # 压缩之后其他进程可能又追加了记录，这次读到的内容不能当作完整的
+                file_stat = None
+            watermark = watermarks.get(aweme_id)
+            if watermark is not None:
+                self._remember(watermark)
+            if file_stat is not None and len(watermarks) <= self.cache_size:
+                # 整个文件都放得进缓存，之后缓存没有的视频就是没有水位线
+                self._cached_file_stat = file_stat
+                for item in watermarks.values():
+                    if item["aweme_id"] not in self._cache:
+                        self._remember(item)
+            return watermark
+
+    async def save(self, watermark: Dict):
+        """
+        保存视频的水位线
+        :param watermark: 必须包含 aweme_id
+        :return:
+        """
+        async with self.lock:
+            pathlib.Path(self.watermark_store_path).mkdir(parents=True, exist_ok=True)
+            async with self._file_lock() as locked:
+                unchanged = locked and self._cached_file_stat is not None \
+                    and self._cached_file_stat == self._get_file_stat()
+                async with aiofiles.open(self.file_path, "a", encoding="utf-8") as file:
+                    await file.write(json.dumps(watermark, ensure_ascii=False) + "\n")
+                # 在锁里确认文件只多了自己这一行，缓存仍然是完整的
+                self._cached_file_stat = self._get_file_stat() if unchanged else None
+            self._remember(watermark)
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+import os
+
+import django
+
+# 存储层依赖 django ORM 模型，导入爬虫模块之前需要先初始化 django
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "crawler.settings")
+django.setup()
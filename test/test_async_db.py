@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+import aiomysql
+from aiomysql.cursors import RE_INSERT_VALUES
+
+import config
+from async_db import AsyncMysqlDB, build_upsert_sql, chunk_rows, items_to_rows
+
+TEST_TABLE = "test_async_db_aweme"
+
+
+class TestSqlBuilder(TestCase):
+    def test_upsert_sql_is_batchable(self):
+        sql = build_upsert_sql("douyin_aweme", ["aweme_id", "title"], ["title"])
+        self.assertEqual(
+            sql,
+            "INSERT INTO `douyin_aweme` (`aweme_id`,`title`) VALUES (%s,%s) "
+            "ON DUPLICATE KEY UPDATE `title`=VALUES(`title`)",
+        )
+        # executemany 只有匹配上这个正则才会合并成多行 VALUES
+        self.assertIsNotNone(RE_INSERT_VALUES.match(sql))
+
+    def test_items_to_rows(self):
+        fields, rows = items_to_rows([{"a": 1, "b": "x"}, {"b": "y"}])
+        self.assertEqual(fields, ["a", "b"])
+        self.assertEqual(rows, [(1, "x"), (None, "y")])
+
+    def test_chunk_rows(self):
+        rows = [(i, "中文'" * 50) for i in range(100)]
+        chunks = list(chunk_rows(rows, max_bytes=2000))
+        self.assertEqual(sum(chunks, []), rows)
+        self.assertGreater(len(chunks), 1)
+        # 一行超过上限时单独成批，不会丢数据
+        self.assertEqual(list(chunk_rows(rows[:2], max_bytes=10)), [[rows[0]], [rows[1]]])
+
+
+class TestAsyncMysqlDB(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        try:
+            self.pool = await aiomysql.create_pool(
+                host="localhost", port=3306, user="root", password=config.RELATION_DB_PWD,
+                db="media_crawler", autocommit=True, local_infile=True, connect_timeout=2,
+            )
+        except Exception as e:
+            self.skipTest(f"mysql is not available: {e}")
+        self.db = AsyncMysqlDB(self.pool)
+        await self.db.execute(f"DROP TABLE IF EXISTS `{TEST_TABLE}`")
+        await self.db.execute(
+            f"CREATE TABLE `{TEST_TABLE}` (`id` int NOT NULL AUTO_INCREMENT, `aweme_id` varchar(64) NOT NULL, "
+            f"`title` varchar(500) DEFAULT NULL, `add_ts` bigint NOT NULL, "
+            f"PRIMARY KEY (`id`), UNIQUE KEY (`aweme_id`)) DEFAULT CHARSET=utf8mb4"
+        )
+
+    async def asyncTearDown(self):
+        await self.db.execute(f"DROP TABLE IF EXISTS `{TEST_TABLE}`")
+        self.pool.close()
+        await self.pool.wait_closed()
+
+    async def test_items_to_table_and_upsert_many(self):
+        items = [{"aweme_id": str(i), "title": f"title\t{i}", "add_ts": 1} for i in range(2000)]
+        self.assertEqual(await self.db.items_to_table(TEST_TABLE, items), 2000)
+
+        updates = [{"aweme_id": str(i), "title": "updated", "add_ts": 2} for i in range(1000, 3000)]
+        await self.db.upsert_many(TEST_TABLE, updates)
+        rows = await self.db.query(f"SELECT COUNT(*) AS cnt, SUM(add_ts = 1) AS old_add_ts FROM `{TEST_TABLE}`")
+        self.assertEqual(rows[0]["cnt"], 3000)
+        # 已存在的记录不更新 add_ts
+        self.assertEqual(int(rows[0]["old_add_ts"]), 2000)
+        row = await self.db.get_first(f"SELECT title FROM `{TEST_TABLE}` WHERE aweme_id=%s", "1500")
+        self.assertEqual(row["title"], "updated")
+
+    async def test_update_table_where_is_parameterized(self):
+        await self.db.item_to_table(TEST_TABLE, {"aweme_id": '1" OR "1"="1', "title": "a", "add_ts": 1})
+        await self.db.item_to_table(TEST_TABLE, {"aweme_id": "2", "title": "b", "add_ts": 1})
+        rows = await self.db.update_table(TEST_TABLE, {"title": "c"}, "aweme_id", '1" OR "1"="1')
+        self.assertEqual(rows, 1)
+
+    async def test_load_data_to_table(self):
+        items = [{"aweme_id": str(i), "title": None if i % 2 else f"a\\b\nc{i}", "add_ts": 1} for i in range(100)]
+        try:
+            await self.db.load_data_to_table(TEST_TABLE, items, chunk_rows_num=30)
+        except aiomysql.OperationalError as e:
+            self.skipTest(f"local_infile is disabled: {e}")
+        row = await self.db.get_first(f"SELECT title FROM `{TEST_TABLE}` WHERE aweme_id=%s", "2")
+        self.assertEqual(row["title"], "a\\b\nc2")
+        row = await self.db.get_first(f"SELECT title FROM `{TEST_TABLE}` WHERE aweme_id=%s", "3")
+        self.assertIsNone(row["title"])
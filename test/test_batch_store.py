@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from typing import Dict, List
+from unittest import IsolatedAsyncioTestCase, mock
+
+from base.base_crawler import AbstractStore
+from store import douyin as douyin_store
+from store.batch_store import BatchStore
+from store.douyin import DouyinStoreFactory
+
+
+class MemoryStore(AbstractStore):
+    def __init__(self):
+        self.batches: List[List[Dict]] = []
+
+    async def store_content(self, content_item: Dict):
+        self.batches.append([content_item])
+
+    async def store_many(self, content_items: List[Dict]):
+        self.batches.append(content_items)
+
+
+class FlakyStore(MemoryStore):
+    """前 failures 次批量写入失败"""
+
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+
+    async def store_many(self, content_items: List[Dict]):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("database is locked")
+        await super().store_many(content_items)
+
+
+class TestBatchStore(IsolatedAsyncioTestCase):
+    async def test_flush_by_count(self):
+        memory_store = MemoryStore()
+        batch_store = BatchStore(memory_store, batch_size=10, flush_interval=60)
+        for i in range(25):
+            await batch_store.store_content({"id": i})
+        self.assertEqual([len(batch) for batch in memory_store.batches], [10, 10])
+
+        await batch_store.close()
+        self.assertEqual([len(batch) for batch in memory_store.batches], [10, 10, 5])
+        self.assertEqual(batch_store.metrics.item_count, 25)
+        self.assertEqual(batch_store.metrics.max_batch_size, 10)
+
+    async def test_flush_by_age(self):
+        memory_store = MemoryStore()
+        batch_store = BatchStore(memory_store, batch_size=100, flush_interval=0.05)
+        await batch_store.store_content({"id": 1})
+        await batch_store.store_content({"id": 2})
+        self.assertEqual(memory_store.batches, [])
+
+        await asyncio.sleep(0.1)
+        self.assertEqual(memory_store.batches, [[{"id": 1}, {"id": 2}]])
+        await batch_store.close()
+        self.assertEqual(batch_store.metrics.flush_count, 1)
+
+    async def test_failed_flush_keeps_the_batch(self):
+        memory_store = FlakyStore(failures=2)
+        batch_store = BatchStore(memory_store, batch_size=2, flush_interval=60, max_flush_retries=3)
+        for i in range(4):
+            await batch_store.store_content({"id": i})
+        # 失败的数据放回缓存最前面，和后面的数据一起在下一次落盘时写入，顺序不变
+        self.assertEqual(memory_store.batches, [[{"id": 0}, {"id": 1}, {"id": 2}, {"id": 3}]])
+
+        await batch_store.close()
+        self.assertEqual(batch_store.metrics.failed_flush_count, 2)
+        self.assertEqual(batch_store.metrics.dropped_count, 0)
+
+    async def test_close_raises_after_dropping_a_batch(self):
+        memory_store = FlakyStore(failures=100)
+        batch_store = BatchStore(memory_store, batch_size=100, flush_interval=0.01, max_flush_retries=2)
+        await batch_store.store_content({"id": 1})
+        await asyncio.sleep(0.1)
+        self.assertEqual(batch_store.metrics.dropped_count, 1)
+        with self.assertRaises(OSError):
+            await batch_store.close()
+
+
+class ClosingStore(MemoryStore):
+    def __init__(self):
+        super().__init__()
+        self.closed = False
+
+    async def store_many(self, content_items: List[Dict]):
+        if self.closed:
+            raise RuntimeError("store is closed")
+        await super().store_many(content_items)
+
+    async def close(self):
+        self.closed = True
+
+
+class TestSharedDouyinStore(IsolatedAsyncioTestCase):
+    async def test_store_closed_by_the_last_crawler(self):
+        memory_store = ClosingStore()
+        with mock.patch.object(DouyinStoreFactory, "create_store", return_value=memory_store):
+            # 定时任务和同步任务的两个爬虫同时在写
+            douyin_store.open_douyin_store()
+            douyin_store.open_douyin_store()
+            await DouyinStoreFactory.get_shared_store().store_content({"id": 1})
+            await douyin_store.close_douyin_store()
+            # 先结束的爬虫只把缓存落盘，不关闭存储
+            self.assertEqual(memory_store.batches, [[{"id": 1}]])
+            self.assertFalse(memory_store.closed)
+
+            await DouyinStoreFactory.get_shared_store().store_content({"id": 2})
+            await douyin_store.close_douyin_store()
+            self.assertEqual(memory_store.batches, [[{"id": 1}], [{"id": 2}]])
+            self.assertTrue(memory_store.closed)
+            self.assertIsNone(DouyinStoreFactory.shared_store)
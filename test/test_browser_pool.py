@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+from typing import Callable, Dict, List
+from unittest import IsolatedAsyncioTestCase
+
+from tools.browser_pool import BrowserPool
+
+
+class FakeEmitter:
+    def __init__(self):
+        self.handlers: Dict[str, List[Callable]] = {}
+
+    def on(self, event: str, handler: Callable) -> None:
+        self.handlers.setdefault(event, []).append(handler)
+
+    def emit(self, event: str) -> None:
+        for handler in self.handlers.get(event, []):
+            handler(self)
+
+
+class FakePage(FakeEmitter):
+    url = "https://www.douyin.com/"
+
+    def __init__(self):
+        super().__init__()
+        self.closed = False
+        self.hang = False
+
+    def is_closed(self) -> bool:
+        return self.closed
+
+    async def evaluate(self, expression: str):
+        if self.hang:
+            await asyncio.sleep(10)
+        return 1
+
+
+class FakeContext(FakeEmitter):
+    browser = None
+
+    def __init__(self):
+        super().__init__()
+        self.closed = False
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+class TestBrowserPool(IsolatedAsyncioTestCase):
+    def create_pool(self, startup_seconds: float = 0.2, **kwargs) -> BrowserPool:
+        self.contexts: List[FakeContext] = []
+
+        async def create_context():
+            # 启动浏览器、注入脚本、打开首页
+            await asyncio.sleep(startup_seconds)
+            context = FakeContext()
+            self.contexts.append(context)
+            return context, FakePage()
+
+        options = dict(size=2, max_uses=3, health_check_timeout=0.05)
+        options.update(kwargs)
+        return BrowserPool(create_context, **options)  # type: ignore
+
+    async def asyncTearDown(self):
+        await self.pool.close()
+
+    async def test_reuse_warm_context(self):
+        self.pool = self.create_pool()
+        async with self.pool.lease() as first:
+            pass
+        start = time.monotonic()
+        async with self.pool.lease() as second:
+            pass
+        self.assertLess(time.monotonic() - start, 0.05)
+        self.assertIs(first, second)
+        self.assertEqual(self.pool.stats.created, 1)
+        self.assertEqual(self.pool.stats.reused, 1)
+
+    async def test_recycle_after_max_uses(self):
+        self.pool = self.create_pool(startup_seconds=0)
+        for _ in range(3):
+            async with self.pool.lease():
+                pass
+        self.assertTrue(self.contexts[0].closed)
+        # 回收之后后台预热一个新的上下文
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.pool.idle_count, 1)
+        self.assertEqual(self.pool.stats.recycled, 1)
+
+    async def test_unhealthy_context_replaced(self):
+        self.pool = self.create_pool(startup_seconds=0)
+        async with self.pool.lease() as crashed:
+            crashed.page.emit("crash")
+        async with self.pool.lease() as hung:
+            self.assertIsNot(hung, crashed)
+            hung.page.hang = True
+        async with self.pool.lease() as entry:
+            self.assertIsNot(entry, hung)
+        self.assertEqual(self.pool.stats.unhealthy, 1)
+        self.assertTrue(all(context.closed for context in self.contexts[:2]))
+
+    async def test_size_limit(self):
+        self.pool = self.create_pool(startup_seconds=0, size=1)
+        order = []
+
+        async def run(name: str):
+            async with self.pool.lease():
+                order.append(f"{name} start")
+                await asyncio.sleep(0.01)
+                order.append(f"{name} end")
+
+        await asyncio.gather(run("a"), run("b"))
+        self.assertEqual(order, ["a start", "a end", "b start", "b end"])
+        self.assertEqual(self.pool.stats.created, 1)
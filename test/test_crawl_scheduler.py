@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from typing import List, Optional
+from unittest import IsolatedAsyncioTestCase
+
+from media_platform.douyin.progress import CrawlProgress
+from tools.distributed_lock import LocalLock, RedisLock
+from video.job_store import MemoryCrawlJobStore
+from video.scheduler import (RUN_STATUS_LOST_LOCK, RUN_STATUS_OK, RUN_STATUS_PARTIAL, RUN_STATUS_SKIPPED,
+                             RUN_STATUS_TIMEOUT, CrawlJob, CrawlScheduler)
+
+
+class FakeCrawler:
+    """每次运行抓 per_run 个视频，hang 为 True 时一直卡住"""
+
+    def __init__(self, per_run: int = 100, hang: bool = False, delay: float = 0):
+        self.per_run = per_run
+        self.hang = hang
+        self.delay = delay
+        self.runs: List[List[str]] = []
+        self.progress = CrawlProgress()
+
+    def init_config(self, platform: str, login_type: str, crawler_type: str,
+                    aweme_ids: Optional[List[str]] = None, time_budget: Optional[float] = None):
+        self.progress = CrawlProgress(aweme_ids)
+
+    async def start(self):
+        self.runs.append(list(self.progress.aweme_ids))
+        if self.hang:
+            await asyncio.Event().wait()
+        await asyncio.sleep(self.delay)
+        for aweme_id in self.progress.aweme_ids[:self.per_run]:
+            self.progress.completed_ids.add(aweme_id)
+
+    def get_unfinished_aweme_ids(self) -> List[str]:
+        return self.progress.get_unfinished_ids()
+
+
+class FakeClientResources:
+    def __init__(self):
+        self.close_count = 0
+
+    async def aclose(self):
+        self.close_count += 1
+
+
+class ExpiringLock(LocalLock):
+    """很快就需要续期，第一次续期就失败，模拟锁过期后被其他进程拿走"""
+
+    def __init__(self, key: str, ttl: float):
+        super().__init__(key, 0.03)
+
+    async def extend(self) -> bool:
+        return False
+
+
+def create_scheduler(crawler: FakeCrawler, job: CrawlJob) -> CrawlScheduler:
+    return CrawlScheduler.create_local(
+        [job], crawler_factory=lambda: crawler, client_resources_factory=FakeClientResources
+    )
+
+
+class TestCrawlScheduler(IsolatedAsyncioTestCase):
+    async def test_carry_over_unfinished(self):
+        crawler = FakeCrawler(per_run=2)
+        job = CrawlJob("carry_over", aweme_ids=lambda: ["1", "2", "3", "4", "5"])
+        scheduler = create_scheduler(crawler, job)
+
+        run = await scheduler.run_job(job)
+        self.assertEqual(run["status"], RUN_STATUS_PARTIAL)
+        self.assertEqual((run["completed"], run["unfinished"]), (2, 3))
+        self.assertIn("throughput", run)
+
+        # 上一次没抓完的视频排在前面
+        run = await scheduler.run_job(job)
+        self.assertEqual(crawler.runs[1], ["3", "4", "5", "1", "2"])
+        self.assertEqual(run["carried_over"], 3)
+
+        runs = await scheduler.job_store.get_runs(job.key)
+        self.assertEqual(len(runs), 2)
+        self.assertEqual(await scheduler.job_store.get_pending(job.key), ["5", "1", "2"])
+
+    async def test_one_run_per_job_key(self):
+        job = CrawlJob("overlap", aweme_ids=lambda: ["1"])
+        store = MemoryCrawlJobStore()
+        schedulers = [
+            CrawlScheduler([job], job_store=store, lock_class=LocalLock, crawler_factory=lambda: FakeCrawler(delay=0.05))
+            for _ in range(2)
+        ]
+        runs = await asyncio.gather(*[scheduler.run_job(job) for scheduler in schedulers])
+        self.assertEqual(sorted(run["status"] for run in runs), [RUN_STATUS_OK, RUN_STATUS_SKIPPED])
+        # 锁已经释放，下一次可以正常运行
+        self.assertEqual((await schedulers[0].run_job(job))["status"], RUN_STATUS_OK)
+
+    async def test_time_budget(self):
+        crawler = FakeCrawler(hang=True)
+        job = CrawlJob("hang", time_budget=0.05, grace_seconds=0.05, aweme_ids=lambda: ["1", "2"])
+        run = await create_scheduler(crawler, job).run_job(job)
+        self.assertEqual(run["status"], RUN_STATUS_TIMEOUT)
+        self.assertEqual(run["unfinished"], 2)
+
+    async def test_lost_lock_cancels_run(self):
+        crawler = FakeCrawler(hang=True)
+        job = CrawlJob("lost_lock", aweme_ids=lambda: ["1"])
+        store = MemoryCrawlJobStore()
+        scheduler = CrawlScheduler([job], job_store=store, lock_class=ExpiringLock, crawler_factory=lambda: crawler)
+        run = await asyncio.wait_for(scheduler.run_job(job), 1)
+        self.assertEqual(run["status"], RUN_STATUS_LOST_LOCK)
+        # 锁已经不在自己手里，不再写运行记录和没抓完的视频
+        self.assertEqual(await store.get_runs(job.key), [])
+        self.assertEqual(await store.get_pending(job.key), [])
+
+    async def test_run_forever_does_not_pile_up(self):
+        crawler = FakeCrawler(delay=0.1)
+        job = CrawlJob("slow", interval=0.01, aweme_ids=lambda: ["1"])
+        scheduler = create_scheduler(crawler, job)
+        task = asyncio.create_task(scheduler.run_forever())
+        await asyncio.sleep(0.25)
+        scheduler.stop()
+        await asyncio.wait_for(task, 1)
+        # 每次运行 0.1s，间隔 0.01s，运行期间的触发全部跳过
+        self.assertLessEqual(len(crawler.runs), 3)
+        self.assertGreaterEqual(len(crawler.runs), 2)
+
+    async def test_client_resources_shared_across_runs(self):
+        crawlers = [FakeCrawler(), FakeCrawler()]
+        jobs = [CrawlJob("a", aweme_ids=lambda: ["1"]), CrawlJob("b", aweme_ids=lambda: ["2"])]
+        scheduler = CrawlScheduler.create_local(
+            jobs, crawler_factory=lambda: crawlers.pop(0), client_resources_factory=FakeClientResources
+        )
+        for job in jobs + jobs:
+            await scheduler.run_job(job)
+        resources = scheduler.get_crawler(jobs[0]).client_resources
+        # 两个任务、四次运行用的是同一份资源，运行结束时不关闭
+        self.assertIs(scheduler.get_crawler(jobs[1]).client_resources, resources)
+        self.assertEqual(resources.close_count, 0)
+        await scheduler.close()
+        await scheduler.close()
+        self.assertEqual(resources.close_count, 1)
+
+
+class TestRedisLock(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.locks = [RedisLock("test_redis_lock", ttl=5) for _ in range(2)]
+        try:
+            await self.locks[0].redis_client.ping()
+        except Exception as e:
+            self.skipTest(f"redis is not available: {e}")
+        await self.locks[0].redis_client.delete("test_redis_lock")
+
+    async def asyncTearDown(self):
+        for lock in self.locks:
+            await lock.redis_client.close()
+
+    async def test_acquire_extend_release(self):
+        self.assertTrue(await self.locks[0].acquire())
+        self.assertFalse(await self.locks[1].acquire())
+        # 不是持有者，不能续期也不能释放
+        self.assertFalse(await self.locks[1].extend())
+        await self.locks[1].release()
+        self.assertTrue(await self.locks[0].extend())
+        await self.locks[0].release()
+        self.assertTrue(await self.locks[1].acquire())
+        await self.locks[1].release()
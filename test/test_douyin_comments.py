@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import os
+import tempfile
+from typing import Dict, List
+from unittest import IsolatedAsyncioTestCase
+
+from media_platform.douyin.client import DOUYINClient
+from media_platform.douyin.exception import DataFetchError
+from media_platform.douyin.signer import DouYinNativeSigner
+from media_platform.douyin.watermark import CommentWatermark
+from store.douyin import DouyinCommentWatermarkStore
+
+PAGE_SIZE = 20
+
+
+class FakeCommentClient(DOUYINClient):
+    def __init__(self, comment_count: int, reply_count: int = 0):
+        super().__init__(headers={}, playwright_page=None, cookie_dict={}, signer=DouYinNativeSigner())
+        self.comment_count = comment_count
+        self.reply_count = reply_count
+        self.running_sub_comments = 0
+        self.max_running_sub_comments = 0
+
+    async def get_aweme_comments(self, aweme_id: str, cursor: int = 0):
+        await asyncio.sleep(0)
+        comments = [
+            {"cid": f"{aweme_id}-{i}", "reply_comment_total": self.reply_count}
+            for i in range(cursor, min(cursor + PAGE_SIZE, self.comment_count))
+        ]
+        return {"comments": comments, "cursor": cursor + PAGE_SIZE, "has_more": int(cursor + PAGE_SIZE < self.comment_count)}
+
+    async def get_sub_comments(self, aweme_id: str, comment_id: str, cursor: int = 0):
+        self.running_sub_comments += 1
+        self.max_running_sub_comments = max(self.max_running_sub_comments, self.running_sub_comments)
+        try:
+            await asyncio.sleep(0.001)
+            if comment_id.endswith("-3"):
+                raise DataFetchError("sub comment error")
+            comments = [
+                {"cid": f"{comment_id}-{i}", "reply_id": comment_id}
+                for i in range(cursor, min(cursor + PAGE_SIZE, self.reply_count))
+            ]
+            return {"comments": comments, "cursor": cursor + PAGE_SIZE, "has_more": int(cursor + PAGE_SIZE < self.reply_count)}
+        finally:
+            self.running_sub_comments -= 1
+
+
+class EmptyPageClient(FakeCommentClient):
+    def __init__(self, next_cursor_step: int):
+        super().__init__(comment_count=0)
+        self.next_cursor_step = next_cursor_step
+        self.request_count = 0
+
+    async def get_aweme_comments(self, aweme_id: str, cursor: int = 0):
+        self.request_count += 1
+        return {"comments": [], "cursor": cursor + self.next_cursor_step, "has_more": 1}
+
+
+class TimelineCommentClient(FakeCommentClient):
+    """comments are returned newest first, like a video that keeps getting new comments"""
+
+    def __init__(self, comment_count: int):
+        super().__init__(comment_count=0)
+        self.create_times = list(range(comment_count, 0, -1))
+        self.request_count = 0
+
+    def add_comments(self, count: int):
+        newest = self.create_times[0]
+        self.create_times = list(range(newest + count, newest, -1)) + self.create_times
+
+    async def get_aweme_comments(self, aweme_id: str, cursor: int = 0):
+        self.request_count += 1
+        comments = [
+            {"cid": f"c{create_time}", "create_time": create_time}
+            for create_time in self.create_times[cursor:cursor + PAGE_SIZE]
+        ]
+        return {"comments": comments, "cursor": cursor + PAGE_SIZE, "has_more": int(cursor + PAGE_SIZE < len(self.create_times))}
+
+
+class TestDouYinComments(IsolatedAsyncioTestCase):
+    async def collect(self, client: DOUYINClient, aweme_id: str, **kwargs) -> List[Dict]:
+        result = []
+        async for comments in client.iter_aweme_all_comments(aweme_id, crawl_interval=0, **kwargs):
+            self.assertLessEqual(len(comments), PAGE_SIZE)
+            result.extend(comments)
+            if kwargs.get("watermark"):
+                kwargs["watermark"].commit(comments)
+        return result
+
+    async def test_empty_page_with_has_more_stops(self):
+        for next_cursor_step in (0, PAGE_SIZE):
+            client = EmptyPageClient(next_cursor_step)
+            self.assertEqual(await asyncio.wait_for(self.collect(client, "1"), timeout=1), [])
+            self.assertLessEqual(client.request_count, 3)
+
+    async def test_stream_comment_pages(self):
+        client = FakeCommentClient(comment_count=1001)
+        comments = await self.collect(client, "1")
+        self.assertEqual(len(comments), 1001)
+        self.assertEqual(client.max_running_sub_comments, 0)
+
+    async def test_sub_comment_fanout_is_bounded(self):
+        client = FakeCommentClient(comment_count=50, reply_count=45)
+        sub_comment_semaphore = asyncio.Semaphore(5)
+        results = await asyncio.gather(*[
+            self.collect(client, aweme_id, is_fetch_sub_comments=True, max_sub_comment_fanout=3,
+                         sub_comment_semaphore=sub_comment_semaphore)
+            for aweme_id in ("1", "2", "3")
+        ])
+        for comments in results:
+            # 50 条一级评论，其中 "-3" 的子评论抓取失败被跳过
+            self.assertEqual(len(comments), 50 + 49 * 45)
+            self.assertEqual(len({comment["cid"] for comment in comments}), len(comments))
+        self.assertLessEqual(client.max_running_sub_comments, 5)
+        self.assertGreater(client.max_running_sub_comments, 1)
+
+    async def test_stop_early_cancels_sub_comments(self):
+        client = FakeCommentClient(comment_count=100, reply_count=100)
+        pages = client.iter_aweme_all_comments("1", crawl_interval=0, is_fetch_sub_comments=True)
+        await pages.__anext__()
+        await pages.aclose()
+        await asyncio.sleep(0.01)
+        self.assertEqual(client.running_sub_comments, 0)
+
+    async def test_watermark_stops_at_seen_page(self):
+        client = TimelineCommentClient(comment_count=2000)
+        watermark = CommentWatermark("1")
+        self.assertEqual(len(await self.collect(client, "1", watermark=watermark)), 2000)
+        self.assertTrue(watermark.completed)
+        full_request_count, client.request_count = client.request_count, 0
+
+        client.add_comments(15)
+        watermark = CommentWatermark.from_dict(watermark.to_dict())
+        comments = await self.collect(client, "1", watermark=watermark)
+        self.assertEqual({comment["cid"] for comment in comments if comment["create_time"] > 2000},
+                         {f"c{i}" for i in range(2001, 2016)})
+        self.assertEqual(watermark.max_create_time, 2015)
+        self.assertLess(client.request_count, full_request_count * 0.1)
+
+    async def test_watermark_resumes_unfinished_crawl(self):
+        client = TimelineCommentClient(comment_count=100)
+        watermark = CommentWatermark("1", max_create_time=100, max_comment_id="c100", last_cursor=60, completed=False)
+        comments = await self.collect(client, "1", watermark=watermark)
+        self.assertEqual([comment["create_time"] for comment in comments], list(range(40, 0, -1)))
+        self.assertTrue(watermark.completed)
+        self.assertEqual(client.request_count, 2)
+
+    async def test_watermark_does_not_pass_unstored_page(self):
+        client = TimelineCommentClient(comment_count=100)
+        watermark = CommentWatermark("1")
+        pages = client.iter_aweme_all_comments("1", crawl_interval=0, watermark=watermark)
+        watermark.commit(await pages.__anext__())
+        # 第二页保存失败，调用方停止抓取
+        await pages.__anext__()
+        await pages.aclose()
+
+        item = watermark.to_dict()
+        self.assertEqual((item["last_cursor"], item["completed"], item["max_create_time"]), (PAGE_SIZE, False, 100))
+        comments = await self.collect(client, "1", watermark=CommentWatermark.from_dict(item))
+        self.assertEqual([comment["create_time"] for comment in comments], list(range(100 - PAGE_SIZE, 0, -1)))
+
+    async def test_watermark_store(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            DouyinCommentWatermarkStore.watermark_store_path = tmp_dir
+            try:
+                store = DouyinCommentWatermarkStore()
+                for i in range(5):
+                    await store.save(CommentWatermark("1", max_create_time=i).to_dict())
+                await store.save(CommentWatermark("2", max_create_time=9).to_dict())
+
+                store = DouyinCommentWatermarkStore()
+                self.assertEqual((await store.get("1"))["max_create_time"], 4)
+                self.assertEqual((await store.get("2"))["max_create_time"], 9)
+                self.assertIsNone(await store.get("3"))
+                # 加载时压缩掉旧记录
+                with open(store.file_path, encoding="utf-8") as f:
+                    self.assertEqual(len(f.readlines()), 2)
+            finally:
+                DouyinCommentWatermarkStore.watermark_store_path = "data/douyin"
+
+    async def test_watermark_stores_share_the_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            DouyinCommentWatermarkStore.watermark_store_path = tmp_dir
+            try:
+                # 比如定时任务和同步接口的爬虫各自一个存储
+                store, other_store = DouyinCommentWatermarkStore(), DouyinCommentWatermarkStore()
+                for i in range(5):
+                    await store.save(CommentWatermark("1", max_create_time=i).to_dict())
+                self.assertIsNone(await store.get("2"))
+                await other_store.save(CommentWatermark("2", max_create_time=9).to_dict())
+                # 文件变了，缓存里没有的视频重新读取，压缩时不会丢掉其他存储追加的记录
+                self.assertEqual((await store.get("2"))["max_create_time"], 9)
+                self.assertEqual((await DouyinCommentWatermarkStore().get("1"))["max_create_time"], 4)
+                with open(store.file_path, encoding="utf-8") as f:
+                    self.assertEqual(len(f.readlines()), 2)
+                self.assertEqual([name for name in os.listdir(tmp_dir) if name.endswith(".tmp")], [])
+            finally:
+                DouyinCommentWatermarkStore.watermark_store_path = "data/douyin"
+
+    async def test_watermark_cache_is_bounded(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            DouyinCommentWatermarkStore.watermark_store_path = tmp_dir
+            try:
+                store = DouyinCommentWatermarkStore(cache_size=3)
+                for i in range(10):
+                    await store.save(CommentWatermark(str(i), max_create_time=i).to_dict())
+                self.assertEqual(len(store._cache), 3)
+                # 被淘汰的从文件里重新读取
+                self.assertEqual((await store.get("0"))["max_create_time"], 0)
+                self.assertLessEqual(len(store._cache), 3)
+            finally:
+                DouyinCommentWatermarkStore.watermark_store_path = "data/douyin"
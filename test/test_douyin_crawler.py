@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from unittest import IsolatedAsyncioTestCase, mock
+
+import config
+from media_platform.douyin.core import DouYinCrawler
+from media_platform.douyin.exception import DataFetchError, SessionExpiredError
+
+
+class FakeDouYinClient:
+    def __init__(self, delay: float = 0):
+        self.fetched_count = 0
+        self.delay = delay
+
+    async def get_video_by_id(self, aweme_id: str):
+        await asyncio.sleep(self.delay)
+        self.fetched_count += 1
+        return {"aweme_id": aweme_id}
+
+    def release_proxy_lease(self):
+        pass
+
+
+class TestDouYinCrawler(IsolatedAsyncioTestCase):
+    async def test_get_specified_awemes_pipeline(self):
+        aweme_ids = [str(i) for i in range(500)]
+        stored_ids = []
+        max_fetched_ahead = 0
+        crawler = DouYinCrawler()
+        crawler.dy_client = FakeDouYinClient()
+
+        async def slow_store(aweme_detail):
+            nonlocal max_fetched_ahead
+            await asyncio.sleep(0.001)
+            stored_ids.append(aweme_detail["aweme_id"])
+            max_fetched_ahead = max(max_fetched_ahead, crawler.dy_client.fetched_count - len(stored_ids))
+
+        with mock.patch.object(config, "DY_SPECIFIED_ID_LIST", aweme_ids), \
+                mock.patch.object(config, "STORE_QUEUE_SIZE", 10), \
+                mock.patch("store.douyin.update_douyin_aweme", slow_store):
+            await crawler.get_specified_awemes()
+
+        self.assertEqual(sorted(stored_ids), sorted(aweme_ids))
+        # queue size + in-flight fetches + in-flight stores, fetchers must wait for the store
+        self.assertLessEqual(
+            max_fetched_ahead, 10 + config.MAX_CONCURRENCY_NUM + config.MAX_STORE_CONCURRENCY_NUM
+        )
+
+    async def test_browserless_start_with_stored_cookies(self):
+        crawler = DouYinCrawler()
+        crawler.init_config(platform="dy", login_type="cookie", crawler_type="detail")
+
+        def no_browser(*args, **kwargs):
+            raise AssertionError("browser should not be launched")
+
+        with mock.patch.object(config, "COOKIES", "sessionid=abc; ttwid=xyz"), \
+                mock.patch.object(config, "ENABLE_SESSION_SNAPSHOT", False), \
+                mock.patch.object(config, "ENABLE_IP_PROXY", False), \
+                mock.patch.object(config, "DY_SPECIFIED_ID_LIST", []), \
+                mock.patch("media_platform.douyin.core.get_browser_pool", no_browser):
+            await crawler.start()
+
+        self.assertIsNone(crawler.dy_client.playwright_page)
+        self.assertEqual(crawler.dy_client.cookie_dict["sessionid"], "abc")
+
+    async def test_time_budget_leaves_unfinished_awemes(self):
+        crawler = DouYinCrawler()
+        crawler.init_config(
+            platform="dy", login_type="cookie", crawler_type="detail",
+            aweme_ids=[str(i) for i in range(100)], time_budget=0.05,
+        )
+        crawler.dy_client = FakeDouYinClient(delay=0.01)
+
+        async def store(aweme_detail):
+            pass
+
+        with mock.patch.object(config, "MAX_CONCURRENCY_NUM", 1), \
+                mock.patch("store.douyin.update_douyin_aweme", store):
+            await crawler.get_specified_awemes()
+
+        unfinished = crawler.get_unfinished_aweme_ids()
+        self.assertGreater(len(unfinished), 0)
+        self.assertEqual(crawler.progress.completed + len(unfinished), 100)
+        self.assertEqual(crawler.progress.stored, crawler.progress.fetched)
+        # 没抓完的是列表后面的部分
+        self.assertEqual(unfinished, [str(i) for i in range(100 - len(unfinished), 100)])
+
+
+    async def test_enable_comments_overrides_config(self):
+        crawler = DouYinCrawler()
+        crawler.init_config(
+            platform="dy", login_type="cookie", crawler_type="detail", aweme_ids=["1", "2"], enable_comments=False,
+        )
+        crawler.dy_client = FakeDouYinClient()
+
+        async def store(aweme_detail):
+            pass
+
+        async def no_comments(*args, **kwargs):
+            raise AssertionError("comments should not be fetched")
+
+        with mock.patch.object(config, "ENABLE_GET_COMMENTS", True), \
+                mock.patch.object(crawler, "get_aweme_comments", no_comments), \
+                mock.patch("store.douyin.update_douyin_aweme", store):
+            await crawler.get_specified_awemes()
+
+        self.assertEqual(crawler.progress.completed, 2)
+
+    async def test_bad_aweme_does_not_end_the_run(self):
+        crawler = DouYinCrawler()
+        crawler.init_config(platform="dy", login_type="cookie", crawler_type="detail", aweme_ids=["1", "2", "3"])
+        crawler.dy_client = FakeDouYinClient()
+        get_video_by_id = crawler.dy_client.get_video_by_id
+
+        async def flaky_get_video_by_id(aweme_id: str):
+            if aweme_id == "2":
+                raise RuntimeError("browser crashed")
+            return await get_video_by_id(aweme_id)
+
+        async def store(aweme_detail):
+            pass
+
+        crawler.dy_client.get_video_by_id = flaky_get_video_by_id
+        with mock.patch.object(config, "ENABLE_GET_COMMENTS", False), \
+                mock.patch("store.douyin.update_douyin_aweme", store):
+            await crawler.get_specified_awemes()
+
+        self.assertEqual(crawler.get_unfinished_aweme_ids(), ["2"])
+        self.assertEqual(crawler.progress.failed, 1)
+
+    async def test_failed_detail_stays_unfinished(self):
+        crawler = DouYinCrawler()
+        crawler.init_config(platform="dy", login_type="cookie", crawler_type="detail", aweme_ids=["1", "2", "3"])
+        crawler.dy_client = FakeDouYinClient()
+        get_video_by_id = crawler.dy_client.get_video_by_id
+
+        async def failing_get_video_by_id(aweme_id: str):
+            if aweme_id == "2":
+                raise DataFetchError("blocked")
+            return await get_video_by_id(aweme_id)
+
+        async def store(aweme_detail):
+            pass
+
+        crawler.dy_client.get_video_by_id = failing_get_video_by_id
+        with mock.patch.object(config, "ENABLE_GET_COMMENTS", False), \
+                mock.patch("store.douyin.update_douyin_aweme", store):
+            await crawler.get_specified_awemes()
+
+        # get_aweme_detail swallows the error, the aweme must still be carried over
+        self.assertEqual(crawler.get_unfinished_aweme_ids(), ["2"])
+        self.assertEqual((crawler.progress.completed, crawler.progress.failed), (2, 1))
+
+    async def test_failed_fetcher_stops_its_siblings(self):
+        crawler = DouYinCrawler()
+        crawler.init_config(
+            platform="dy", login_type="cookie", crawler_type="detail", aweme_ids=[str(i) for i in range(100)],
+        )
+        crawler.dy_client = FakeDouYinClient(delay=0.001)
+        get_video_by_id = crawler.dy_client.get_video_by_id
+
+        async def expiring_get_video_by_id(aweme_id: str):
+            if aweme_id == "20":
+                raise SessionExpiredError("all accounts expired")
+            return await get_video_by_id(aweme_id)
+
+        async def slow_store(aweme_detail):
+            await asyncio.sleep(0.01)
+
+        crawler.dy_client.get_video_by_id = expiring_get_video_by_id
+        with mock.patch.object(config, "ENABLE_GET_COMMENTS", False), \
+                mock.patch.object(config, "STORE_QUEUE_SIZE", 1), \
+                mock.patch.object(config, "MAX_CONCURRENCY_NUM", 4), \
+                mock.patch("store.douyin.update_douyin_aweme", slow_store):
+            with self.assertRaises(SessionExpiredError):
+                await asyncio.wait_for(crawler.get_specified_awemes(), 5)
+
+    async def test_errors_of_other_fetchers_are_logged(self):
+        crawler = DouYinCrawler()
+        crawler.init_config(
+            platform="dy", login_type="cookie", crawler_type="detail", aweme_ids=[str(i) for i in range(100)],
+        )
+        crawler.dy_client = FakeDouYinClient()
+
+        async def expired_get_video_by_id(aweme_id: str):
+            raise SessionExpiredError(f"expired at {aweme_id}")
+
+        crawler.dy_client.get_video_by_id = expired_get_video_by_id
+        with mock.patch.object(config, "ENABLE_GET_COMMENTS", False), \
+                mock.patch.object(config, "MAX_CONCURRENCY_NUM", 4), \
+                mock.patch("media_platform.douyin.core.utils.logger") as logger:
+            with self.assertRaises(SessionExpiredError):
+                await crawler.get_specified_awemes()
+        # every fetcher failed before any of them could be cancelled, only the first is raised
+        logged = [call.args[0] for call in logger.error.call_args_list if "another fetch worker" in call.args[0]]
+        self.assertEqual(len(logged), 3)
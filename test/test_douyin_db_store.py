@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# @Desc    : django 存储的批量 upsert，在 sqlite 测试库上运行，不会写到 db.sqlite3
+import asyncio
+from typing import Dict
+from unittest import IsolatedAsyncioTestCase
+
+from django.db import connection
+
+from store.douyin import make_douyin_comment_item
+from store.douyin.douyin_store_impl import DouyinDbStoreImplement
+from video.models import VideoComment, VideoInfo
+
+
+def make_video(aweme_id: str, **fields) -> Dict:
+    item = {field: "" for field in DouyinDbStoreImplement.video_update_fields}
+    item.update({"aweme_id": aweme_id, "create_time": 1700000000, "last_modify_ts": 1700000000000})
+    item.update(fields)
+    return item
+
+
+class TestDouyinDbStore(IsolatedAsyncioTestCase):
+    async def run_on_db_thread(self, func, *args):
+        # django 的连接和线程绑定，建库、写入、查询都放在存储的专用线程里
+        return await asyncio.get_running_loop().run_in_executor(DouyinDbStoreImplement.db_executor, func, *args)
+
+    async def asyncSetUp(self):
+        self.old_db_name = await self.run_on_db_thread(
+            lambda: connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        )
+        self.store = DouyinDbStoreImplement()
+
+    async def asyncTearDown(self):
+        await self.run_on_db_thread(lambda: connection.creation.destroy_test_db(self.old_db_name, verbosity=0))
+
+    async def test_store_many_updates_on_conflict(self):
+        await self.store.store_many([
+            make_video("1", title="old title", liked_count="10"),
+            make_video("2", title="other", liked_count="5"),
+        ])
+        await self.store.store_many([
+            make_video("1", title="stale title", liked_count="11"),
+            # 同一批里重复的视频只保留最后一条
+            make_video("1", title="new title", liked_count="12", last_modify_ts=1700000001000),
+        ])
+
+        videos = await self.run_on_db_thread(lambda: {v.aweme_id: v for v in VideoInfo.objects.all()})
+        self.assertEqual(sorted(videos), ["1", "2"])
+        self.assertEqual(videos["1"].title, "new title")
+        self.assertEqual(videos["1"].liked_count, "12")
+        self.assertEqual(videos["1"].last_modify_ts, 1700000001000)
+        self.assertEqual(videos["2"].title, "other")
+
+    async def test_comment_with_null_user_fields(self):
+        # 注销用户的评论，接口返回的用户字段是 null
+        comment = make_douyin_comment_item("1", {
+            "cid": "100", "text": "hello", "create_time": None,
+            "user": {"uid": None, "sec_uid": None, "signature": None, "nickname": None, "avatar_thumb": None},
+        })
+        await self.store.store_comments([comment])
+
+        stored = await self.run_on_db_thread(lambda: VideoComment.objects.get(comment_id="100"))
+        self.assertEqual(stored.content, "hello")
+        self.assertEqual(stored.nickname, "")
+        self.assertEqual(stored.user_signature, "")
+        self.assertEqual(stored.create_time, 0)
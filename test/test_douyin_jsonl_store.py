@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+from unittest import IsolatedAsyncioTestCase
+
+from store.douyin.douyin_store_impl import DouyinJsonlStoreImplement, DouyinJsonStoreImplement
+
+
+class TestDouyinJsonlStore(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.store_path = tempfile.mkdtemp()
+        self.items = [{"aweme_id": str(i), "title": f"标题 {i}", "desc": "a\nb"} for i in range(100)]
+
+    async def test_rotate_and_load_item(self):
+        store = DouyinJsonlStoreImplement(segment_max_bytes=1024, enable_index=True)
+        store.jsonl_store_path = self.store_path
+        for i in range(0, len(self.items), 10):
+            await store.store_many(self.items[i:i + 10])
+
+        file_prefix = store.make_save_file_prefix("contents")
+        self.assertTrue(os.path.exists(store.make_segment_file_name(file_prefix, 1)), msg="segment should rotate")
+        self.assertEqual(await store.load_item("contents", "42"), self.items[42])
+        self.assertIsNone(await store.load_item("contents", "not_exists"))
+
+    async def test_export_same_as_legacy_json(self):
+        store = DouyinJsonlStoreImplement(segment_max_bytes=1024)
+        store.jsonl_store_path = os.path.join(self.store_path, "jsonl")
+        legacy_store = DouyinJsonStoreImplement()
+        legacy_store.json_store_path = os.path.join(self.store_path, "json")
+        for item in self.items:
+            await store.store_content(item)
+            await legacy_store.store_content(item)
+
+        json_file_name = await store.export_to_json("contents")
+        with open(json_file_name, encoding="utf-8") as f, \
+                open(legacy_store.make_save_file_name("contents"), encoding="utf-8") as legacy_f:
+            self.assertEqual(f.read(), legacy_f.read())
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+from unittest import IsolatedAsyncioTestCase
+
+import httpx
+
+from media_platform.douyin.client import DOUYINClient
+from media_platform.douyin.rate_limiter import AdaptiveRateController
+from media_platform.douyin.retry import CircuitBreakerRegistry, RetryBudget, RetryPolicy
+from media_platform.douyin.signer import DouYinNativeSigner
+from media_platform.douyin.transport import DouYinTransport
+from proxy.providers import FakeProxyProvider, FakeProxyValidator
+from proxy.proxy_ip_pool import ProxyIpPool
+
+DETAIL_URI = "/aweme/v1/web/aweme/detail/"
+
+
+class PerProxyTransport:
+    """每个代理同一时刻只能处理一个请求，模拟平台按 IP 限流"""
+
+    def __init__(self, latency: float = 0.02, blocked_proxies: Optional[set] = None):
+        self.latency = latency
+        self.blocked_proxies = blocked_proxies or set()
+        self.sent_proxies: List[str] = []
+        self.discarded_proxies: List[str] = []
+        self._locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    async def request(self, method: str, url: str, proxies=None, **kwargs) -> httpx.Response:
+        proxy_url = list(proxies.values())[0] if proxies else "direct"
+        async with self._locks[proxy_url]:
+            self.sent_proxies.append(proxy_url)
+            await asyncio.sleep(self.latency)
+        if proxy_url in self.blocked_proxies:
+            return httpx.Response(200, json={"status_code": 8, "status_msg": "blocked"})
+        return httpx.Response(200, json={"status_code": 0, "aweme_detail": {"aweme_id": "1"}})
+
+    def discard(self, proxies) -> None:
+        self.discarded_proxies.append(list(proxies.values())[0])
+
+
+class CommentTransport(PerProxyTransport):
+    """一级评论每条都有子评论"""
+
+    async def request(self, method: str, url: str, proxies=None, **kwargs) -> httpx.Response:
+        await super().request(method, url, proxies=proxies, **kwargs)
+        if "/comment/list/reply/" in url:
+            return httpx.Response(200, json={"status_code": 0, "comments": [{"cid": "sub"}], "has_more": 0})
+        comments = [{"cid": str(i), "reply_comment_total": 1} for i in range(4)]
+        return httpx.Response(200, json={"status_code": 0, "comments": comments, "has_more": 0})
+
+
+class TestDouYinProxyRotation(IsolatedAsyncioTestCase):
+    async def create_client(self, ip_pool_count: int, sticky_requests: int = 1,
+                            transport: Optional[PerProxyTransport] = None) -> DOUYINClient:
+        self.pool = ProxyIpPool(
+            ip_pool_count, False, FakeProxyProvider(), validator=FakeProxyValidator(), refill_interval=60
+        )
+        await self.pool.load_proxies()
+        return DOUYINClient(
+            headers={"User-Agent": "Mozilla/5.0"},
+            playwright_page=None,
+            cookie_dict={},
+            signer=DouYinNativeSigner(),
+            transport=transport or PerProxyTransport(),  # type: ignore
+            rate_controller=AdaptiveRateController(enabled=False),
+            retry_policy=RetryPolicy(max_retries=3, base_delay=0, max_delay=0),
+            retry_budget=RetryBudget(ratio=0, min_retries=100),
+            circuit_breakers=CircuitBreakerRegistry(failure_threshold=100, recovery_timeout=60),
+            proxy_pool=self.pool,
+            proxy_sticky_requests=sticky_requests,
+        )
+
+    async def asyncTearDown(self):
+        await self.pool.close()
+
+    async def test_lease_per_request(self):
+        client = await self.create_client(ip_pool_count=10)
+        await asyncio.gather(*[client.get(DETAIL_URI, {"aweme_id": "1"}) for _ in range(10)])
+        # 并发的请求分散到不同的 IP 上，用完之后全部归还
+        self.assertEqual(len(set(client.transport.sent_proxies)), 10)
+        self.assertTrue(all(state.in_flight == 0 for state in self.pool.proxies.values()))
+
+    async def test_sticky_session(self):
+        client = await self.create_client(ip_pool_count=10, sticky_requests=3)
+        for _ in range(6):
+            await client.get(DETAIL_URI, {"aweme_id": "1"})
+        sent = client.transport.sent_proxies
+        self.assertEqual(len(set(sent[:3])), 1)
+        self.assertEqual(len(set(sent[3:])), 1)
+        self.assertNotEqual(sent[0], sent[3])
+        self.assertTrue(all(state.in_flight == 0 for state in self.pool.proxies.values()))
+
+    async def test_blocked_proxy_rotated(self):
+        transport = PerProxyTransport()
+        client = await self.create_client(ip_pool_count=4, sticky_requests=10, transport=transport)
+        await client.get(DETAIL_URI, {"aweme_id": "1"})
+        transport.blocked_proxies.add(transport.sent_proxies[0])
+        await client.get(DETAIL_URI, {"aweme_id": "1"})
+        await client.get(DETAIL_URI, {"aweme_id": "1"})
+        # 被风控之后不再继续粘在这个 IP 上
+        self.assertEqual(transport.sent_proxies[1], transport.sent_proxies[0])
+        self.assertNotEqual(transport.sent_proxies[2], transport.sent_proxies[0])
+        client.release_proxy_lease()
+
+    async def test_comment_tasks_release_their_leases(self):
+        client = await self.create_client(ip_pool_count=4, sticky_requests=10, transport=CommentTransport(latency=0))
+        pages = [
+            page async for page in client.iter_aweme_all_comments("1", crawl_interval=0, is_fetch_sub_comments=True)
+        ]
+        self.assertEqual(len(pages), 5)
+        client.release_proxy_lease()
+        # 评论和子评论的协程各自租用的 IP 在协程结束时都还回去了
+        self.assertTrue(all(state.in_flight == 0 for state in self.pool.proxies.values()))
+
+    async def test_dropped_proxy_discarded_from_transport(self):
+        transport = PerProxyTransport()
+        client = await self.create_client(ip_pool_count=2, transport=transport)
+        client.rate_controller.enabled = True
+        await asyncio.gather(*[client.get(DETAIL_URI, {"aweme_id": "1"}) for _ in range(2)])
+        state = next(iter(self.pool.proxies.values()))
+        self.assertIn(f"proxy:{state.key}", client.circuit_breakers.breakers)
+        self.pool._retire(state)
+        self.assertEqual(len(transport.discarded_proxies), 1)
+        self.assertIn(state.proxy.ip, transport.discarded_proxies[0])
+        # 这个 IP 的限速状态和熔断器一起删掉，其他 IP 的保留
+        self.assertFalse(any(state.key in rate_key for rate_key in client.rate_controller.endpoints))
+        self.assertNotIn(f"proxy:{state.key}", client.circuit_breakers.breakers)
+        self.assertTrue(client.rate_controller.endpoints)
+        self.assertTrue(client.circuit_breakers.breakers)
+        self.pool.remove_drop_listener(client._on_proxy_dropped)
+        self.pool._retire(next(iter(self.pool.proxies.values())))
+        self.assertEqual(len(transport.discarded_proxies), 1)
+
+    async def test_throughput_scales_with_pool_size(self):
+        elapsed = {}
+        for ip_pool_count in (1, 4):
+            client = await self.create_client(ip_pool_count=ip_pool_count)
+            queue = list(range(20))
+
+            async def worker():
+                while queue:
+                    queue.pop()
+                    await client.get(DETAIL_URI, {"aweme_id": "1"})
+
+            start = time.monotonic()
+            await asyncio.gather(*[worker() for _ in range(ip_pool_count * 2)])
+            elapsed[ip_pool_count] = time.monotonic() - start
+            await self.pool.close()
+        self.assertGreater(elapsed[1] / elapsed[4], 2.5)
+
+
+class TestDouYinTransportClients(IsolatedAsyncioTestCase):
+    async def test_least_recently_used_client_closed(self):
+        transport = DouYinTransport(max_clients=2)
+        first = transport._get_client({"http://": "http://127.0.0.1:8001"})
+        second = transport._get_client({"http://": "http://127.0.0.1:8002"})
+        self.assertIs(transport._get_client({"http://": "http://127.0.0.1:8001"}), first)
+        transport._get_client({"http://": "http://127.0.0.1:8003"})
+        await asyncio.sleep(0)
+        self.assertFalse(first.is_closed)
+        self.assertTrue(second.is_closed)
+        self.assertEqual(transport.stats.evicted_clients, 1)
+        await transport.aclose()
+        self.assertTrue(first.is_closed)
+
+    async def test_discard_waits_for_in_flight_request(self):
+        transport = DouYinTransport()
+        proxies = {"http://": "http://127.0.0.1:8001"}
+        client = transport._get_client(proxies)
+        transport._in_flight[client] = 1
+        transport.discard(proxies)
+        await asyncio.sleep(0)
+        self.assertFalse(client.is_closed)
+        self.assertIsNot(transport._get_client(proxies), client)
+        await transport.aclose()
+        self.assertTrue(client.is_closed)
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+from typing import List, Optional
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+import httpx
+
+from media_platform.douyin.client import DOUYINClient, DouYinClientResources
+from media_platform.douyin.exception import CircuitOpenError, DataFetchError
+from media_platform.douyin.rate_limiter import AdaptiveRateController, get_endpoint_name
+from media_platform.douyin.retry import (CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, CIRCUIT_OPEN, CircuitBreaker,
+                                         CircuitBreakerRegistry, RetryBudget, RetryPolicy)
+from media_platform.douyin.signer import DouYinNativeSigner
+
+DETAIL_URI = "/aweme/v1/web/aweme/detail/"
+
+
+class CountingSigner(DouYinNativeSigner):
+    def __init__(self):
+        self.sign_count = 0
+
+    async def sign(self, query: str, user_agent: str, timestamp: Optional[int] = None) -> str:
+        self.sign_count += 1
+        return await super().sign(query, user_agent, timestamp)
+
+
+class FlakyTransport:
+    def __init__(self, failures: List[Exception]):
+        self.failures = failures
+        self.sent_params: List[dict] = []
+
+    async def request(self, method: str, url: str, proxies=None, **kwargs) -> httpx.Response:
+        self.sent_params.append(dict(kwargs.get("params") or {}))
+        if self.failures:
+            raise self.failures.pop(0)
+        return httpx.Response(200, json={"status_code": 0, "aweme_detail": {"aweme_id": "1"}})
+
+
+def create_client(transport: FlakyTransport, max_retries: int = 3, budget: Optional[RetryBudget] = None,
+                  failure_threshold: int = 100) -> DOUYINClient:
+    return DOUYINClient(
+        headers={"User-Agent": "Mozilla/5.0"},
+        playwright_page=None,
+        cookie_dict={},
+        signer=CountingSigner(),
+        transport=transport,  # type: ignore
+        rate_controller=AdaptiveRateController(enabled=False),
+        retry_policy=RetryPolicy(max_retries=max_retries, base_delay=0, max_delay=0),
+        retry_budget=budget or RetryBudget(ratio=0, min_retries=100),
+        circuit_breakers=CircuitBreakerRegistry(failure_threshold=failure_threshold, recovery_timeout=60),
+    )
+
+
+class TestDouYinRetry(IsolatedAsyncioTestCase):
+    async def test_retry_and_resign(self):
+        transport = FlakyTransport([httpx.ConnectTimeout("timeout"), DataFetchError("not json")])
+        client = create_client(transport)
+        res = await client.get(DETAIL_URI, {"aweme_id": "1"})
+        self.assertEqual(res["aweme_detail"]["aweme_id"], "1")
+        self.assertEqual(client.signer.sign_count, 3)
+        # 每次都是从原始参数重新签名，不会把上一次的签名带进去
+        for params in transport.sent_params:
+            self.assertEqual(list(params).count("X-Bogus"), 1)
+        self.assertEqual(client.retry_stats.retries, 2)
+        self.assertEqual(client.retry_stats.retry_successes, 1)
+
+    async def test_give_up(self):
+        transport = FlakyTransport([httpx.ReadTimeout("timeout")] * 5)
+        client = create_client(transport, max_retries=2)
+        with self.assertRaises(DataFetchError):
+            await client.get(DETAIL_URI, {"aweme_id": "1"})
+        self.assertEqual(len(transport.sent_params), 3)
+        self.assertEqual(client.retry_stats.give_ups, 1)
+
+    async def test_budget_exhausted(self):
+        transport = FlakyTransport([httpx.ReadTimeout("timeout")] * 10)
+        client = create_client(transport, budget=RetryBudget(ratio=0, min_retries=1))
+        with self.assertRaises(DataFetchError):
+            await client.get(DETAIL_URI, {"aweme_id": "1"})
+        self.assertEqual(len(transport.sent_params), 2)
+        self.assertEqual(client.retry_stats.budget_exhausted, 1)
+
+    async def test_circuit_breaker_fails_fast(self):
+        transport = FlakyTransport([httpx.ConnectError("refused")] * 3)
+        client = create_client(transport, max_retries=5, failure_threshold=3)
+        with self.assertRaises(CircuitOpenError):
+            await client.get(DETAIL_URI, {"aweme_id": "1"})
+        with self.assertRaises(CircuitOpenError):
+            await client.get(DETAIL_URI, {"aweme_id": "2"})
+        self.assertEqual(len(transport.sent_params), 3)
+        self.assertEqual(client.retry_stats.circuit_opened, 2)
+        self.assertEqual(client.retry_stats.circuit_rejected, 2)
+
+    async def test_rejected_request_keeps_the_probe_slot(self):
+        transport = FlakyTransport([])
+        client = create_client(transport)
+        endpoint_breaker = client.circuit_breakers.get(f"endpoint:{get_endpoint_name(DETAIL_URI)}")
+        proxy_breaker = client.circuit_breakers.get("proxy:direct")
+        # 接口熔断器等着探测，IP 熔断器还在熔断期
+        endpoint_breaker.state = CIRCUIT_HALF_OPEN
+        proxy_breaker.state, proxy_breaker.opened_at = CIRCUIT_OPEN, time.monotonic()
+        with self.assertRaises(CircuitOpenError):
+            await client.get(DETAIL_URI, {"aweme_id": "1"})
+        self.assertIsNone(endpoint_breaker.probe_started_at)
+
+        # 反过来，接口熔断时 IP 熔断器的探测名额也要还回去
+        endpoint_breaker.state, endpoint_breaker.opened_at = CIRCUIT_OPEN, time.monotonic()
+        proxy_breaker.state = CIRCUIT_HALF_OPEN
+        with self.assertRaises(CircuitOpenError):
+            await client.get(DETAIL_URI, {"aweme_id": "1"})
+        self.assertIsNone(proxy_breaker.probe_started_at)
+
+        # 熔断期过去之后的请求可以立即探测
+        endpoint_breaker.state = CIRCUIT_HALF_OPEN
+        await client.get(DETAIL_URI, {"aweme_id": "1"})
+        self.assertEqual((endpoint_breaker.state, proxy_breaker.state), (CIRCUIT_CLOSED, CIRCUIT_CLOSED))
+        self.assertEqual(len(transport.sent_params), 1)
+
+    async def test_shared_resources_outlive_the_client(self):
+        signer = ClosingSigner()
+        transport = ClosingTransport([])
+        resources = DouYinClientResources(signer=signer, transport=transport)  # type: ignore
+        for _ in range(2):
+            client = DOUYINClient(
+                headers={"User-Agent": "Mozilla/5.0"}, playwright_page=None, cookie_dict={}, shared_resources=resources,
+            )
+            await client.get(DETAIL_URI, {"aweme_id": "1"})
+            await client.aclose()
+        self.assertFalse(signer.closed or transport.closed)
+        self.assertEqual(signer.sign_count, 2)
+        await resources.aclose()
+        self.assertTrue(signer.closed and transport.closed)
+
+
+class ClosingSigner(CountingSigner):
+    closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+class ClosingTransport(FlakyTransport):
+    stats = ""
+    closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+
+class TestCircuitBreaker(TestCase):
+    def test_state_transitions(self):
+        breaker = CircuitBreaker("endpoint:detail", failure_threshold=2, recovery_timeout=0)
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.record_failure())
+        self.assertTrue(breaker.record_failure())
+        self.assertEqual(breaker.state, CIRCUIT_OPEN)
+        # recovery_timeout 过后只放一个探测请求
+        self.assertTrue(breaker.allow_request())
+        self.assertEqual(breaker.state, CIRCUIT_HALF_OPEN)
+        breaker.recovery_timeout = 60
+        self.assertFalse(breaker.allow_request())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CIRCUIT_OPEN)
+        self.assertFalse(breaker.allow_request())
+
+        breaker.opened_at -= 60
+        self.assertTrue(breaker.allow_request())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CIRCUIT_CLOSED)
+        self.assertTrue(breaker.allow_request())
+
+    def test_backoff_is_bounded(self):
+        policy = RetryPolicy(max_retries=10, base_delay=0.5, max_delay=4)
+        for retry_no in range(10):
+            self.assertLessEqual(policy.get_backoff(retry_no), min(4, 0.5 * 2 ** retry_no))
+
+
+class BlockedTransport(FlakyTransport):
+    def __init__(self, blocked_count: int):
+        super().__init__([])
+        self.blocked_count = blocked_count
+
+    async def request(self, method: str, url: str, proxies=None, **kwargs) -> httpx.Response:
+        self.sent_params.append(dict(kwargs.get("params") or {}))
+        if self.blocked_count:
+            self.blocked_count -= 1
+            return httpx.Response(200, json={"status_code": 8, "status_msg": "need verify"})
+        return httpx.Response(200, json={"status_code": 0, "aweme_detail": {"aweme_id": "1"}})
+
+
+class TestDouYinSessionRefresh(IsolatedAsyncioTestCase):
+    async def test_refresh_once_on_blocked(self):
+        refresh_count = 0
+
+        async def refresh():
+            nonlocal refresh_count
+            refresh_count += 1
+            await asyncio.sleep(0.01)
+
+        transport = BlockedTransport(blocked_count=3)
+        client = create_client(transport)
+        client.session_refresher = refresh
+        results = await asyncio.gather(*[client.get(DETAIL_URI, {"aweme_id": "1"}) for _ in range(3)])
+        # 3 个并发请求同时被风控，只刷新一次会话，刷新之后各自重试成功
+        self.assertEqual(refresh_count, 1)
+        self.assertTrue(all(res["status_code"] == 0 for res in results))
+        self.assertEqual(len(transport.sent_params), 6)
+
+    async def test_no_refresher(self):
+        client = create_client(BlockedTransport(blocked_count=1))
+        res = await client.get(DETAIL_URI, {"aweme_id": "1"})
+        self.assertEqual(res["status_code"], 8)
+
+    async def test_refresh_failure_fails_the_request(self):
+        refresh_count = 0
+
+        async def refresh():
+            nonlocal refresh_count
+            refresh_count += 1
+            await asyncio.sleep(0.01)
+            raise TimeoutError("page.goto timeout")
+
+        transport = BlockedTransport(blocked_count=3)
+        client = create_client(transport)
+        client.session_refresher = refresh
+        results = await asyncio.gather(*[client.get(DETAIL_URI, {"aweme_id": "1"}) for _ in range(3)])
+        # 刷新失败不抛出原始异常，请求按被风控的结果返回，排队的请求也不再重复刷新
+        self.assertEqual(refresh_count, 1)
+        self.assertTrue(all(res["status_code"] == 8 for res in results))
+
+
+class FakePage:
+    """只实现页面状态缓存用到的接口，记录和浏览器通信的次数"""
+
+    def __init__(self):
+        self.main_frame = object()
+        self.evaluate_count = 0
+        self.context = self
+
+    def on(self, event: str, callback) -> None:
+        pass
+
+    async def evaluate(self, expression: str):
+        self.evaluate_count += 1
+        return {"xmst": "page_ms_token"}
+
+    async def cookies(self):
+        return [{"name": "webid", "value": "page_web_id"}]
+
+
+class TestDouYinPageParams(IsolatedAsyncioTestCase):
+    async def test_page_params_served_from_cache(self):
+        transport = FlakyTransport([])
+        client = create_client(transport)
+        page = FakePage()
+        client.attach_playwright_page(page)  # type: ignore
+        for _ in range(3):
+            await client.get(DETAIL_URI, {"aweme_id": "1"})
+        self.assertEqual(page.evaluate_count, 1)
+        for params in transport.sent_params:
+            self.assertEqual((params["msToken"], params["webid"]), ("page_ms_token", "page_web_id"))
+
+    async def test_page_params_without_browser(self):
+        transport = FlakyTransport([])
+        client = create_client(transport)
+        client.cookie_dict = {"msToken": "cookie_ms_token"}
+        await client.get(DETAIL_URI, {"aweme_id": "1"})
+        self.assertEqual(transport.sent_params[0]["msToken"], "cookie_ms_token")
+        self.assertNotIn("webid", transport.sent_params[0])
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import tempfile
+import time
+from unittest import IsolatedAsyncioTestCase, mock
+
+import config
+from media_platform.douyin.core import DEFAULT_USER_AGENT, DouYinCrawler
+from media_platform.douyin.session import SESSION_SNAPSHOT_VERSION, SessionSnapshot
+from store.douyin import DouyinSessionSnapshotStore
+
+
+def make_storage_state(login_expires: float = -1) -> dict:
+    return {
+        "cookies": [
+            {"name": "sessionid", "value": "abc", "domain": ".douyin.com", "path": "/", "expires": login_expires},
+            {"name": "ttwid", "value": "xyz", "domain": ".douyin.com", "path": "/", "expires": -1},
+        ],
+        "origins": [
+            {"origin": "https://www.douyin.com", "localStorage": [{"name": "xmst", "value": "token"}]},
+        ],
+    }
+
+
+class TestSessionSnapshot(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        DouyinSessionSnapshotStore.session_store_path = self.tmp_dir.name
+
+    def tearDown(self):
+        DouyinSessionSnapshotStore.session_store_path = "data/douyin"
+        self.tmp_dir.cleanup()
+
+    def test_expiry_capped_by_login_cookie(self):
+        login_expires = time.time() + 60
+        snapshot = SessionSnapshot.create(make_storage_state(login_expires), "ua", ttl=3600)
+        self.assertEqual(snapshot.expires_at, login_expires)
+        self.assertTrue(snapshot.is_valid())
+        self.assertEqual(snapshot.cookie_str, "sessionid=abc;ttwid=xyz")
+
+        snapshot.expires_at = time.time() - 1
+        self.assertFalse(snapshot.is_valid())
+
+    def test_outdated_or_logged_out_snapshot_is_invalid(self):
+        item = SessionSnapshot.create(make_storage_state(), "ua", ttl=3600).to_dict()
+        item["version"] = SESSION_SNAPSHOT_VERSION - 1
+        self.assertFalse(SessionSnapshot.from_dict(item).is_valid())
+        self.assertFalse(SessionSnapshot.create({"cookies": []}, "ua", ttl=3600).is_valid())
+
+    async def test_store_round_trip(self):
+        store = DouyinSessionSnapshotStore()
+        self.assertIsNone(await store.load())
+        snapshot = SessionSnapshot.create(make_storage_state(), "ua", ttl=3600)
+        await store.save(snapshot.to_dict())
+
+        restored = SessionSnapshot.from_dict(await DouyinSessionSnapshotStore().load())
+        self.assertEqual(restored.storage_state, snapshot.storage_state)
+        self.assertEqual(restored.user_agent, "ua")
+        self.assertTrue(restored.is_valid())
+        self.assertEqual(os.listdir(self.tmp_dir.name), ["session_snapshot.json"])
+
+    async def test_concurrent_saves_from_different_stores(self):
+        # 同一个事件循环里的两个爬虫各自持有一个 store，同时保存不能写坏快照
+        snapshots = [
+            SessionSnapshot.create(make_storage_state(), f"ua_{i}", ttl=3600).to_dict() for i in range(10)
+        ]
+        await asyncio.gather(*[DouyinSessionSnapshotStore().save(snapshot) for snapshot in snapshots])
+
+        restored = SessionSnapshot.from_dict(await DouyinSessionSnapshotStore().load())
+        self.assertIn(restored.to_dict(), snapshots)
+        self.assertEqual(os.listdir(self.tmp_dir.name), ["session_snapshot.json"])
+
+    async def test_accounts_use_cookies_saved_by_relogin(self):
+        snapshot = SessionSnapshot.create(make_storage_state(), "relogin_ua", ttl=3600)
+        await DouYinCrawler.get_account_session_store("a/1").save(snapshot.to_dict())
+
+        accounts = await DouYinCrawler().load_account_snapshots([
+            {"name": "a/1", "cookies": "sessionid=stale", "relogin_type": "phone", "phone": "13800000000"},
+            {"cookies": "sessionid=other"},
+        ])
+        self.assertEqual(accounts[0]["cookies"], "sessionid=abc;ttwid=xyz")
+        self.assertEqual(accounts[0]["user_agent"], "relogin_ua")
+        self.assertEqual(accounts[0]["relogin_type"], "phone")
+        self.assertEqual(accounts[1], {"cookies": "sessionid=other"})
+
+    async def test_expired_snapshot_is_removed(self):
+        snapshot = SessionSnapshot.create(make_storage_state(), "ua", ttl=3600)
+        snapshot.expires_at = time.time() - 1
+        await DouyinSessionSnapshotStore().save(snapshot.to_dict())
+
+        crawler = DouYinCrawler()
+        with mock.patch.object(config, "ENABLE_SESSION_SNAPSHOT", True):
+            self.assertIsNone(await crawler.load_session_snapshot())
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+
+    async def test_browser_pool_factory_does_not_touch_the_crawler(self):
+        await DouyinSessionSnapshotStore().save(
+            SessionSnapshot.create(make_storage_state(), "snapshot-ua", ttl=3600).to_dict()
+        )
+        crawler = DouYinCrawler()
+        crawler.init_config(platform="dy", login_type="cookie", crawler_type="detail")
+        launch = mock.AsyncMock(return_value=mock.AsyncMock())
+        with mock.patch.object(config, "ENABLE_SESSION_SNAPSHOT", True), \
+                mock.patch("media_platform.douyin.core.get_playwright", mock.AsyncMock()), \
+                mock.patch("media_platform.douyin.core.launch_browser_context", launch):
+            pool = crawler.get_browser_pool()
+            await pool.create_context()
+        # the pool outlives the crawler that created it, its contexts use the saved session
+        self.assertEqual(launch.call_args.args[2], "snapshot-ua")
+        self.assertIsNotNone(launch.call_args.kwargs["storage_state"])
+        self.assertEqual(crawler.user_agent, DEFAULT_USER_AGENT)
+        self.assertIsNone(crawler.session_snapshot)
+        await pool.close()
+
+    async def test_browserless_start_restores_snapshot(self):
+        await DouyinSessionSnapshotStore().save(
+            SessionSnapshot.create(make_storage_state(), "snapshot-ua", ttl=3600).to_dict()
+        )
+        crawler = DouYinCrawler()
+        crawler.init_config(platform="dy", login_type="cookie", crawler_type="detail")
+
+        def no_browser(*args, **kwargs):
+            raise AssertionError("browser should not be launched")
+
+        with mock.patch.object(config, "COOKIES", ""), \
+                mock.patch.object(config, "ENABLE_SESSION_SNAPSHOT", True), \
+                mock.patch.object(config, "ENABLE_BROWSERLESS_CRAWL", True), \
+                mock.patch.object(config, "ENABLE_IP_PROXY", False), \
+                mock.patch.object(config, "DY_SPECIFIED_ID_LIST", []), \
+                mock.patch("media_platform.douyin.core.get_browser_pool", no_browser):
+            await crawler.start()
+
+        self.assertEqual(crawler.dy_client.cookie_dict["sessionid"], "abc")
+        self.assertEqual(crawler.dy_client.headers["User-Agent"], "snapshot-ua")
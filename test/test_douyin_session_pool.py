@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+from typing import Dict, List
+from unittest import IsolatedAsyncioTestCase, mock
+
+import httpx
+
+import config
+from media_platform.douyin.client import DOUYINClient
+from media_platform.douyin.exception import SessionExpiredError
+from media_platform.douyin.rate_limiter import OUTCOME_BLOCKED, OUTCOME_ERROR, OUTCOME_OK, AdaptiveRateController
+from media_platform.douyin.retry import CircuitBreakerRegistry, RetryBudget, RetryPolicy
+from media_platform.douyin.session_pool import DouYinAccountSession, DouYinSessionPool, create_session_pool
+from media_platform.douyin.signer import DouYinNativeSigner
+
+DETAIL_URI = "/aweme/v1/web/aweme/detail/"
+
+
+def make_sessions(num: int) -> List[DouYinAccountSession]:
+    return [DouYinAccountSession(f"account_{i}", {"sessionid": f"sid_{i}"}) for i in range(num)]
+
+
+def create_pool(sessions: List[DouYinAccountSession], relogin=None, cooldown: float = 60) -> DouYinSessionPool:
+    return DouYinSessionPool(
+        sessions, relogin=relogin, cooldown_seconds=cooldown, max_cooldown_seconds=cooldown * 10,
+        max_strikes=2, max_consecutive_errors=2,
+    )
+
+
+class TestDouYinSessionPool(IsolatedAsyncioTestCase):
+    async def test_fair_scheduling(self):
+        pool = create_pool(make_sessions(3))
+        names = []
+        for _ in range(6):
+            session = await pool.acquire()
+            names.append(session.name)
+            pool.report(session, OUTCOME_OK)
+        self.assertEqual(names, ["account_0", "account_1", "account_2"] * 2)
+
+        # 并发的请求分散到不同的账号上
+        sessions = [await pool.acquire() for _ in range(3)]
+        self.assertEqual(len({session.name for session in sessions}), 3)
+
+    async def test_throttled_session_cools_down(self):
+        sessions = make_sessions(2)
+        pool = create_pool(sessions, cooldown=0.05)
+        session = await pool.acquire()
+        pool.report(session, OUTCOME_BLOCKED)
+        self.assertTrue(session.is_cooling_down())
+        self.assertEqual(pool.stats.cooldowns, 1)
+        for _ in range(3):
+            other = await pool.acquire()
+            self.assertIsNot(other, session)
+            pool.report(other, OUTCOME_OK)
+
+        # 连续失败的账号也会冷却，所有账号都在冷却时等待最早结束冷却的账号
+        for _ in range(2):
+            pool.report(await pool.acquire(), OUTCOME_ERROR)
+        self.assertFalse(any(s.is_available() for s in sessions))
+        start = time.monotonic()
+        self.assertIs(await pool.acquire(), session)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertGreater(pool.stats.waits, 0)
+
+    async def test_expired_session_relogin_in_background(self):
+        relogin_started = asyncio.Event()
+        relogin_done = asyncio.Event()
+
+        async def relogin(session: DouYinAccountSession) -> Dict[str, str]:
+            relogin_started.set()
+            await relogin_done.wait()
+            return {"sessionid": f"{session.name}_new"}
+
+        sessions = make_sessions(1)
+        sessions[0].relogin_type, sessions[0].login_phone = "phone", "13800000000"
+        pool = create_pool(sessions, relogin=relogin, cooldown=0.01)
+        session = await pool.acquire()
+        pool.report(session, OUTCOME_BLOCKED)
+        await asyncio.sleep(0.02)
+        pool.report(await pool.acquire(), OUTCOME_BLOCKED)
+        self.assertTrue(session.expired)
+
+        # 重新登录期间请求等待，登录完成后继续使用新的 cookies
+        waiter = asyncio.create_task(pool.acquire())
+        await relogin_started.wait()
+        self.assertFalse(waiter.done())
+        relogin_done.set()
+        self.assertIs(await asyncio.wait_for(waiter, 1), session)
+        self.assertEqual(session.cookie_dict["sessionid"], "account_0_new")
+        self.assertEqual(pool.stats.relogins, 1)
+        await pool.close()
+
+    async def test_session_without_real_login_goes_offline(self):
+        relogin_count = 0
+
+        async def relogin(session: DouYinAccountSession) -> Dict[str, str]:
+            nonlocal relogin_count
+            relogin_count += 1
+            return {"sessionid": "revived"}
+
+        # cookie 登录只会加回同样失效的 cookies，无界面浏览器里没有人扫码
+        sessions = make_sessions(3)
+        sessions[1].relogin_type = "cookie"
+        sessions[2].relogin_type = "qrcode"
+        pool = create_pool(sessions, relogin=relogin)
+        with mock.patch.object(config, "HEADLESS", True):
+            for session in sessions:
+                pool._expire(session)
+        await asyncio.sleep(0)
+        self.assertEqual(relogin_count, 0)
+        self.assertTrue(all(session.expired and session.relogin_task is None for session in sessions))
+        with self.assertRaises(SessionExpiredError):
+            await pool.acquire()
+
+        with mock.patch.object(config, "HEADLESS", False):
+            self.assertTrue(sessions[2].can_relogin)
+
+    async def test_all_sessions_expired(self):
+        pool = create_session_pool([{"name": "logged_out", "cookies": "ttwid=1"}])
+        with self.assertRaises(SessionExpiredError):
+            await pool.acquire()
+
+
+class AccountTransport:
+    """account_0 被风控，其余账号正常返回"""
+
+    def __init__(self):
+        self.cookies: List[str] = []
+        self.proxies: List = []
+
+    async def request(self, method: str, url: str, proxies=None, **kwargs) -> httpx.Response:
+        cookie = kwargs["headers"]["Cookie"]
+        self.cookies.append(cookie)
+        self.proxies.append(proxies)
+        if cookie == "sessionid=sid_0":
+            return httpx.Response(200, json={"status_code": 8, "status_msg": "need verify"})
+        return httpx.Response(200, json={"status_code": 0, "aweme_detail": {"aweme_id": "1"}})
+
+
+class TestDouYinClientSessionPool(IsolatedAsyncioTestCase):
+    async def test_switch_session_when_blocked(self):
+        sessions = make_sessions(3)
+        sessions[2].proxies = "http://127.0.0.1:8080"
+        pool = create_pool(sessions)
+        transport = AccountTransport()
+        client = DOUYINClient(
+            headers={"User-Agent": "Mozilla/5.0", "Cookie": ""},
+            playwright_page=None,
+            cookie_dict={},
+            signer=DouYinNativeSigner(),
+            transport=transport,  # type: ignore
+            rate_controller=AdaptiveRateController(enabled=False),
+            retry_policy=RetryPolicy(max_retries=0, base_delay=0, max_delay=0),
+            retry_budget=RetryBudget(ratio=0, min_retries=100),
+            circuit_breakers=CircuitBreakerRegistry(failure_threshold=100, recovery_timeout=60),
+            session_pool=pool,
+        )
+        results = [await client.get(DETAIL_URI, {"aweme_id": "1"}) for _ in range(4)]
+        self.assertTrue(all(res["status_code"] == 0 for res in results))
+        # 第一个请求被风控后换账号重试，之后 account_0 在冷却中，不再被选中
+        self.assertEqual(transport.cookies.count("sessionid=sid_0"), 1)
+        self.assertEqual(sessions[0].blocked, 1)
+        self.assertEqual(sessions[1].requests + sessions[2].requests, 4)
+        # 账号固定的代理只用在这个账号的请求上
+        for cookie, proxies in zip(transport.cookies, transport.proxies):
+            self.assertEqual(proxies, "http://127.0.0.1:8080" if cookie == "sessionid=sid_2" else None)
+        self.assertTrue(all(session.in_flight == 0 for session in sessions))
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+import sys
+from typing import Dict
+from unittest import TestCase
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 只在登录、滑块、浏览器里用到的重依赖，web 进程、定时任务和不启动浏览器的爬取都不应该加载
+HEAVY_MODULES = ("cv2", "numpy", "PIL", "playwright", "execjs")
+
+# 冷启动导入耗时的预算(秒)，留了足够的余量，超出说明又有重依赖在模块顶层被导入了
+IMPORT_TIME_BUDGETS = {
+    "tools.utils": 0.3,
+    "crawler.urls": 1.0,
+    "video.scheduler": 0.5,
+    "media_platform.douyin.core": 2.0,
+}
+
+
+def measure_import_time(statement: str) -> Dict[str, float]:
+    """
+    在新的解释器里用 python -X importtime 执行导入语句
+    :param statement:
+    :return: 模块名 -> 累计导入耗时(秒)
+    """
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE="crawler.settings")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    import_times: Dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        # import time:       self [us] |   cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        import_times.setdefault(name.strip(), int(cumulative) / 1e6)
+    return import_times
+
+
+class TestImportTime(TestCase):
+    def assert_lazy(self, import_times: Dict[str, float], entry: str):
+        loaded = [module for module in HEAVY_MODULES if module in import_times]
+        self.assertEqual(loaded, [], f"{entry} imports heavy modules at load")
+        budget = IMPORT_TIME_BUDGETS[entry]
+        self.assertLess(import_times[entry], budget, f"{entry} import time over budget {budget}s")
+
+    def test_utils(self):
+        self.assert_lazy(measure_import_time("import tools.utils"), "tools.utils")
+
+    def test_web_and_scheduler_entry_points(self):
+        import_times = measure_import_time("import django; django.setup(); import crawler.urls, video.scheduler")
+        self.assertNotIn("media_platform.douyin.core", import_times)
+        self.assert_lazy(import_times, "crawler.urls")
+        self.assert_lazy(import_times, "video.scheduler")
+
+    def test_browserless_crawler(self):
+        import_times = measure_import_time("import django; django.setup(); import media_platform.douyin.core")
+        self.assert_lazy(import_times, "media_platform.douyin.core")
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from unittest import IsolatedAsyncioTestCase
+
+from proxy import RedisDbIpCache
+from proxy.types import IpInfoModel
+
+TEST_BRAND = "TEST_PROXY_BRAND"
+
+
+def create_ip_info(no: int) -> IpInfoModel:
+    return IpInfoModel(ip=f"10.0.0.{no}", port=8000 + no, user="u", password="p", expired_time_ts=0)
+
+
+class TestRedisDbIpCache(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.ip_cache = RedisDbIpCache()
+        try:
+            await self.ip_cache.redis_client.ping()
+        except Exception as e:
+            self.skipTest(f"redis is not available: {e}")
+        await self.ip_cache.redis_client.delete(RedisDbIpCache.get_cache_key(TEST_BRAND))
+
+    async def asyncTearDown(self):
+        await self.ip_cache.redis_client.delete(RedisDbIpCache.get_cache_key(TEST_BRAND))
+        await self.ip_cache.redis_client.close()
+
+    async def test_load_and_prune_expired(self):
+        await self.ip_cache.set_ips(TEST_BRAND, [(create_ip_info(1), 60), (create_ip_info(2), -1)])
+        await self.ip_cache.set_ip(TEST_BRAND, create_ip_info(3), 120)
+        ip_infos = await self.ip_cache.load_all_ip(TEST_BRAND)
+        self.assertEqual(sorted(ip_info.ip for ip_info in ip_infos), ["10.0.0.1", "10.0.0.3"])
+        # 过期的 IP 已经在 redis 端删除
+        self.assertEqual(await self.ip_cache.redis_client.zcard(RedisDbIpCache.get_cache_key(TEST_BRAND)), 2)
@@ -2,9 +2,14 @@
 # @Author  : relakkes@gmail.com
 # @Time    : 2023/12/2 14:42
 # @Desc    :
+import asyncio
+import time
+from typing import List
 from unittest import IsolatedAsyncioTestCase
 
-from proxy.proxy_ip_pool import create_ip_pool
+from proxy.providers import FakeProxyProvider, FakeProxyValidator
+from proxy.providers.jishu_http_proxy import JiSuHttpProxy
+from proxy.proxy_ip_pool import ProxyIpPool, create_ip_pool, get_proxy_key
 from proxy.types import IpInfoModel
 
 
@@ -17,3 +22,133 @@ class TestIpPool(IsolatedAsyncioTestCase):
             print(ip_proxy_info)
             self.assertIsNotNone(ip_proxy_info.ip, msg="验证 ip 是否获取成功")
 
+
+
+class TestHealthScoredIpPool(IsolatedAsyncioTestCase):
+    def create_pool(self, ip_pool_count: int = 10, **kwargs) -> ProxyIpPool:
+        options = dict(validator=FakeProxyValidator(dead_ratio=0.2), validate_concurrency=10, refill_interval=60)
+        options.update(kwargs)
+        return ProxyIpPool(ip_pool_count, True, FakeProxyProvider(), **options)
+
+    async def asyncTearDown(self):
+        await self.pool.close()
+
+    async def test_concurrent_validation(self):
+        self.pool = self.create_pool(ip_pool_count=50, validate_concurrency=25)
+        start = time.monotonic()
+        await self.pool.load_proxies()
+        # 验证不通过的 IP 最多补充 3 轮
+        self.assertGreaterEqual(self.pool.healthy_count, 48)
+        # 延迟在 10ms~100ms 之间，串行验证 50 个以上的 IP 大约需要 2.5s
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertGreater(self.pool.stats.invalid, 0)
+
+    async def test_least_loaded_then_best_score(self):
+        self.pool = self.create_pool()
+        await self.pool.load_proxies()
+        best = max(self.pool.proxies.values(), key=lambda state: state.score)
+        self.assertEqual(get_proxy_key(await self.pool.acquire()), best.key)
+        keys = {get_proxy_key(await self.pool.acquire()) for _ in range(9)}
+        # 每个 IP 都有一个请求在用之前，不会重复分配同一个 IP
+        self.assertEqual(len(keys | {best.key}), 10)
+
+    async def test_quarantine_and_refill(self):
+        self.pool = self.create_pool(refill_threshold=1, quarantine_seconds=0)
+        await self.pool.load_proxies()
+        proxy = await self.pool.acquire()
+        for _ in range(3):
+            self.pool.release(proxy, success=False)
+        self.assertIn(get_proxy_key(proxy), self.pool.quarantine)
+        self.assertEqual(self.pool.healthy_count, 9)
+        # 隔离之后后台任务立即补充，隔离到期的 IP 重新验证后放回池子
+        await asyncio.sleep(0.3)
+        self.assertEqual(self.pool.healthy_count, 10)
+        self.assertEqual(self.pool.stats.reinstated, 1)
+
+    async def test_slow_proxy_is_quarantined(self):
+        self.pool = self.create_pool(max_latency=1)
+        await self.pool.load_proxies()
+        proxy = await self.pool.acquire()
+        for _ in range(5):
+            self.pool.release(proxy, success=True, latency=3)
+        self.assertIn(get_proxy_key(proxy), self.pool.quarantine)
+
+
+class TestExpiryAwareIpPool(IsolatedAsyncioTestCase):
+    def create_pool(self, provider: FakeProxyProvider, ip_pool_count: int = 10, **kwargs) -> ProxyIpPool:
+        options = dict(validator=FakeProxyValidator(dead_ratio=0), refill_interval=60, expire_buffer=30,
+                       prefetch_seconds=60)
+        options.update(kwargs)
+        return ProxyIpPool(ip_pool_count, True, provider, **options)
+
+    async def asyncTearDown(self):
+        await self.pool.close()
+
+    async def test_near_expiry_proxy_not_handed_out(self):
+        self.pool = self.create_pool(FakeProxyProvider(expire_seconds=600))
+        await self.pool.load_proxies()
+        expiring = next(iter(self.pool.proxies.values()))
+        expiring.proxy.expired_time_ts = int(time.time()) + 10
+        keys = {get_proxy_key(await self.pool.acquire()) for _ in range(20)}
+        self.assertNotIn(expiring.key, keys)
+        self.assertEqual(self.pool.stats.retired, 1)
+        self.assertGreater(self.pool.stats.wasted_ip_seconds, 0)
+
+    async def test_prefetch_in_provider_sized_batches(self):
+        provider = FakeProxyProvider(expire_seconds=600, max_ips_per_call=4)
+        self.pool = self.create_pool(provider)
+        await self.pool.load_proxies()
+        # 10 个 IP 按单次最多 4 个分 3 次提取
+        self.assertEqual(provider.api_calls, 3)
+        # 同一批里有 6 个 IP 即将下线，一次补充合并成 2 次提取，不是各自过期后再 6 次
+        for state in list(self.pool.proxies.values())[:6]:
+            state.proxy.expired_time_ts = int(time.time()) + 45
+        await self.pool.refill()
+        self.assertEqual(provider.api_calls, 5)
+        self.assertEqual(self.pool.healthy_count, 16)
+        # 已经有替换的情况下不会重复提取
+        await self.pool.refill()
+        self.assertEqual(provider.api_calls, 5)
+        self.assertEqual(self.pool.stats.provider_calls, 5)
+
+    async def test_short_lived_proxies_not_refetched(self):
+        provider = FakeProxyProvider(expire_seconds=80)
+        self.pool = self.create_pool(provider)
+        await self.pool.load_proxies()
+        await self.pool.refill()
+        self.assertEqual(provider.api_calls, 1)
+
+
+class MemoryIpCache:
+    def __init__(self, ip_infos: List[IpInfoModel]):
+        self.ip_infos = ip_infos
+
+    async def load_all_ip(self, proxy_brand_name: str) -> List[IpInfoModel]:
+        return list(self.ip_infos)
+
+
+class TestCachedProviderIpPool(IsolatedAsyncioTestCase):
+    async def test_new_pool_reuses_cached_proxies(self):
+        expired_time_ts = int(time.time()) + 1800
+        provider = JiSuHttpProxy(key="", crypto="", time_validity_period=30)
+        provider.ip_cache = MemoryIpCache([
+            IpInfoModel(ip=f"10.0.0.{i}", port=8000, user="u", password="p", expired_time_ts=expired_time_ts)
+            for i in range(5)
+        ])
+
+        # 调度器和同步任务每次运行都新建代理池，缓存里已经付过费、还没过期的 IP 要能继续使用，
+        # 缓存够用时不会调用代理商接口(这里没有网络，调用接口会失败)
+        for _ in range(3):
+            pool = ProxyIpPool(3, False, provider, refill_interval=60, expire_buffer=30, prefetch_seconds=60)
+            await pool.load_proxies()
+            self.assertEqual(pool.healthy_count, 3)
+            await pool.close()
+
+        # 同一个池子里拿过的 IP 不再重复拿
+        pool = ProxyIpPool(3, False, provider, refill_interval=60, expire_buffer=30, prefetch_seconds=60)
+        await pool.load_proxies()
+        pool.ip_pool_count = 5
+        await pool.refill()
+        self.assertEqual(pool.healthy_count, 5)
+        self.assertEqual(pool.stats.provider_calls, 2)
+        await pool.close()
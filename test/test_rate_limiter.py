@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+from unittest import IsolatedAsyncioTestCase
+
+from media_platform.douyin.rate_limiter import (OUTCOME_BLOCKED, OUTCOME_EMPTY, OUTCOME_ERROR, OUTCOME_OK,
+                                                AdaptiveRateController, TokenBucket, classify_response,
+                                                get_endpoint_name)
+
+
+def create_controller(**kwargs) -> AdaptiveRateController:
+    options = dict(
+        enabled=True, initial_rate=2, min_rate=0.5, max_rate=20, additive_increase=1, decrease_factor=0.5,
+        latency_threshold=1, failure_rate_threshold=0.2, decrease_cooldown=0,
+    )
+    options.update(kwargs)
+    return AdaptiveRateController(**options)
+
+
+class TestRateLimiter(IsolatedAsyncioTestCase):
+    async def test_token_bucket_pacing(self):
+        bucket = TokenBucket(rate=100)
+        start = time.monotonic()
+        # 桶里最多攒 1 秒的令牌，先把桶里的令牌用完
+        bucket._tokens = 0
+        await asyncio.gather(*[bucket.acquire() for _ in range(20)])
+        self.assertGreaterEqual(time.monotonic() - start, 0.18)
+
+    async def test_increase_when_healthy(self):
+        controller = create_controller()
+        for _ in range(100):
+            controller.record("detail", 0.1, OUTCOME_OK)
+        self.assertGreater(controller.get_rate("detail"), 10)
+        self.assertLessEqual(controller.get_rate("detail"), 20)
+        # 其他接口不受影响
+        self.assertEqual(controller.get_rate("comments"), 2)
+
+    async def test_decrease_on_failures_and_latency(self):
+        controller = create_controller(initial_rate=16)
+        controller.record("detail", 0.1, OUTCOME_ERROR)
+        controller.record("detail", 0.1, OUTCOME_BLOCKED)
+        self.assertEqual(controller.get_rate("detail"), 8)
+        for _ in range(20):
+            controller.record("detail", 0.1, OUTCOME_EMPTY)
+        self.assertEqual(controller.get_rate("detail"), 0.5)
+
+        controller = create_controller(initial_rate=16)
+        for _ in range(10):
+            controller.record("search", 5, OUTCOME_OK)
+        self.assertLess(controller.get_rate("search"), 16)
+
+    async def test_decrease_cooldown(self):
+        controller = create_controller(initial_rate=16, decrease_cooldown=60)
+        for _ in range(10):
+            controller.record("detail", 0.1, OUTCOME_ERROR)
+        self.assertEqual(controller.get_rate("detail"), 8)
+        self.assertEqual(controller.get_state("detail").decreases, 1)
+
+    async def test_disabled(self):
+        controller = create_controller(enabled=False, initial_rate=0.5)
+        start = time.monotonic()
+        for _ in range(10):
+            await controller.acquire("detail")
+            controller.record("detail", 0.1, OUTCOME_ERROR)
+        self.assertLess(time.monotonic() - start, 0.1)
+        self.assertEqual(controller.endpoints, {})
+
+    def test_classify(self):
+        self.assertEqual(get_endpoint_name("/aweme/v1/web/comment/list/reply/"), "comments")
+        self.assertEqual(classify_response({}), OUTCOME_EMPTY)
+        self.assertEqual(classify_response({"status_code": 8}), OUTCOME_BLOCKED)
+        self.assertEqual(classify_response({"status_code": 0, "aweme_detail": {}}), OUTCOME_OK)
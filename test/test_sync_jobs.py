@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+import time
+from typing import Dict, List, Optional
+from unittest import IsolatedAsyncioTestCase, mock
+
+from django.test import AsyncClient
+
+from media_platform.douyin.progress import CrawlProgress
+from video.job_store import MemorySyncJobStore
+from video.sync_jobs import (SYNC_JOB_FAILED, SYNC_JOB_FINISHED_STATUSES, SYNC_JOB_PARTIAL, SYNC_JOB_QUEUED,
+                             SYNC_JOB_SUCCEEDED, CelerySyncJobBroker, LocalSyncJobBroker, SyncJobService)
+
+
+class FakeCrawler:
+    """每个视频耗时 delay 秒，per_run 限制一次抓取的视频数，error 不为空时抓取失败"""
+
+    def __init__(self, delay: float = 0, per_run: int = 100, error: Optional[Exception] = None):
+        self.delay = delay
+        self.per_run = per_run
+        self.error = error
+        self.options: Dict = {}
+        self.progress = CrawlProgress()
+
+    def init_config(self, platform: str, login_type: str, crawler_type: str,
+                    aweme_ids: Optional[List[str]] = None, time_budget: Optional[float] = None,
+                    enable_comments: Optional[bool] = None):
+        self.options = {"time_budget": time_budget, "enable_comments": enable_comments}
+        self.progress = CrawlProgress(aweme_ids)
+
+    async def start(self):
+        if self.error is not None:
+            raise self.error
+        for aweme_id in self.progress.aweme_ids[:self.per_run]:
+            await asyncio.sleep(self.delay)
+            self.progress.fetched += 1
+            self.progress.completed_ids.add(aweme_id)
+
+    def get_unfinished_aweme_ids(self) -> List[str]:
+        return self.progress.get_unfinished_ids()
+
+
+def create_service(**kwargs) -> SyncJobService:
+    crawlers = []
+
+    def crawler_factory():
+        crawlers.append(FakeCrawler(**kwargs))
+        return crawlers[-1]
+
+    service = SyncJobService(
+        MemorySyncJobStore(), LocalSyncJobBroker(), crawler_factory=crawler_factory, progress_interval=0.01
+    )
+    service.crawlers = crawlers
+    return service
+
+
+async def wait_finished(service: SyncJobService, job_id: str, timeout: float = 5) -> Dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = await service.get(job_id)
+        if job["status"] in SYNC_JOB_FINISHED_STATUSES:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job {job_id} not finished in {timeout}s")
+
+
+class TestSyncJobService(IsolatedAsyncioTestCase):
+    async def test_submit_returns_immediately_and_reports_progress(self):
+        service = create_service(delay=0.02)
+        started_at = time.monotonic()
+        job, coalesced = await service.submit(["1", "2", "3", "4", "5"], {"enable_comments": False})
+        self.assertLess(time.monotonic() - started_at, 0.05)
+        self.assertFalse(coalesced)
+        self.assertEqual(job["status"], SYNC_JOB_QUEUED)
+        self.assertEqual(job["progress"]["total"], 5)
+
+        # 运行期间能查到中间进度
+        seen_completed = set()
+        while True:
+            current = await service.get(job["id"])
+            seen_completed.add(current["progress"]["completed"])
+            if current["status"] in SYNC_JOB_FINISHED_STATUSES:
+                break
+            await asyncio.sleep(0.005)
+        self.assertTrue(seen_completed - {0, 5}, "no intermediate progress reported")
+
+        self.assertEqual(current["status"], SYNC_JOB_SUCCEEDED)
+        self.assertEqual((current["progress"]["completed"], current["progress"]["fetched"]), (5, 5))
+        self.assertEqual(current["unfinished_aweme_ids"], [])
+        self.assertIsNotNone(current["finished_at"])
+        self.assertEqual(service.crawlers[0].options, {"time_budget": None, "enable_comments": False})
+
+    async def test_duplicate_submissions_are_coalesced(self):
+        service = create_service(delay=0.02)
+        job, _ = await service.submit(["1", "2", "3"])
+        duplicate, coalesced = await service.submit(["3", "2", "1", "1"])
+        self.assertTrue(coalesced)
+        self.assertEqual(duplicate["id"], job["id"])
+
+        # 选项不同的不合并
+        other, coalesced = await service.submit(["1", "2", "3"], {"time_budget": 10})
+        self.assertFalse(coalesced)
+        self.assertNotEqual(other["id"], job["id"])
+
+        await wait_finished(service, job["id"])
+        await wait_finished(service, other["id"])
+        self.assertEqual(len(service.crawlers), 2)
+
+        # 任务结束之后再提交会新建任务
+        again, coalesced = await service.submit(["1", "2", "3"])
+        self.assertFalse(coalesced)
+        self.assertNotEqual(again["id"], job["id"])
+        await wait_finished(service, again["id"])
+
+    async def test_partial_and_failed(self):
+        service = create_service(per_run=1)
+        job = await wait_finished(service, (await service.submit(["1", "2"]))[0]["id"])
+        self.assertEqual(job["status"], SYNC_JOB_PARTIAL)
+        self.assertEqual(job["unfinished_aweme_ids"], ["2"])
+
+        service = create_service(error=RuntimeError("account blocked"))
+        job = await wait_finished(service, (await service.submit(["1"]))[0]["id"])
+        self.assertEqual(job["status"], SYNC_JOB_FAILED)
+        self.assertEqual(job["error"], "account blocked")
+
+    async def test_celery_send_does_not_block_the_loop(self):
+        ticks = []
+
+        async def tick():
+            for _ in range(5):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        with mock.patch("video.tasks.run_sync_job.delay", side_effect=lambda job_id: time.sleep(0.1)) as delay:
+            started_at = time.monotonic()
+            await asyncio.gather(CelerySyncJobBroker().send(SyncJobService.run, "job"), tick())
+        delay.assert_called_once_with("job")
+        # 投递期间事件循环照常运行
+        self.assertLess(ticks[0] - started_at, 0.05)
+
+    async def test_failed_send_does_not_hold_the_coalesce_key(self):
+        service = create_service()
+        service.broker = mock.Mock(send=mock.AsyncMock(side_effect=ConnectionError("broker down")))
+        with self.assertRaises(ConnectionError):
+            await service.submit(["1"])
+        job_id = next(iter(service.job_store._jobs))
+        self.assertEqual((await service.get(job_id))["status"], SYNC_JOB_FAILED)
+
+        service.broker = LocalSyncJobBroker()
+        job, coalesced = await service.submit(["1"])
+        self.assertFalse(coalesced)
+        self.assertEqual((await wait_finished(service, job["id"]))["status"], SYNC_JOB_SUCCEEDED)
+
+    async def test_invalid_submission(self):
+        service = create_service()
+        for aweme_ids, options in [
+            ([], None), ("123", None), (["12a"], None), ([True], None),
+            (["1"], {"unknown": 1}), (["1"], {"time_budget": -1}), (["1"], {"enable_comments": "yes"}),
+        ]:
+            with self.assertRaises(ValueError):
+                await service.submit(aweme_ids, options)
+
+
+class TestMemorySyncJobStore(IsolatedAsyncioTestCase):
+    async def test_expired_jobs_take_their_coalesce_keys(self):
+        store = MemorySyncJobStore(ttl=60)
+        job, _ = await store.create({"id": "old", "finished_at": None}, "key")
+        # 结束了但是没有 release，比如写状态的时候进程出了问题
+        job["finished_at"] = time.time() - 120
+        await store.update(job)
+        await store.create({"id": "new", "finished_at": None}, "other_key")
+        self.assertIsNone(await store.get("old"))
+        self.assertEqual(store._coalesce, {"other_key": "new"})
+
+
+class TestSyncJobViews(IsolatedAsyncioTestCase):
+    async def test_submit_and_poll(self):
+        service = create_service()
+        client = AsyncClient()
+        with mock.patch("video.views.get_sync_job_service", lambda: service):
+            response = await client.post(
+                "/video/sync/", json.dumps({"aweme_ids": ["1", "2"]}), content_type="application/json"
+            )
+            self.assertEqual(response.status_code, 202)
+            job_id = response.json()["job_id"]
+            await wait_finished(service, job_id)
+
+            response = await client.get(f"/video/jobs/{job_id}/")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["data"]["progress"]["completed"], 2)
+
+            self.assertEqual((await client.get("/video/jobs/unknown/")).status_code, 404)
+            self.assertEqual((await client.get("/video/sync/")).status_code, 405)
+            response = await client.post("/video/sync/", "not json", content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+            response = await client.post(
+                "/video/sync/", json.dumps({"aweme_ids": []}), content_type="application/json"
+            )
+            self.assertEqual(response.status_code, 400)
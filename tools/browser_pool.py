@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+# @Desc    : 进程内共享的浏览器上下文池，多次爬取任务复用已经预热好的 BrowserContext 和页面
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from weakref import WeakKeyDictionary
+
+import config
+from tools import utils
+
+if TYPE_CHECKING:
+    from playwright.async_api import BrowserContext, Page, Playwright
+
+ContextFactory = Callable[[], Awaitable[Tuple["BrowserContext", "Page"]]]
+
+
+class PooledBrowserContext:
+    """池子里的一个浏览器上下文和它的页面，页面崩溃或者浏览器断开之后标记为不可用"""
+
+    def __init__(self, context: "BrowserContext", page: "Page"):
+        self.context = context
+        self.page = page
+        self.uses = 0
+        self.crashed = False
+        self.created_at = time.monotonic()
+        page.on("crash", self._on_crash)
+        context.on("close", self._on_crash)
+        if context.browser is not None:
+            context.browser.on("disconnected", self._on_crash)
+
+    def _on_crash(self, *_args) -> None:
+        self.crashed = True
+
+    def __repr__(self) -> str:
+        return f"PooledBrowserContext(uses={self.uses}, crashed={self.crashed})"
+
+
+class BrowserPoolStats:
+    """浏览器池的计数器"""
+
+    def __init__(self):
+        self.created = 0
+        self.reused = 0
+        self.recycled = 0
+        self.unhealthy = 0
+        self.create_seconds = 0.0
+
+    def __repr__(self) -> str:
+        return (
+            f"BrowserPoolStats(created={self.created}, reused={self.reused}, recycled={self.recycled}, "
+            f"unhealthy={self.unhealthy}, create_seconds={self.create_seconds:.2f})"
+        )
+
+
+class BrowserPool:
+    def __init__(
+            self,
+            create_context: ContextFactory,
+            size: Optional[int] = None,
+            max_uses: Optional[int] = None,
+            health_check_timeout: Optional[float] = None,
+    ):
+        """
+        浏览器上下文池：任务结束后上下文不关闭，放回池子给下一次任务使用，
+        拿出来之前做一次健康检查，用满 max_uses 次或者崩溃之后关闭重建，并在后台预热一个替换
+        Args:
+            create_context: 创建一个预热好(注入脚本、打开首页)的上下文和页面
+            size: 同时存在的上下文数量上限，默认取 config.BROWSER_POOL_SIZE
+            max_uses: 一个上下文最多被使用的次数，默认取 config.BROWSER_CONTEXT_MAX_USES
+            health_check_timeout: 健康检查的超时时间(秒)，默认取 config.BROWSER_HEALTH_CHECK_TIMEOUT
+        """
+        self.create_context = create_context
+        self.size = size or config.BROWSER_POOL_SIZE
+        self.max_uses = max_uses or config.BROWSER_CONTEXT_MAX_USES
+        self.health_check_timeout = health_check_timeout or config.BROWSER_HEALTH_CHECK_TIMEOUT
+        self.stats = BrowserPoolStats()
+        # 后放回去的先拿出来，最近用过的上下文最“热”
+        self._idle: List[PooledBrowserContext] = []
+        self._live = 0
+        self._semaphore = asyncio.Semaphore(self.size)
+        self._warm_task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    @property
+    def idle_count(self) -> int:
+        return len(self._idle)
+
+    async def _create(self) -> PooledBrowserContext:
+        self._live += 1
+        start = time.monotonic()
+        try:
+            context, page = await self.create_context()
+        except Exception:
+            self._live -= 1
+            raise
+        self.stats.created += 1
+        self.stats.create_seconds += time.monotonic() - start
+        return PooledBrowserContext(context, page)
+
+    async def _destroy(self, entry: PooledBrowserContext) -> None:
+        self._live -= 1
+        browser = entry.context.browser
+        try:
+            await entry.context.close()
+            # 非持久化的上下文是单独启动的浏览器创建的，一起关掉
+            if browser is not None:
+                await browser.close()
+        except Exception as e:
+            utils.logger.error(f"[BrowserPool._destroy] close browser context error: {e}")
+
+    async def is_healthy(self, entry: PooledBrowserContext) -> bool:
+        """
+        页面没有关闭、没有崩溃，并且能在超时时间内执行脚本
+        :param entry:
+        :return:
+        """
+        if entry.crashed or entry.page.is_closed():
+            return False
+        try:
+            await asyncio.wait_for(entry.page.evaluate("1"), timeout=self.health_check_timeout)
+        except Exception as e:
+            utils.logger.info(f"[BrowserPool.is_healthy] health check failed: {e}")
+            return False
+        return True
+
+    async def acquire(self) -> PooledBrowserContext:
+        """
+        取出一个健康的上下文，没有空闲的时候新建，达到数量上限时等待其他任务归还
+        :return:
+        """
+        if self._closed:
+            raise RuntimeError("[BrowserPool.acquire] browser pool is closed")
+        await self._semaphore.acquire()
+        try:
+            while self._idle:
+                entry = self._idle.pop()
+                if await self.is_healthy(entry):
+                    self.stats.reused += 1
+                    return entry
+                self.stats.unhealthy += 1
+                await self._destroy(entry)
+            return await self._create()
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+    async def release(self, entry: PooledBrowserContext, healthy: bool = True) -> None:
+        """
+        归还上下文，不健康或者用满次数的关闭掉，并在后台预热一个新的
+        :param entry:
+        :param healthy: 使用方是否认为这个上下文还能继续用
+        :return:
+        """
+        entry.uses += 1
+        try:
+            if self._closed or not healthy or entry.crashed or entry.uses >= self.max_uses:
+                self.stats.recycled += 1
+                await self._destroy(entry)
+                self._schedule_warm_up()
+            else:
+                self._idle.append(entry)
+        finally:
+            self._semaphore.release()
+
+    @asynccontextmanager
+    async def lease(self) -> AsyncIterator[PooledBrowserContext]:
+        """
+        async with pool.lease() as entry: 使用 entry.context / entry.page，出现异常时当作不健康的上下文回收
+        :return:
+        """
+        entry = await self.acquire()
+        healthy = True
+        try:
+            yield entry
+        except BaseException:
+            healthy = await self.is_healthy(entry)
+            raise
+        finally:
+            await self.release(entry, healthy)
+
+    def _schedule_warm_up(self) -> None:
+        if self._closed or (self._warm_task is not None and not self._warm_task.done()):
+            return
+        self._warm_task = asyncio.create_task(self.warm_up(1))
+
+    async def warm_up(self, num: Optional[int] = None) -> None:
+        """
+        预先创建空闲的上下文，任务开始时不用再等浏览器启动
+        :param num: 预热的数量，默认预热满整个池子
+        :return:
+        """
+        num = self.size if num is None else num
+        while not self._closed and num > 0 and self._live < self.size:
+            try:
+                self._idle.append(await self._create())
+            except Exception as e:
+                utils.logger.error(f"[BrowserPool.warm_up] create browser context error: {e}")
+                return
+            num -= 1
+
+    async def close(self) -> None:
+        """
+        关闭所有空闲的上下文，正在使用的上下文在归还时关闭
+        :return:
+        """
+        self._closed = True
+        if self._warm_task is not None and not self._warm_task.done():
+            self._warm_task.cancel()
+            await asyncio.gather(self._warm_task, return_exceptions=True)
+        idle, self._idle = self._idle, []
+        for entry in idle:
+            await self._destroy(entry)
+        utils.logger.info(f"[BrowserPool.close] {self.stats}")
+
+
+# playwright 对象绑定在创建它的事件循环上，所以池子按事件循环区分
+_playwrights: "WeakKeyDictionary[asyncio.AbstractEventLoop, Playwright]" = WeakKeyDictionary()
+_browser_pools: "WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, BrowserPool]]" = WeakKeyDictionary()
+
+
+async def get_playwright() -> "Playwright":
+    """当前事件循环共享的 playwright 实例"""
+    loop = asyncio.get_running_loop()
+    playwright = _playwrights.get(loop)
+    if playwright is None:
+        # 第一次启动浏览器时才导入 playwright，不需要浏览器的爬取任务不用为它付出导入时间
+        from playwright.async_api import async_playwright
+
+        playwright = await async_playwright().start()
+        _playwrights[loop] = playwright
+    return playwright
+
+
+def get_browser_pool(name: str, create_context: ContextFactory, size: Optional[int] = None) -> BrowserPool:
+    """
+    获取当前事件循环里名为 name 的浏览器池，第一次调用时创建
+    :param name: 池子名称，一般是平台名
+    :param create_context: 上下文工厂
+    :param size: 池子大小
+    :return:
+    """
+    pools = _browser_pools.setdefault(asyncio.get_running_loop(), {})
+    pool = pools.get(name)
+    if pool is None:
+        pool = BrowserPool(create_context, size=size)
+        pools[name] = pool
+    return pool
+
+
+async def close_browser_pools() -> None:
+    """关闭当前事件循环的所有浏览器池和 playwright 实例，进程退出前调用"""
+    loop = asyncio.get_running_loop()
+    for pool in _browser_pools.pop(loop, {}).values():
+        await pool.close()
+    playwright = _playwrights.pop(loop, None)
+    if playwright is not None:
+        await playwright.stop()
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# @Desc    : 进程内常驻的爬虫事件循环，定时任务和 Django 视图都把爬取任务提交到这里执行，
+#            这样浏览器池、签名进程这些绑定在事件循环上的资源可以跨任务复用
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, Coroutine, Optional
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def get_crawler_loop() -> asyncio.AbstractEventLoop:
+    """
+    获取常驻的爬虫事件循环，第一次调用时在后台线程中启动
+    :return:
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="crawler_loop", daemon=True).start()
+        return _loop
+
+
+def run_in_crawler_loop(coro: Coroutine[Any, Any, Any]) -> concurrent.futures.Future:
+    """
+    把协程提交到爬虫事件循环执行
+    同步代码里用 future.result() 等待结果，异步代码里用 await asyncio.wrap_future(future)
+    :param coro:
+    :return:
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_crawler_loop())
@@ -7,17 +7,19 @@ import base64
 import random
 import re
 from io import BytesIO
-from typing import Dict, List, Optional, Tuple
-
-import httpx
-from PIL import Image, ImageDraw
-from playwright.async_api import Cookie, Page
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
 from . import utils
 
+# httpx、PIL、playwright 只在登录时用到，放到函数里按需导入，只用日志和时间工具的模块不用为它们付出导入时间
+if TYPE_CHECKING:
+    from playwright.async_api import Cookie, Page
+
 
-async def find_login_qrcode(page: Page, selector: str) -> str:
+async def find_login_qrcode(page: "Page", selector: str) -> str:
     """find login qrcode image from target selector"""
+    import httpx
+
     try:
         elements = await page.wait_for_selector(
             selector=selector,
@@ -41,6 +43,8 @@ async def find_login_qrcode(page: Page, selector: str) -> str:
 
 def show_qrcode(qr_code) -> None:  # type: ignore
     """parse base64 encode qrcode image and show it"""
+    from PIL import Image, ImageDraw
+
     if "," in qr_code:
         qr_code = qr_code.split(",")[1]
     qr_code = base64.b64decode(qr_code)
@@ -95,7 +99,7 @@ def get_mobile_user_agent() -> str:
     return random.choice(ua_list)
 
 
-def convert_cookies(cookies: Optional[List[Cookie]]) -> Tuple[str, Dict]:
+def convert_cookies(cookies: Optional[List["Cookie"]]) -> Tuple[str, Dict]:
     if not cookies:
         return "", {}
     cookies_str = ";".join([f"{cookie.get('name')}={cookie.get('value')}" for cookie in cookies])
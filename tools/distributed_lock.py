@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# @Desc    : 跨进程、跨机器的互斥锁，保证同一个任务同一时刻只有一个实例在运行
+import asyncio
+import time
+import uuid
+from typing import Dict, Optional, Tuple
+
+from redis.asyncio import Redis
+
+import config
+from tools import utils
+
+# 只有持有者(token 一致)才能续期和释放，避免锁过期后被别人拿到又被自己删掉
+_EXTEND_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class RedisLock:
+    def __init__(self, key: str, ttl: float, redis_client: Optional[Redis] = None):
+        """
+        基于 redis SET NX PX 的锁，持有者崩溃之后锁在 ttl 之后自动过期，运行时间较长的任务需要定期 extend
+        Args:
+            key: 锁的名称
+            ttl: 锁的有效期(秒)
+            redis_client: 异步 redis 客户端，默认按 config 中的地址创建
+        """
+        self.key = key
+        self.ttl = ttl
+        self.redis_client = redis_client or Redis(host=config.REDIS_DB_HOST, password=config.REDIS_DB_PWD)
+        self.token = uuid.uuid4().hex
+
+    async def acquire(self) -> bool:
+        """
+        尝试加锁，不等待
+        :return: 是否拿到锁
+        """
+        return bool(await self.redis_client.set(self.key, self.token, nx=True, px=int(self.ttl * 1000)))
+
+    async def extend(self) -> bool:
+        """
+        续期到 ttl
+        :return: 锁是否还在自己手里
+        """
+        return bool(await self.redis_client.eval(_EXTEND_SCRIPT, 1, self.key, self.token, int(self.ttl * 1000)))
+
+    async def release(self) -> None:
+        await self.redis_client.eval(_RELEASE_SCRIPT, 1, self.key, self.token)
+
+
+class LocalLock:
+    # 进程内所有 LocalLock 共享的持有表: key -> (token, 过期时间)
+    _holders: Dict[str, Tuple[str, float]] = {}
+
+    def __init__(self, key: str, ttl: float):
+        """
+        和 RedisLock 接口一致的进程内锁，单进程部署和测试时使用
+        Args:
+            key: 锁的名称
+            ttl: 锁的有效期(秒)
+        """
+        self.key = key
+        self.ttl = ttl
+        self.token = uuid.uuid4().hex
+
+    def _is_held_by_self(self) -> bool:
+        holder = self._holders.get(self.key)
+        return holder is not None and holder[0] == self.token and holder[1] > time.monotonic()
+
+    async def acquire(self) -> bool:
+        holder = self._holders.get(self.key)
+        if holder is not None and holder[1] > time.monotonic():
+            return False
+        self._holders[self.key] = (self.token, time.monotonic() + self.ttl)
+        return True
+
+    async def extend(self) -> bool:
+        if not self._is_held_by_self():
+            return False
+        self._holders[self.key] = (self.token, time.monotonic() + self.ttl)
+        return True
+
+    async def release(self) -> None:
+        if self._is_held_by_self():
+            del self._holders[self.key]
+
+
+async def keep_lock_alive(lock, interval: Optional[float] = None) -> None:
+    """
+    在后台定期给锁续期，任务结束时取消这个协程；续期失败时返回，调用方需要据此停止持有锁的任务
+    :param lock: RedisLock | LocalLock
+    :param interval: 续期间隔(秒)，默认是有效期的三分之一
+    :return:
+    """
+    interval = interval or lock.ttl / 3
+    while True:
+        await asyncio.sleep(interval)
+        if not await lock.extend():
+            utils.logger.warning(f"[keep_lock_alive] lost lock {lock.key}")
+            return
@@ -6,9 +6,7 @@ import os
 from typing import List
 from urllib.parse import urlparse
 
-import cv2
-import httpx
-import numpy as np
+# OpenCV 和 numpy 导入很慢，只在识别滑块时用到，放到方法里按需导入
 
 
 class Slide:
@@ -34,6 +32,10 @@ class Slide:
     @staticmethod
     def check_is_img_path(img, img_type, resize):
         if img.startswith('http'):
+            import cv2
+            import httpx
+            import numpy as np
+
             headers = {
                 "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;"
                           "q=0.8,application/signed-exchange;v=b3;q=0.9",
@@ -63,6 +65,7 @@ class Slide:
     @staticmethod
     def clear_white(img):
         """清除图片的空白区域，这里主要清除滑块的空白"""
+        import cv2
         img = cv2.imread(img)
         rows, cols, channel = img.shape
         min_x = 255
@@ -86,6 +89,7 @@ class Slide:
         return img1
 
     def template_match(self, tpl, target):
+        import cv2
         th, tw = tpl.shape[:2]
         result = cv2.matchTemplate(target, tpl, cv2.TM_CCOEFF_NORMED)
         # 寻找矩阵(一维数组当作向量,用Mat定义) 中最小值和最大值的位置
@@ -104,10 +108,12 @@ class Slide:
 
     @staticmethod
     def image_edge_detection(img):
+        import cv2
         edges = cv2.Canny(img, 100, 200)
         return edges
 
     def discern(self):
+        import cv2
         img1 = self.clear_white(self.gap)
         img1 = cv2.cvtColor(img1, cv2.COLOR_RGB2GRAY)
         slide = self.image_edge_detection(img1)
@@ -0,0 +1,188 @@
+import copy
+import json
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from redis.asyncio import Redis
+
+import config
+
+
+class RedisCrawlJobStore:
+    def __init__(self, redis_client: Optional[Redis] = None, max_history: Optional[int] = None):
+        """
+        定时抓取任务的状态：上一次没抓完、要带到下一次的视频ID，以及最近若干次运行的记录
+        存在 redis 里，多个调度进程共享，进程重启之后继续
+        Args:
+            redis_client: 异步 redis 客户端，默认按 config 中的地址创建
+            max_history: 每个任务保留的运行记录条数，默认取 config.SCHEDULER_RUN_HISTORY
+        """
+        self.redis_client = redis_client or Redis(host=config.REDIS_DB_HOST, password=config.REDIS_DB_PWD)
+        self.max_history = max_history or config.SCHEDULER_RUN_HISTORY
+
+    @staticmethod
+    def get_pending_key(job_key: str) -> str:
+        return f"crawl_scheduler:{job_key}:pending"
+
+    @staticmethod
+    def get_runs_key(job_key: str) -> str:
+        return f"crawl_scheduler:{job_key}:runs"
+
+    async def get_pending(self, job_key: str) -> List[str]:
+        value = await self.redis_client.get(self.get_pending_key(job_key))
+        return json.loads(value) if value else []
+
+    async def set_pending(self, job_key: str, aweme_ids: List[str]) -> None:
+        if aweme_ids:
+            await self.redis_client.set(self.get_pending_key(job_key), json.dumps(aweme_ids))
+        else:
+            await self.redis_client.delete(self.get_pending_key(job_key))
+
+    async def add_run(self, job_key: str, run: Dict) -> None:
+        """
+        记录一次运行，只保留最近 max_history 条
+        :param job_key:
+        :param run:
+        :return:
+        """
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.lpush(self.get_runs_key(job_key), json.dumps(run))
+            pipe.ltrim(self.get_runs_key(job_key), 0, self.max_history - 1)
+            await pipe.execute()
+
+    async def get_runs(self, job_key: str, limit: int = 10) -> List[Dict]:
+        """最近的运行记录，新的在前"""
+        return [json.loads(item) for item in await self.redis_client.lrange(self.get_runs_key(job_key), 0, limit - 1)]
+
+
+class MemoryCrawlJobStore:
+    def __init__(self, max_history: Optional[int] = None):
+        """和 RedisCrawlJobStore 接口一致的进程内实现，单进程部署和测试时使用"""
+        self.max_history = max_history or config.SCHEDULER_RUN_HISTORY
+        self._pending: Dict[str, List[str]] = {}
+        self._runs: Dict[str, List[Dict]] = {}
+
+    async def get_pending(self, job_key: str) -> List[str]:
+        return list(self._pending.get(job_key, []))
+
+    async def set_pending(self, job_key: str, aweme_ids: List[str]) -> None:
+        self._pending[job_key] = list(aweme_ids)
+
+    async def add_run(self, job_key: str, run: Dict) -> None:
+        runs = self._runs.setdefault(job_key, [])
+        runs.insert(0, run)
+        del runs[self.max_history:]
+
+    async def get_runs(self, job_key: str, limit: int = 10) -> List[Dict]:
+        return self._runs.get(job_key, [])[:limit]
+
+
+# 只有任务自己才能释放合并键，避免任务结束前合并键已经过期并被新任务占用
+_RELEASE_COALESCE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class RedisSyncJobStore:
+    def __init__(self, redis_client: Optional[Redis] = None, ttl: Optional[int] = None):
+        """
+        同步接口提交的抓取任务：任务状态和进度，以及 合并键 -> 正在排队/运行的任务ID
+        存在 redis 里，web 进程和 celery worker 共享
+        Args:
+            redis_client: 异步 redis 客户端，默认按 config 中的地址创建
+            ttl: 任务状态的保留时间(秒)，默认取 config.SYNC_JOB_TTL
+        """
+        self.redis_client = redis_client or Redis(host=config.REDIS_DB_HOST, password=config.REDIS_DB_PWD)
+        self.ttl = ttl or config.SYNC_JOB_TTL
+
+    @staticmethod
+    def get_job_key(job_id: str) -> str:
+        return f"sync_job:{job_id}"
+
+    @staticmethod
+    def get_coalesce_key(coalesce_key: str) -> str:
+        return f"sync_job:coalesce:{coalesce_key}"
+
+    async def create(self, job: Dict, coalesce_key: str) -> Tuple[Dict, bool]:
+        """
+        保存新任务，相同合并键的任务还没结束时不创建，返回已有的任务
+        :param job:
+        :param coalesce_key:
+        :return: (任务, 是否新建)
+        """
+        # 先写任务再抢合并键，抢到合并键的任务一定已经可以查询到
+        await self.update(job)
+        while True:
+            if await self.redis_client.set(self.get_coalesce_key(coalesce_key), job["id"], nx=True, ex=self.ttl):
+                return job, True
+            existing_id = await self.redis_client.get(self.get_coalesce_key(coalesce_key))
+            existing = await self.get(existing_id.decode()) if existing_id else None
+            if existing is not None:
+                await self.redis_client.delete(self.get_job_key(job["id"]))
+                return existing, False
+            # 合并键指向的任务已经过期，删掉之后重新抢
+            if existing_id:
+                await self.redis_client.eval(
+                    _RELEASE_COALESCE_SCRIPT, 1, self.get_coalesce_key(coalesce_key), existing_id
+                )
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        value = await self.redis_client.get(self.get_job_key(job_id))
+        return json.loads(value) if value else None
+
+    async def update(self, job: Dict) -> None:
+        await self.redis_client.set(self.get_job_key(job["id"]), json.dumps(job), ex=self.ttl)
+
+    async def release(self, job: Dict, coalesce_key: str) -> None:
+        """任务结束，之后相同的提交会新建任务"""
+        await self.redis_client.eval(_RELEASE_COALESCE_SCRIPT, 1, self.get_coalesce_key(coalesce_key), job["id"])
+
+
+class MemorySyncJobStore:
+    def __init__(self, ttl: Optional[int] = None):
+        """
+        和 RedisSyncJobStore 接口一致的进程内实现，单进程部署和测试时使用
+        web 请求和爬虫事件循环在不同的线程里访问，所以用线程锁保护
+        Args:
+            ttl: 结束的任务保留的时间(秒)，默认取 config.SYNC_JOB_TTL
+        """
+        self.ttl = ttl or config.SYNC_JOB_TTL
+        self._jobs: Dict[str, Dict] = {}
+        self._coalesce: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def _remove_expired(self) -> None:
+        expire_before = time.time() - self.ttl
+        for job_id in [job_id for job_id, job in self._jobs.items() if (job["finished_at"] or time.time()) < expire_before]:
+            del self._jobs[job_id]
+        # 没有正常 release 的任务(比如投递失败)留下的合并记录跟着任务一起清掉
+        for coalesce_key in [key for key, job_id in self._coalesce.items() if job_id not in self._jobs]:
+            del self._coalesce[coalesce_key]
+
+    async def create(self, job: Dict, coalesce_key: str) -> Tuple[Dict, bool]:
+        with self._lock:
+            self._remove_expired()
+            existing_id = self._coalesce.get(coalesce_key)
+            if existing_id is not None and existing_id in self._jobs:
+                return copy.deepcopy(self._jobs[existing_id]), False
+            self._coalesce[coalesce_key] = job["id"]
+            self._jobs[job["id"]] = copy.deepcopy(job)
+            return job, True
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return copy.deepcopy(job) if job is not None else None
+
+    async def update(self, job: Dict) -> None:
+        with self._lock:
+            self._jobs[job["id"]] = copy.deepcopy(job)
+
+    async def release(self, job: Dict, coalesce_key: str) -> None:
+        with self._lock:
+            if self._coalesce.get(coalesce_key) == job["id"]:
+                del self._coalesce[coalesce_key]
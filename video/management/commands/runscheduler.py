@@ -0,0 +1,40 @@
+import asyncio
+import signal
+
+from django.core.management.base import BaseCommand
+
+from tools.browser_pool import close_browser_pools
+from video.scheduler import CrawlScheduler, get_default_jobs
+
+
+class Command(BaseCommand):
+    help = "Run the crawl scheduler daemon, one event loop and one warm crawler for all runs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--local", action="store_true",
+            help="keep locks and job state in process instead of redis, for a single scheduler process",
+        )
+        parser.add_argument("--once", action="store_true", help="run every job once and exit")
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(local=options["local"], once=options["once"]))
+
+    @staticmethod
+    async def run(local: bool, once: bool):
+        jobs = get_default_jobs()
+        scheduler = CrawlScheduler.create_local(jobs) if local else CrawlScheduler(jobs)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, scheduler.stop)
+        try:
+            if once:
+                for job in jobs:
+                    await scheduler.run_job(job)
+            else:
+                await scheduler.run_forever()
+        finally:
+            try:
+                await scheduler.close()
+            finally:
+                await close_browser_pools()
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.4 on 2026-10-18 18:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video', '0002_remove_videoinfo_id_alter_videoinfo_aweme_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VideoComment',
+            fields=[
+                ('comment_id', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('aweme_id', models.CharField(db_index=True, max_length=100)),
+                ('parent_comment_id', models.CharField(max_length=100)),
+                ('content', models.TextField()),
+                ('create_time', models.BigIntegerField()),
+                ('sub_comment_count', models.CharField(max_length=100)),
+                ('user_id', models.CharField(max_length=100)),
+                ('sec_uid', models.CharField(max_length=100)),
+                ('short_user_id', models.CharField(max_length=100)),
+                ('user_unique_id', models.CharField(max_length=100)),
+                ('user_signature', models.CharField(max_length=200)),
+                ('nickname', models.CharField(max_length=100)),
+                ('avatar', models.CharField(max_length=200)),
+                ('ip_location', models.CharField(max_length=100)),
+                ('last_modify_ts', models.BigIntegerField()),
+            ],
+        ),
+    ]
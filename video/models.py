@@ -22,3 +22,21 @@ class VideoInfo(models.Model):
     last_modify_ts = models.BigIntegerField()
     cover = models.CharField(max_length=200)
     aweme_url = models.CharField(max_length=200)
+
+
+class VideoComment(models.Model):
+    comment_id = models.CharField(max_length=100, primary_key=True)
+    aweme_id = models.CharField(max_length=100, db_index=True)
+    parent_comment_id = models.CharField(max_length=100)
+    content = models.TextField()
+    create_time = models.BigIntegerField()
+    sub_comment_count = models.CharField(max_length=100)
+    user_id = models.CharField(max_length=100)
+    sec_uid = models.CharField(max_length=100)
+    short_user_id = models.CharField(max_length=100)
+    user_unique_id = models.CharField(max_length=100)
+    user_signature = models.CharField(max_length=200)
+    nickname = models.CharField(max_length=100)
+    avatar = models.CharField(max_length=200)
+    ip_location = models.CharField(max_length=100)
+    last_modify_ts = models.BigIntegerField()
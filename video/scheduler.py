@@ -0,0 +1,240 @@
+import asyncio
+import time
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+import config
+from tools import utils
+from tools.distributed_lock import LocalLock, RedisLock, keep_lock_alive
+
+from .job_store import MemoryCrawlJobStore, RedisCrawlJobStore
+
+if TYPE_CHECKING:
+    from media_platform.douyin.client import DouYinClientResources
+    from media_platform.douyin.core import DouYinCrawler
+
+RUN_STATUS_OK = "ok"
+# 时间预算用完，剩下的视频带到下一次
+RUN_STATUS_PARTIAL = "partial"
+# 超过了预算加宽限时间，被强制取消
+RUN_STATUS_TIMEOUT = "timeout"
+RUN_STATUS_ERROR = "error"
+# 其他进程正在运行同一个任务
+RUN_STATUS_SKIPPED = "skipped"
+# 运行期间锁续期失败，锁可能已经被其他进程拿到，本次运行被取消
+RUN_STATUS_LOST_LOCK = "lost_lock"
+
+
+class CrawlJob:
+    def __init__(
+            self,
+            key: str,
+            interval: Optional[float] = None,
+            time_budget: Optional[float] = None,
+            grace_seconds: Optional[float] = None,
+            aweme_ids: Optional[Callable[[], List[str]]] = None,
+            platform: str = "dy",
+            login_type: str = "qrcode",
+            crawler_type: str = "detail",
+    ):
+        """
+        一个定时抓取任务
+        Args:
+            key: 任务标识，同一个 key 同一时刻只有一个实例在运行(跨进程)
+            interval: 两次运行的间隔(秒)，默认取 config.SCHEDULER_INTERVAL_SECONDS
+            time_budget: 一次运行的时间预算(秒)，用完之后不再开始新的视频，默认取 config.SCHEDULER_TIME_BUDGET_SECONDS
+            grace_seconds: 预算用完之后等待正在抓取的视频结束的时间，超过之后强制取消，默认取 config.SCHEDULER_GRACE_SECONDS
+            aweme_ids: 每次运行时获取要抓取的视频ID，默认取 config.DY_SPECIFIED_ID_LIST
+            platform:
+            login_type:
+            crawler_type:
+        """
+        self.key = key
+        self.interval = interval or config.SCHEDULER_INTERVAL_SECONDS
+        self.time_budget = time_budget or config.SCHEDULER_TIME_BUDGET_SECONDS
+        self.grace_seconds = config.SCHEDULER_GRACE_SECONDS if grace_seconds is None else grace_seconds
+        self.get_aweme_ids = aweme_ids or (lambda: list(config.DY_SPECIFIED_ID_LIST))
+        self.platform = platform
+        self.login_type = login_type
+        self.crawler_type = crawler_type
+        self.next_run_at = 0.0
+
+    @property
+    def lock_ttl(self) -> float:
+        return self.time_budget + self.grace_seconds + 60
+
+
+def get_default_jobs() -> List[CrawlJob]:
+    """默认只有一个任务：定时抓取 config.DY_SPECIFIED_ID_LIST"""
+    return [CrawlJob("douyin_specified")]
+
+
+def create_douyin_crawler() -> "DouYinCrawler":
+    # 爬虫依赖在第一次运行时才导入，调度进程启动时不用加载
+    from media_platform.douyin.core import DouYinCrawler
+
+    return DouYinCrawler()
+
+
+def create_douyin_client_resources() -> "DouYinClientResources":
+    from media_platform.douyin.client import DouYinClientResources
+
+    return DouYinClientResources()
+
+
+class CrawlScheduler:
+    def __init__(
+            self,
+            jobs: List[CrawlJob],
+            job_store=None,
+            lock_class=None,
+            crawler_factory: Callable[[], "DouYinCrawler"] = create_douyin_crawler,
+            client_resources_factory: Callable[[], "DouYinClientResources"] = create_douyin_client_resources,
+    ):
+        """
+        常驻的抓取调度器，替代每分钟新起一个事件循环和爬虫的 MyCronJob：
+        所有运行共用一个事件循环，每个任务复用同一个爬虫实例(浏览器池、登录会话保持热的)，
+        同一个任务加分布式锁，上一次没跑完时这一次直接跳过，不会堆积；
+        每次运行有时间预算，没抓完的视频优先放到下一次，每次运行的耗时和吞吐记录到 job_store
+        Args:
+            jobs: 任务列表
+            job_store: 任务状态存储，默认使用 redis
+            lock_class: 锁的实现 RedisLock | LocalLock，默认使用 RedisLock
+            crawler_factory: 创建爬虫实例
+            client_resources_factory: 创建所有运行共用的签名进程池、连接池和限速状态，在 close 时释放
+        """
+        self.jobs = jobs
+        self.job_store = job_store or RedisCrawlJobStore()
+        self.lock_class = lock_class or RedisLock
+        self.crawler_factory = crawler_factory
+        self.client_resources_factory = client_resources_factory
+        self._client_resources: Optional["DouYinClientResources"] = None
+        self._crawlers: Dict[str, "DouYinCrawler"] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._stopping = asyncio.Event()
+
+    @classmethod
+    def create_local(cls, jobs: List[CrawlJob], **kwargs) -> "CrawlScheduler":
+        """单进程部署：锁和任务状态都放在进程内"""
+        return cls(jobs, job_store=MemoryCrawlJobStore(), lock_class=LocalLock, **kwargs)
+
+    def get_crawler(self, job: CrawlJob) -> "DouYinCrawler":
+        crawler = self._crawlers.get(job.key)
+        if crawler is None:
+            crawler = self.crawler_factory()
+            if self._client_resources is None:
+                self._client_resources = self.client_resources_factory()
+            # 每次运行新建的客户端都使用这份资源，客户端关闭时不释放
+            crawler.client_resources = self._client_resources
+            self._crawlers[job.key] = crawler
+        return crawler
+
+    async def run_forever(self) -> None:
+        """
+        按间隔触发到期的任务，直到 stop 被调用
+        :return:
+        """
+        utils.logger.info(f"[CrawlScheduler.run_forever] scheduler started with jobs: {[job.key for job in self.jobs]}")
+        while not self._stopping.is_set():
+            now = time.monotonic()
+            for job in self.jobs:
+                if job.next_run_at > now:
+                    continue
+                # 固定频率触发，错过的触发点不补跑
+                job.next_run_at = now + job.interval
+                task = self._running.get(job.key)
+                if task is not None and not task.done():
+                    utils.logger.info(f"[CrawlScheduler.run_forever] job {job.key} is still running, skip this tick")
+                    continue
+                self._running[job.key] = asyncio.create_task(self.run_job(job))
+            timeout = max(min(job.next_run_at for job in self.jobs) - time.monotonic(), 0)
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        await asyncio.gather(*self._running.values(), return_exceptions=True)
+        utils.logger.info("[CrawlScheduler.run_forever] scheduler stopped ...")
+
+    async def close(self) -> None:
+        """调度进程退出时调用，释放所有运行共用的资源"""
+        client_resources, self._client_resources = self._client_resources, None
+        if client_resources is not None:
+            await client_resources.aclose()
+
+    def stop(self) -> None:
+        """不再触发新的运行，等正在运行的任务结束后 run_forever 返回"""
+        self._stopping.set()
+
+    async def run_job(self, job: CrawlJob) -> Dict:
+        """
+        运行一次任务：加锁 -> 上次没抓完的视频排在前面 -> 按时间预算抓取 -> 保存没抓完的视频和运行记录
+        运行期间锁续期失败时立即取消本次运行，不再保存没抓完的视频，避免和拿到锁的进程互相覆盖
+        :param job:
+        :return: 运行记录
+        """
+        lock = self.lock_class(f"crawl_scheduler:{job.key}:lock", job.lock_ttl)
+        if not await lock.acquire():
+            utils.logger.info(f"[CrawlScheduler.run_job] job {job.key} is running elsewhere, skip ...")
+            return {"job": job.key, "status": RUN_STATUS_SKIPPED, "started_at": time.time()}
+        started_at = time.time()
+        keep_alive_task = asyncio.create_task(keep_lock_alive(lock))
+        run_task = asyncio.create_task(self._run_locked(job))
+        try:
+            await asyncio.wait([run_task, keep_alive_task], return_when=asyncio.FIRST_COMPLETED)
+            if run_task.done():
+                return run_task.result()
+            # keep_lock_alive 只在续期失败(或者续期出错)时返回
+            error = repr(keep_alive_task.exception()) if keep_alive_task.exception() else ""
+            utils.logger.error(f"[CrawlScheduler.run_job] job {job.key} lost its lock, cancel the run ... {error}")
+            run_task.cancel()
+            await asyncio.gather(run_task, return_exceptions=True)
+            return {"job": job.key, "status": RUN_STATUS_LOST_LOCK, "error": error, "started_at": started_at}
+        finally:
+            for task in (run_task, keep_alive_task):
+                task.cancel()
+            await asyncio.gather(run_task, keep_alive_task, return_exceptions=True)
+            await lock.release()
+
+    async def _run_locked(self, job: CrawlJob) -> Dict:
+        carried_over = await self.job_store.get_pending(job.key)
+        carried_over_set = set(carried_over)
+        aweme_ids = carried_over + [aweme_id for aweme_id in job.get_aweme_ids() if aweme_id not in carried_over_set]
+
+        crawler = self.get_crawler(job)
+        crawler.init_config(
+            platform=job.platform,
+            login_type=job.login_type,
+            crawler_type=job.crawler_type,
+            aweme_ids=aweme_ids,
+            time_budget=job.time_budget,
+        )
+        status = RUN_STATUS_OK
+        error = ""
+        try:
+            await asyncio.wait_for(crawler.start(), job.time_budget + job.grace_seconds)
+        except asyncio.TimeoutError:
+            status = RUN_STATUS_TIMEOUT
+        except Exception as e:
+            status = RUN_STATUS_ERROR
+            error = str(e)
+            utils.logger.error(f"[CrawlScheduler._run_locked] job {job.key} failed: {e}")
+
+        progress = crawler.progress
+        progress.finish()
+        unfinished = crawler.get_unfinished_aweme_ids()
+        if status == RUN_STATUS_OK and unfinished:
+            status = RUN_STATUS_PARTIAL
+        await self.job_store.set_pending(job.key, unfinished)
+        run = {
+            "job": job.key,
+            "status": status,
+            "error": error,
+            "carried_over": len(carried_over),
+            "unfinished": len(unfinished),
+            **progress.to_dict(),
+        }
+        await self.job_store.add_run(job.key, run)
+        utils.logger.info(
+            f"[CrawlScheduler._run_locked] job {job.key} {status}, completed {progress.completed}/{progress.total} "
+            f"in {progress.duration:.1f}s ({progress.throughput:.2f}/s), {len(unfinished)} awemes carried over"
+        )
+        return run
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+# @Desc    : 同步接口提交的抓取任务：提交后立即返回任务ID，任务在后台执行，通过任务ID查询状态和进度
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+import weakref
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import config
+from tools import utils
+from tools.crawler_loop import run_in_crawler_loop
+
+from .job_store import MemorySyncJobStore, RedisSyncJobStore
+from .scheduler import create_douyin_crawler
+
+if TYPE_CHECKING:
+    from media_platform.douyin.core import DouYinCrawler
+
+SYNC_JOB_QUEUED = "queued"
+SYNC_JOB_RUNNING = "running"
+SYNC_JOB_SUCCEEDED = "succeeded"
+# 时间预算用完，还有视频没有抓完
+SYNC_JOB_PARTIAL = "partial"
+SYNC_JOB_FAILED = "failed"
+SYNC_JOB_FINISHED_STATUSES = (SYNC_JOB_SUCCEEDED, SYNC_JOB_PARTIAL, SYNC_JOB_FAILED)
+
+
+def normalize_aweme_ids(aweme_ids) -> List[str]:
+    """
+    校验并去重视频ID，保持提交的顺序
+    :param aweme_ids:
+    :return:
+    """
+    if not isinstance(aweme_ids, list) or not aweme_ids:
+        raise ValueError("aweme_ids must be a non-empty list")
+    if len(aweme_ids) > config.SYNC_JOB_MAX_AWEMES:
+        raise ValueError(f"at most {config.SYNC_JOB_MAX_AWEMES} aweme_ids per job")
+    normalized: List[str] = []
+    for aweme_id in aweme_ids:
+        if isinstance(aweme_id, bool) or not isinstance(aweme_id, (str, int)) or not str(aweme_id).isdigit():
+            raise ValueError(f"invalid aweme_id: {aweme_id!r}")
+        if str(aweme_id) not in normalized:
+            normalized.append(str(aweme_id))
+    return normalized
+
+
+def normalize_options(options) -> Dict:
+    """
+    校验任务选项
+    time_budget: 时间预算(秒)，用完之后不再开始新的视频
+    enable_comments: 是否抓取评论，默认取 config.ENABLE_GET_COMMENTS
+    :param options:
+    :return:
+    """
+    options = options or {}
+    if not isinstance(options, dict):
+        raise ValueError("options must be an object")
+    unknown = set(options) - {"time_budget", "enable_comments"}
+    if unknown:
+        raise ValueError(f"unknown options: {sorted(unknown)}")
+    normalized = {}
+    time_budget = options.get("time_budget")
+    if time_budget is not None:
+        if isinstance(time_budget, bool) or not isinstance(time_budget, (int, float)) or time_budget <= 0:
+            raise ValueError("time_budget must be a positive number")
+        normalized["time_budget"] = time_budget
+    enable_comments = options.get("enable_comments")
+    if enable_comments is not None:
+        if not isinstance(enable_comments, bool):
+            raise ValueError("enable_comments must be a boolean")
+        normalized["enable_comments"] = enable_comments
+    return normalized
+
+
+def get_coalesce_key(aweme_ids: List[str], options: Dict) -> str:
+    """视频ID集合和选项都相同的提交合并到同一个任务"""
+    content = json.dumps([sorted(aweme_ids), options], sort_keys=True)
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+class LocalSyncJobBroker:
+    def __init__(self, concurrency: int = 1):
+        """
+        在进程内的爬虫事件循环里执行任务，不需要 celery worker，单进程部署和测试时使用
+        抖音的存储是进程内共享的，默认同一时刻只运行一个任务，其余的排队
+        Args:
+            concurrency: 同时运行的任务数
+        """
+        self.concurrency = concurrency
+        # 在爬虫事件循环里第一次运行任务时创建
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def send(self, run: Callable[[str], Awaitable[None]], job_id: str) -> None:
+        run_in_crawler_loop(self._run(run, job_id))
+
+    async def _run(self, run: Callable[[str], Awaitable[None]], job_id: str) -> None:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            await run(job_id)
+
+
+class CelerySyncJobBroker:
+    """投递给 celery worker 执行，任务状态需要放在 redis 里共享"""
+
+    async def send(self, run: Callable[[str], Awaitable[None]], job_id: str) -> None:
+        from video.tasks import run_sync_job
+
+        # delay 同步连接 broker 发送消息，放到线程里执行，不阻塞 web 事件循环
+        await asyncio.to_thread(run_sync_job.delay, job_id)
+
+
+class SyncJobService:
+    def __init__(
+            self,
+            job_store,
+            broker,
+            crawler_factory: Callable[[], "DouYinCrawler"] = create_douyin_crawler,
+            progress_interval: Optional[float] = None,
+    ):
+        """
+        Args:
+            job_store: 任务状态存储 RedisSyncJobStore | MemorySyncJobStore
+            broker: 任务的执行方式 CelerySyncJobBroker | LocalSyncJobBroker
+            crawler_factory: 创建爬虫实例
+            progress_interval: 运行时把抓取进度写回任务状态的间隔(秒)，默认取 config.SYNC_JOB_PROGRESS_INTERVAL
+        """
+        self.job_store = job_store
+        self.broker = broker
+        self.crawler_factory = crawler_factory
+        self.progress_interval = progress_interval or config.SYNC_JOB_PROGRESS_INTERVAL
+
+    async def submit(self, aweme_ids, options=None) -> Tuple[Dict, bool]:
+        """
+        提交任务，不等待执行，相同的视频ID和选项已经有任务在排队或运行时直接返回那个任务
+        :param aweme_ids: 要抓取的视频ID，替代 config.DY_SPECIFIED_ID_LIST
+        :param options: 见 normalize_options
+        :return: (任务, 是否合并到了已有的任务)
+        """
+        aweme_ids = normalize_aweme_ids(aweme_ids)
+        options = normalize_options(options)
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": SYNC_JOB_QUEUED,
+            "aweme_ids": aweme_ids,
+            "options": options,
+            "coalesce_key": get_coalesce_key(aweme_ids, options),
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            # 和 CrawlProgress.to_dict 的字段一致，这里不导入爬虫模块
+            "progress": {
+                "total": len(aweme_ids), "completed": 0, "fetched": 0, "failed": 0, "stored": 0, "comments": 0,
+                "started_at": None, "finished_at": None, "duration": 0.0, "throughput": 0.0,
+            },
+            "unfinished_aweme_ids": aweme_ids,
+            "error": "",
+        }
+        job, created = await self.job_store.create(job, job["coalesce_key"])
+        if created:
+            utils.logger.info(f"[SyncJobService.submit] job {job['id']} queued with {len(aweme_ids)} awemes")
+            try:
+                await self.broker.send(self.run, job["id"])
+            except Exception as e:
+                # 投递失败的任务不会再执行，结束掉，不让后面相同的提交合并到它上面
+                utils.logger.error(f"[SyncJobService.submit] send job {job['id']} failed: {e!r}")
+                job["status"] = SYNC_JOB_FAILED
+                job["error"] = str(e) or e.__class__.__name__
+                job["finished_at"] = time.time()
+                await self.job_store.update(job)
+                await self.job_store.release(job, job["coalesce_key"])
+                raise
+        else:
+            utils.logger.info(f"[SyncJobService.submit] coalesced into job {job['id']} ({job['status']})")
+        return job, not created
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        return await self.job_store.get(job_id)
+
+    async def run(self, job_id: str) -> None:
+        """
+        执行任务，由 broker 调用，运行期间定期把抓取进度写回任务状态
+        :param job_id:
+        :return:
+        """
+        job = await self.job_store.get(job_id)
+        if job is None or job["status"] != SYNC_JOB_QUEUED:
+            utils.logger.warning(f"[SyncJobService.run] job {job_id} not found or already started, skip ...")
+            return
+        job["status"] = SYNC_JOB_RUNNING
+        job["started_at"] = time.time()
+        await self.job_store.update(job)
+
+        options = job["options"]
+        crawler: Optional["DouYinCrawler"] = None
+        crawl_task: Optional[asyncio.Task] = None
+        try:
+            crawler = self.crawler_factory()
+            crawler.init_config(
+                platform="dy",
+                login_type="qrcode",
+                crawler_type="detail",
+                aweme_ids=job["aweme_ids"],
+                time_budget=options.get("time_budget"),
+                enable_comments=options.get("enable_comments"),
+            )
+            crawl_task = asyncio.create_task(crawler.start())
+            timeout = options["time_budget"] + config.SCHEDULER_GRACE_SECONDS if "time_budget" in options else None
+            deadline = time.monotonic() + timeout if timeout else None
+            while True:
+                wait = self.progress_interval
+                if deadline is not None:
+                    wait = max(min(wait, deadline - time.monotonic()), 0)
+                done, _ = await asyncio.wait([crawl_task], timeout=wait)
+                if done:
+                    break
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise asyncio.TimeoutError(f"crawl did not finish within {timeout}s")
+                job["progress"] = crawler.progress.to_dict()
+                await self.job_store.update(job)
+            crawl_task.result()
+            unfinished = crawler.get_unfinished_aweme_ids()
+            job["status"] = SYNC_JOB_PARTIAL if unfinished else SYNC_JOB_SUCCEEDED
+        except Exception as e:
+            utils.logger.error(f"[SyncJobService.run] job {job_id} failed: {e!r}")
+            job["status"] = SYNC_JOB_FAILED
+            job["error"] = str(e) or e.__class__.__name__
+        finally:
+            if crawl_task is not None and not crawl_task.done():
+                crawl_task.cancel()
+                await asyncio.gather(crawl_task, return_exceptions=True)
+            if crawler is not None:
+                crawler.progress.finish()
+                job["progress"] = crawler.progress.to_dict()
+                job["unfinished_aweme_ids"] = crawler.get_unfinished_aweme_ids()
+            job["finished_at"] = time.time()
+            if job["status"] == SYNC_JOB_RUNNING:
+                # 被取消
+                job["status"] = SYNC_JOB_FAILED
+            await self.job_store.update(job)
+            await self.job_store.release(job, job["coalesce_key"])
+        utils.logger.info(f"[SyncJobService.run] job {job_id} {job['status']}, progress: {job['progress']}")
+
+
+_local_service: Optional[SyncJobService] = None
+_celery_services: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, SyncJobService]" = weakref.WeakKeyDictionary()
+
+
+def get_sync_job_service() -> SyncJobService:
+    """
+    按 config.SYNC_JOB_BROKER 创建任务服务
+    local: 进程内共享一个服务，任务状态放在内存里
+    celery: redis 客户端绑定在事件循环上，每个事件循环一个服务
+    :return:
+    """
+    global _local_service
+    if config.SYNC_JOB_BROKER == "celery":
+        loop = asyncio.get_running_loop()
+        service = _celery_services.get(loop)
+        if service is None:
+            service = SyncJobService(RedisSyncJobStore(), CelerySyncJobBroker())
+            _celery_services[loop] = service
+        return service
+    if _local_service is None:
+        _local_service = SyncJobService(MemorySyncJobStore(), LocalSyncJobBroker())
+    return _local_service
@@ -0,0 +1,19 @@
+from celery import shared_task
+
+from tools.crawler_loop import run_in_crawler_loop
+
+
+@shared_task(name="video.run_sync_job")
+def run_sync_job(job_id: str) -> None:
+    """
+    celery worker 执行同步接口提交的抓取任务
+    和 web 进程的 local 模式一样在常驻的爬虫事件循环里运行，浏览器池和登录会话可以跨任务复用
+    :param job_id:
+    :return:
+    """
+    from video.sync_jobs import get_sync_job_service
+
+    async def run():
+        await get_sync_job_service().run(job_id)
+
+    run_in_crawler_loop(run()).result()
@@ -1,9 +1,10 @@
 from django.contrib import admin
 from django.urls import path
 
-from video.views import getVideos, syncVideos
+from video.views import getJob, getVideos, syncVideos
 
 urlpatterns = [
     path("videos/", getVideos),
     path("sync/", syncVideos),
+    path("jobs/<str:job_id>/", getJob),
 ]
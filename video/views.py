@@ -1,8 +1,9 @@
 import json
 from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
 
-from media_platform.douyin.core import DouYinCrawler
 from video.models import VideoInfo
+from video.sync_jobs import get_sync_job_service
 from django.core.serializers import serialize
 
 
@@ -11,16 +12,30 @@ async def getVideos(request):
     return JsonResponse({"data": json.loads(serialize("json", videos))})
 
 
+@csrf_exempt
 async def syncVideos(request):
+    """
+    提交同步任务，不等待抓取完成，立即返回任务ID，通过 getJob 查询进度
+    请求体: {"aweme_ids": ["..."], "options": {"time_budget": 60, "enable_comments": false}}
+    相同的视频ID和选项已经有任务在排队或运行时，合并到那个任务
+    """
+    if request.method != "POST":
+        return JsonResponse({"status": False, "error": "method not allowed"}, status=405)
     try:
-        crawler = DouYinCrawler()
-        crawler.init_config(
-            platform="dy",
-            login_type="qrcode",
-            crawler_type="detail",
-        )
-        await crawler.start()
-        return JsonResponse({"status": True})
-    except Exception as e:
-        print(e)
-        return JsonResponse({"status": False})
+        body = json.loads(request.body or b"{}")
+        if not isinstance(body, dict):
+            raise ValueError("request body must be an object")
+        job, coalesced = await get_sync_job_service().submit(body.get("aweme_ids"), body.get("options"))
+    except ValueError as e:
+        return JsonResponse({"status": False, "error": str(e)}, status=400)
+    return JsonResponse(
+        {"status": True, "job_id": job["id"], "job_status": job["status"], "coalesced": coalesced},
+        status=202,
+    )
+
+
+async def getJob(request, job_id):
+    job = await get_sync_job_service().get(job_id)
+    if job is None:
+        return JsonResponse({"status": False, "error": "job not found"}, status=404)
+    return JsonResponse({"status": True, "data": job})